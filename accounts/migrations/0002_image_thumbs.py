@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='photo_thumbs',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
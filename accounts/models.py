@@ -6,6 +6,7 @@ class Profile(models.Model):
     full_name = models.CharField(max_length=150)
     phone = models.CharField(max_length=30, blank=True, null=True)
     photo = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    photo_thumbs = models.JSONField(default=dict, blank=True, editable=False)  # see library.images
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
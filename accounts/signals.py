@@ -1,9 +1,21 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from core.cache import touch_on_commit
+from library import images
 from .models import Profile
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance, full_name=instance.username)
+
+@receiver(post_save, sender=Profile)
+def touch_reviewer_version(sender, instance, created, **kwargs):
+    # book pages show reviewers' full names (library.views book_detail)
+    if not created:
+        touch_on_commit('auth.user')
+
+@receiver(post_save, sender=Profile)
+def build_profile_thumbnails(sender, instance, **kwargs):
+    images.schedule(instance, 'photo')
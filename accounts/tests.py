@@ -1,3 +1,63 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+LOCMEM = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'accounts-tests-{alias}'}
+    for alias in ('default', 'fragments')
+}
+
+
+@override_settings(CACHES=LOCMEM)
+class AccountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', email='reader@example.com', password='secret-pass-123')
+
+    def test_register_creates_profile(self):
+        response = self.client.post(reverse('register'), {
+            'username': 'newcomer', 'email': 'New@Example.com', 'full_name': 'New Comer',
+            'password': 'a-long-passphrase-42', 'confirm_password': 'a-long-passphrase-42',
+        })
+        self.assertRedirects(response, reverse('login'))
+        user = User.objects.get(username='newcomer')
+        self.assertEqual(user.email, 'new@example.com')
+        self.assertEqual(user.profile.full_name, 'New Comer')
+
+    def test_register_rejects_taken_email(self):
+        response = self.client.post(reverse('register'), {
+            'username': 'someone', 'email': 'READER@example.com', 'full_name': 'Someone',
+            'password': 'a-long-passphrase-42', 'confirm_password': 'a-long-passphrase-42',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('email', response.context['form'].errors)
+
+    def test_login_by_username_or_email(self):
+        for identifier in ('reader', 'reader@example.com'):
+            response = self.client.post(reverse('login'), {'username': identifier, 'password': 'secret-pass-123'})
+            self.assertRedirects(response, reverse('home'))
+            self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+            self.client.logout()
+
+    def test_login_failure(self):
+        response = self.client.post(reverse('login'), {'username': 'reader', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_logout(self):
+        self.client.force_login(self.user)
+        self.assertRedirects(self.client.post(reverse('logout')), reverse('home'))
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_profile(self):
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('profile')), 'reader')
+
+        response = self.client.post(reverse('profile_edit'), {
+            'full_name': 'Avid Reader', 'phone': '555-0100', 'email': 'avid@example.com',
+        })
+        self.assertRedirects(response, reverse('profile'))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.profile.full_name, self.user.email), ('Avid Reader', 'avid@example.com'))
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,6 +42,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.middleware.QueryProfileMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -53,10 +56,18 @@ ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that reports page render time to QueryProfileMiddleware when it is on
+        "BACKEND": "core.profiling.ProfiledDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # compiled templates are kept per process; with WARMUP_ON_STARTUP they are all
+            # compiled before gunicorn forks (Django drops the cache on file changes under runserver)
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ],
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
@@ -75,10 +86,78 @@ DATABASES = {
     "default": dj_database_url.config(
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
         conn_max_age=600,
+        conn_health_checks=True,  # a connection dropped while idle is replaced instead of failing the request
         ssl_require=False,
     )
 }
 
+# Which kind of process this is (set in Procfile.txt); picks the connection pool size below
+PROCESS_TYPE = os.environ.get("PROCESS_TYPE", "web")
+# (min, max) pooled Postgres connections per process. A sync gunicorn worker runs one request
+# at a time, so it needs one connection plus headroom; the notify worker is single-threaded.
+# Keep workers * max under the server's connection limit. DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE override.
+DB_POOL_SIZES = {
+    "web": (1, 2),
+    "worker": (1, 1),
+}
+
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    if os.environ.get("DB_POOL", "True") == "True":
+        min_size, max_size = DB_POOL_SIZES.get(PROCESS_TYPE, DB_POOL_SIZES["web"])
+        # connections go back to the pool at the end of each request instead of being kept by
+        # the request thread, so CONN_MAX_AGE has to be 0; health checks now happen on checkout
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", min_size)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", max_size)),
+            "timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),  # seconds to wait for a free connection
+            "max_idle": 300,
+            "max_lifetime": 1800,
+        }
+
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # take the write lock at BEGIN so concurrent borrow/return transactions queue up
+    # (for up to `timeout` seconds) instead of failing with "database is locked"
+    DATABASES["default"].setdefault("OPTIONS", {}).update({
+        "transaction_mode": "IMMEDIATE",
+        "timeout": 20,
+    })
+    # a file, not the shared in-memory database, so threaded tests (library.tests.ConcurrentBorrowTests)
+    # wait on the write lock like the real one instead of failing with "database table is locked".
+    # Per process, so two runs (or one left over from a killed run) don't stop at the "delete?" prompt
+    DATABASES["default"]["TEST"] = {
+        "NAME": os.path.join(tempfile.gettempdir(), f"elibrary-test-{os.getpid()}.sqlite3"),
+    }
+    if os.environ.get("SQLITE_WAL", "False") == "True":
+        # single-node mode: readers no longer wait for the writer, commits skip the fsync of
+        # the main file (still durable against app crashes), bigger page cache and mmap reads
+        DATABASES["default"]["OPTIONS"]["init_command"] = (
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            "PRAGMA temp_store=MEMORY;"
+            "PRAGMA cache_size=-32000;"
+            "PRAGMA mmap_size=268435456;"
+        )
+
+# Cache
+# File-based by default so every gunicorn worker on a host shares (and invalidates) the same
+# entries; point CACHE_BACKEND at Redis/Memcached when running on several hosts.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "elibrary-cache")),
+        "TIMEOUT": 24 * 60 * 60,
+    },
+    # rendered book cards (library.cards): keys are content-addressed and never go stale, so a
+    # per-process cache is safe and avoids a file read per card
+    "fragments": {
+        "BACKEND": os.environ.get("FRAGMENT_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("FRAGMENT_CACHE_LOCATION", "book-cards"),
+        "TIMEOUT": 24 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -98,12 +177,90 @@ LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "home"
 
+# Sessions (SESSION_MODE):
+# - "cached_db" (default): reads come from the cache, writes go through to the DB, so only
+#   login / logout touch django_session
+# - "signed_cookies": no server-side state at all, but a logout can't revoke a copied cookie
+# - "db": Django's default, one django_session query per authenticated request
+# Expired DB rows are removed in small batches by `manage.py purge_sessions` (run it daily).
+SESSION_MODE = os.environ.get("SESSION_MODE", "cached_db")
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}[SESSION_MODE]
+# flash messages live in their own signed cookie and never fall back to the session
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
+
 # Static files
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 STATICFILES_DIRS = [BASE_DIR / "static"]
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# STATICFILES_STORAGE is no longer read by Django; the storage has to be configured here
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "core.storage.StaticFilesStorage",  # whitenoise's compressed manifest storage
+    },
+}
 
 # Media files
 MEDIA_URL = "/media/"
-MEDIA_ROOT = BASE_DIR / "media"
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / "media"
+
+# Visit log (core.middleware.VisitLogMiddleware -> core.visitlog.VisitLogWriter)
+# Lines are buffered in-process and appended by a background thread in batches. The log is
+# runtime data: it lives outside the checkout, and `manage.py test` doesn't write it at all.
+VISIT_LOG_ENABLED = os.environ.get("VISIT_LOG_ENABLED", "True") == "True" and sys.argv[1:2] != ["test"]
+VISIT_LOG_PATH = os.environ.get("VISIT_LOG_PATH", os.path.join(tempfile.gettempdir(), "elibrary-visits.log"))
+VISIT_LOG_MAX_BYTES = int(os.environ.get("VISIT_LOG_MAX_BYTES", 50 * 1024 * 1024))  # 0 disables size rotation
+VISIT_LOG_ROTATE_DAILY = os.environ.get("VISIT_LOG_ROTATE_DAILY", "False") == "True"
+VISIT_LOG_BATCH_SIZE = 256
+VISIT_LOG_FLUSH_INTERVAL = 1.0  # seconds
+
+# Query profiling (core.middleware.QueryProfileMiddleware, staff view at /dashboard/queries/)
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", str(DEBUG)) == "True"
+PROFILING_BUFFER_SIZE = 500
+# max SQL queries per request, by URL name (session + user lookups included)
+QUERY_BUDGETS = {
+    "home": 7,
+    "books": 6,
+    "book_detail": 6,
+    "categories": 4,
+    "category_books": 5,
+    "authors": 4,
+    "author_detail": 5,
+    "my_books": 5,
+}
+# raise QueryBudgetExceeded instead of logging a warning (enable in tests / CI)
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT", "False") == "True"
+
+# Email (due-soon / overdue notices, see library.notifications and `notify_due_borrows`)
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 25))
+EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "False") == "True"
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "E-Library <library@example.com>")
+BORROW_DUE_SOON_DAYS = 2
+
+# Serve home, the catalog, book detail, categories and authors with their async views.
+# config/asgi.py turns this on; under WSGI the sync views avoid a per-request event loop.
+# A request's queries still run one after another: Django executes async ORM calls on a single
+# shared sync thread, so the async views free the event loop but don't cut per-request latency.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "False") == "True"
+
+# Startup (core.warmup): resolve URLs, compile every template, load the static manifest and
+# check DB connectivity in CoreConfig.ready(). gunicorn.conf.py turns it on and preloads the
+# app, so it runs once in the master before workers are forked.
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "False") == "True"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "core.warmup": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
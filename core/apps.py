@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        import core.signals
+
+        if settings.WARMUP_ON_STARTUP:
+            from core.warmup import warm_up
+            warm_up()
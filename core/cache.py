@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+LOCK_TTL = 30       # seconds a builder may hold the rebuild lock
+COLD_WAIT = 2.0     # how long other workers wait for a cold key before building it themselves
+ENTRY_TTL = 24 * 60 * 60  # safety net only; entries are invalidated by signals
+
+# home page blocks (core.views.home), invalidated by core.signals and the bulk commands
+HOME_STATS = 'home:stats'
+HOME_LATEST = 'home:latest_books'
+HOME_TOP_RATED = 'home:top_rated'
+
+
+def _gen_key(key):
+    return f'{key}:gen'
+
+
+def get_or_build(key, build, timeout=ENTRY_TTL):
+    """Return the cached value for `key`, building it with `build()` when missing or invalidated.
+
+    Entries are stored as (generation, value). `invalidate()` bumps the generation, so a
+    stale entry is still served to everyone except the single worker that wins the rebuild
+    lock. A cold key is computed once while other workers wait briefly for it.
+    """
+    gen_key = _gen_key(key)
+    found = cache.get_many([key, gen_key])
+    entry = found.get(key)
+    gen = found.get(gen_key, 0)
+    if entry is not None and entry[0] == gen:
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TTL):
+        try:
+            value = build()
+            cache.set(key, (gen, value), timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        return entry[1]
+
+    deadline = time.monotonic() + COLD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    return build()
+
+
+async def aget_or_build(key, abuild, timeout=ENTRY_TTL):
+    """get_or_build() for async views; `abuild` is a coroutine function."""
+    gen_key = _gen_key(key)
+    found = await cache.aget_many([key, gen_key])
+    entry = found.get(key)
+    gen = found.get(gen_key, 0)
+    if entry is not None and entry[0] == gen:
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TTL):
+        try:
+            value = await abuild()
+            await cache.aset(key, (gen, value), timeout)
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    if entry is not None:
+        return entry[1]
+
+    deadline = time.monotonic() + COLD_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry[1]
+    return await abuild()
+
+
+def invalidate(*keys):
+    for key in keys:
+        try:
+            cache.incr(_gen_key(key))
+        except ValueError:
+            # no generation stored yet (or evicted): start from the clock so an old
+            # generation number is never handed out twice
+            cache.add(_gen_key(key), time.time_ns(), None)
+
+
+def invalidate_on_commit(*keys):
+    # after commit, so a concurrent rebuild can't cache rows from before this change
+    transaction.on_commit(lambda: invalidate(*keys))
+
+
+def touch(*names):
+    """Record that the named tables changed. The stored value is the change time in ns,
+    so it serves both as a version (ETags) and as a Last-Modified timestamp."""
+    now = time.time_ns()
+    cache.set_many({f'version:{name}': now for name in names}, None)
+
+
+def touch_on_commit(*names):
+    transaction.on_commit(lambda: touch(*names))
+
+
+def get_versions(*names):
+    keys = [f'version:{name}' for name in names]
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        # unknown (cold or evicted cache): assume "changed now" rather than risk a stale 304
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
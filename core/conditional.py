@@ -0,0 +1,113 @@
+"""ETag / Last-Modified for the anonymous catalog pages.
+
+Each page names the rows it shows through a validator: a function of the view's arguments
+that returns their updated_at values (see `latest()`), fetched in one query. An anonymous
+request carrying a matching If-None-Match / If-Modified-Since gets a 304 before the view
+runs. Only requests without a session or messages cookie take this path and get
+`Cache-Control: public, no-cache`; anything else is rendered as usual and marked private.
+Every response varies on Cookie, so a shared cache never hands a logged-in page to anyone.
+
+Deleting a book bumps its author and category (book counts), so the pages listing it see
+the change. Authors and categories themselves have no parent row; pass `tables` so their
+deletions reach the ETag through the same table versions as the API (core.cache.touch).
+"""
+import hashlib
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db.models import Max, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .cache import get_versions
+
+# per-process counters, shown by core.views.query_profile
+stats = Counter()
+
+
+def latest(first, *others):
+    """updated_at of the newest row in `first` and in each of `others`, in one query.
+
+    `first` anchors the query: when it has no rows the result is None (no validator).
+    """
+    newest = {
+        f'm{i}': Max(Subquery(qs.order_by('-updated_at').values('updated_at')[:1]))
+        for i, qs in enumerate(others)
+    }
+    row = first.order_by().aggregate(m=Max('updated_at'), **newest)
+    return None if row['m'] is None else list(row.values())
+
+
+def shareable(request):
+    # no cookie means no session: anonymous, no flash messages, nothing per-user on the page
+    return (request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and CookieStorage.cookie_name not in request.COOKIES)
+
+
+def validators(request, validator, tables, args, kwargs):
+    stamps = validator(request, *args, **kwargs)
+    if not stamps:
+        return None, None
+    stamps = [s for s in stamps if s is not None]
+    versions = get_versions(*tables)
+    parts = [request.get_full_path(), *(s.isoformat() for s in stamps), *map(str, versions)]
+    etag = f'"{hashlib.sha1("|".join(parts).encode()).hexdigest()}"'
+    # table versions are change times in ns, so they move Last-Modified as well as the ETag
+    return etag, max([int(max(stamps).timestamp()), *(v // 1_000_000_000 for v in versions)])
+
+
+def finish(request, response, name, etag, last_modified):
+    if etag is None:
+        if not shareable(request):
+            patch_cache_control(response, private=True, no_cache=True)
+    else:
+        stats[name, 'not_modified' if response.status_code == 304 else 'rendered'] += 1
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def conditional_page(validator, tables=()):
+    """Make a catalog view answer conditional GETs from `validator(request, *args, **kwargs)`,
+    which returns a list of datetimes (or None, e.g. for a missing object). Works on sync and async views."""
+    def decorator(view):
+        name = view.__name__.removeprefix('a') if iscoroutinefunction(view) else view.__name__
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                etag = last_modified = None
+                if shareable(request):
+                    etag, last_modified = await sync_to_async(validators)(request, validator, tables, args, kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified) if etag else None
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(request, response, name, etag, last_modified)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                etag = last_modified = None
+                if shareable(request):
+                    etag, last_modified = validators(request, validator, tables, args, kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified) if etag else None
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return finish(request, response, name, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def summary():
+    views = sorted({name for name, _ in stats})
+    out = []
+    for name in views:
+        hits, misses = stats[name, 'not_modified'], stats[name, 'rendered']
+        out.append({'view': name, 'not_modified': hits, 'rendered': misses,
+                    'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0})
+    return out
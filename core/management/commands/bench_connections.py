@@ -0,0 +1,80 @@
+import copy
+import math
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+QUERY = "SELECT id, name FROM library_category ORDER BY id LIMIT 10"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * p) - 1)] if values else 0
+
+
+class Command(BaseCommand):
+    help = ("Time one query per simulated request with a new connection each time, a persistent "
+            "(health-checked) connection, and the psycopg pool (Postgres only), to show how much of a "
+            "request's DB time is connection setup.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        base = connections[options['database']]
+        modes = [('new connection', self.fresh), ('persistent', self.persistent)]
+        if hasattr(base, 'close_pool'):
+            modes.append(('pooled', self.pooled))
+
+        self.stdout.write(f"{base.vendor}, {options['requests']} requests per mode")
+        self.stdout.write(f"{'':16}{'p50':>9}{'p95':>9}{'mean':>9}  (ms per request)")
+        results = {}
+        for label, mode in modes:
+            wrapper = mode(base)
+            try:
+                samples = [self.request(wrapper) * 1000 for _ in range(options['requests'])]
+            finally:
+                wrapper.close()
+                if wrapper.settings_dict['OPTIONS'].get('pool'):
+                    wrapper.close_pool()
+            results[label] = sum(samples) / len(samples)
+            self.stdout.write(f"{label:16}{percentile(samples, .5):9.2f}{percentile(samples, .95):9.2f}"
+                              f"{results[label]:9.2f}")
+
+        saved = results['new connection'] - min(v for k, v in results.items() if k != 'new connection')
+        self.stdout.write(self.style.SUCCESS(f"connection setup removed from each request: {saved:.2f} ms"))
+
+    def wrapper(self, base, label, conn_max_age, pool=None):
+        settings_dict = copy.deepcopy(base.settings_dict)
+        settings_dict['CONN_MAX_AGE'] = conn_max_age
+        settings_dict['CONN_HEALTH_CHECKS'] = True
+        settings_dict['OPTIONS'].pop('pool', None)
+        if pool is not None:
+            settings_dict['OPTIONS']['pool'] = pool
+        return base.__class__(settings_dict, alias=f"bench_{label}")
+
+    def fresh(self, base):
+        return self.wrapper(base, 'fresh', 0)
+
+    def persistent(self, base):
+        return self.wrapper(base, 'persistent', 600)
+
+    def pooled(self, base):
+        pool = base.settings_dict['OPTIONS'].get('pool') or {'min_size': 1, 'max_size': 2}
+        wrapper = self.wrapper(base, 'pooled', 0, pool if pool is not True else {})
+        wrapper.ensure_connection()  # open the pool outside the timed loop, as post_worker_init does
+        wrapper.close()
+        return wrapper
+
+    def request(self, wrapper):
+        # what Django does around a request: close_old_connections() on request_started and
+        # request_finished, the view's query in between
+        started = time.perf_counter()
+        wrapper.close_if_unusable_or_obsolete()
+        with wrapper.cursor() as cursor:
+            cursor.execute(QUERY)
+            cursor.fetchall()
+        wrapper.close_if_unusable_or_obsolete()
+        return time.perf_counter() - started
@@ -0,0 +1,101 @@
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from library.models import Book, Borrow
+
+USERNAME = 'session_bench'
+PASSWORD = 'session-bench-password'
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+STEPS = ('login', 'borrow', 'return', 'logout')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * p) - 1)] if values else 0
+
+
+class Command(BaseCommand):
+    help = ("Time login + borrow + return + logout, each a POST plus the GET it redirects to, under each "
+            "session backend. Also counts django_session queries and writes per round.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=50)
+        parser.add_argument('--modes', default=','.join(ENGINES), help="Comma-separated subset of: " + ', '.join(ENGINES))
+        parser.add_argument('--real-hasher', action='store_true',
+                            help="Keep the configured password hasher; by default a fast one is used so "
+                                 "login time is session cost, not PBKDF2.")
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        unknown = set(modes) - set(ENGINES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+        book = Book.objects.filter(available_copies__gt=0).order_by('id').first()
+        if book is None:
+            raise CommandError("Need a book with a free copy (run seed_catalog).")
+
+        hashers = settings.PASSWORD_HASHERS
+        if not options['real_hasher']:
+            hashers = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        with override_settings(PASSWORD_HASHERS=hashers, ALLOWED_HOSTS=['*']):
+            User.objects.filter(username=USERNAME).delete()
+            user = User.objects.create_user(USERNAME, password=PASSWORD)
+            try:
+                self.stdout.write(f"{options['rounds']} rounds per mode; ms per POST + redirected GET")
+                self.stdout.write(f"{'':16}" + ''.join(f"{step + ' p50':>13}" for step in STEPS)
+                                  + f"{'round':>9}{'queries':>9}{'session q':>11}{'writes':>8}")
+                for mode in modes:
+                    with override_settings(SESSION_ENGINE=ENGINES[mode]):
+                        self.report(mode, [self.round(user, book) for _ in range(options['rounds'])])
+            finally:
+                user.delete()
+
+    def round(self, user, book):
+        client = Client()
+        timings, queries = {}, []
+
+        def step(name, url, data=None):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.post(url, data or {}, follow=True)
+                timings[name] = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise CommandError(f"{name}: HTTP {response.status_code}")
+            queries.extend(q['sql'] for q in captured.captured_queries)
+
+        step('login', reverse('login'), {'username': USERNAME, 'password': PASSWORD})
+        step('borrow', reverse('borrow_book', args=[book.id]))
+        borrow_id = Borrow.objects.filter(user=user, book=book, returned_at__isnull=True).values_list('id', flat=True).first()
+        if borrow_id is None:
+            raise CommandError("borrow did not go through")
+        step('return', reverse('return_book', args=[borrow_id]))
+        step('logout', reverse('logout'))
+
+        # every round starts from an empty loan history, so my_books renders the same page each time
+        Borrow.objects.filter(user=user).delete()
+
+        session = [sql for sql in queries if 'django_session' in sql]
+        writes = [sql for sql in session if not sql.lstrip().upper().startswith('SELECT')]
+        return timings, len(queries), len(session), len(writes)
+
+    def report(self, mode, rounds):
+        per_step = {step: [r[0][step] for r in rounds] for step in STEPS}
+        totals = [sum(r[0].values()) for r in rounds]
+        n = len(rounds)
+        self.stdout.write(
+            f"{mode:16}" + ''.join(f"{percentile(per_step[step], .5):13.2f}" for step in STEPS)
+            + f"{sum(totals) / n:9.2f}{sum(r[1] for r in rounds) / n:9.1f}"
+            + f"{sum(r[2] for r in rounds) / n:11.1f}{sum(r[3] for r in rounds) / n:8.1f}"
+        )
@@ -0,0 +1,165 @@
+import glob
+import os
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.hll import HyperLogLog
+from core.models import HourlyPathHits, HourlyUserAgent, HourlyVisitStats, VisitLogCursor
+from core.topk import SpaceSaving
+
+# rows kept per hour; the top entries of each are accurate, see core.topk
+PATH_SLOTS = 1000
+USER_AGENT_SLOTS = 200
+
+
+class HourBucket:
+    def __init__(self, hour):
+        self.hour = hour
+        self.hits = 0
+        self.ips = HyperLogLog()
+        self.paths = SpaceSaving(PATH_SLOTS)
+        self.user_agents = SpaceSaving(USER_AGENT_SLOTS)
+
+    def load(self):
+        # carry on from what earlier flushes stored for this hour; flush() replaces those rows
+        for path, hits in HourlyPathHits.objects.filter(hour=self.hour).order_by('-hits').values_list('path', 'hits'):
+            self.paths.add(path, hits)
+        for ua, hits in HourlyUserAgent.objects.filter(hour=self.hour).order_by('-hits').values_list('user_agent', 'hits'):
+            self.user_agents.add(ua, hits)
+        return self
+
+    def add(self, ip, path, ua):
+        self.hits += 1
+        self.ips.add(ip)
+        self.paths.add(path[:255])
+        self.user_agents.add(ua[:120])
+
+
+class Command(BaseCommand):
+    help = "Stream visits.log (and its rotated files) into hourly rollup tables, resuming where the last run stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Log file (defaults to settings.VISIT_LOG_PATH).")
+        parser.add_argument('--flush-every', type=int, default=200_000,
+                            help="Commit rollups and the cursor at least every N lines.")
+
+    def handle(self, *args, **options):
+        path = str(options['path'] or settings.VISIT_LOG_PATH)
+        self.flush_every = options['flush_every']
+        self.cursor, _ = VisitLogCursor.objects.get_or_create(name=os.path.basename(path))
+        self.hours = {}
+        self.lines = 0
+        started = time.perf_counter()
+
+        for file_path, offset in self.pending_files(path):
+            self.ingest_file(file_path, offset)
+
+        elapsed = time.perf_counter() - started
+        rate = self.lines / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {self.lines} lines in {elapsed:.1f}s ({rate:,.0f} lines/s)."
+        ))
+
+    def pending_files(self, path):
+        # rotated files are named <path>.<YYYYmmdd-HHMMSS>, so name order is time order
+        files = sorted(f for f in glob.glob(glob.escape(path) + '.*') if not f.endswith('.lock'))
+        if os.path.exists(path):
+            files.append(path)
+        stats = [(f, os.stat(f)) for f in files]
+
+        inodes = [st.st_ino for _, st in stats]
+        if self.cursor.inode in inodes:
+            start = inodes.index(self.cursor.inode)
+            first_offset = self.cursor.offset
+        else:
+            # the file we were reading is gone: resume with anything written since the last run
+            since = self.cursor.updated_at.timestamp() if self.cursor.inode else 0
+            start = next((i for i, (_, st) in enumerate(stats) if st.st_mtime > since), len(stats))
+            first_offset = 0
+
+        for i, (file_path, st) in enumerate(stats[start:]):
+            offset = first_offset if i == 0 else 0
+            yield file_path, (offset if offset <= st.st_size else 0)
+
+    def ingest_file(self, file_path, offset):
+        inode = os.stat(file_path).st_ino
+        hour_cache = {}
+        since_flush = 0
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break  # partial line still being written; pick it up next run
+                offset += len(raw)
+                parts = raw.decode('utf-8', 'replace').rstrip('\n').split(' | ', 3)
+                if len(parts) != 4:
+                    continue
+                ts, ip, path, ua = parts
+
+                key = ts[:13]
+                hour = hour_cache.get(key)
+                if hour is None:
+                    try:
+                        hour = datetime.strptime(key, '%Y-%m-%dT%H').replace(tzinfo=dt_timezone.utc)
+                    except ValueError:
+                        continue
+                    hour_cache[key] = hour
+
+                bucket = self.hours.get(hour)
+                if bucket is None:
+                    if len(self.hours) >= 2:
+                        # the log is time ordered (give or take one batch at an hour boundary),
+                        # so once a third hour shows up the earlier ones are complete
+                        self.flush(inode, offset - len(raw))
+                        since_flush = 0
+                    bucket = self.hours[hour] = HourBucket(hour).load()
+                bucket.add(ip, path, ua)
+                self.lines += 1
+                since_flush += 1
+                if since_flush >= self.flush_every:
+                    self.flush(inode, offset)
+                    since_flush = 0
+
+        self.flush(inode, offset)
+
+    @transaction.atomic
+    def flush(self, inode, offset):
+        buckets = list(self.hours.values())
+        self.hours = {}
+        if buckets:
+            hours = [b.hour for b in buckets]
+
+            existing = {s.hour: s for s in HourlyVisitStats.objects.filter(hour__in=hours)}
+            stats = []
+            for b in buckets:
+                row = existing.get(b.hour)
+                if row is not None:
+                    b.ips.merge(HyperLogLog.from_bytes(bytes(row.ip_sketch)))
+                    b.hits += row.hits
+                stats.append(HourlyVisitStats(
+                    hour=b.hour, hits=b.hits, unique_ips=b.ips.count(), ip_sketch=b.ips.to_bytes(),
+                ))
+            HourlyVisitStats.objects.bulk_create(
+                stats, update_conflicts=True, unique_fields=['hour'],
+                update_fields=['hits', 'unique_ips', 'ip_sketch'],
+            )
+
+            self.replace_counts(HourlyPathHits, 'path', {b.hour: b.paths for b in buckets})
+            self.replace_counts(HourlyUserAgent, 'user_agent', {b.hour: b.user_agents for b in buckets})
+
+        self.cursor.inode = inode
+        self.cursor.offset = offset
+        self.cursor.save()
+
+    def replace_counts(self, model, field, counters):
+        # each bucket was loaded from the stored rows, so it already holds the whole hour
+        model.objects.filter(hour__in=list(counters)).delete()
+        model.objects.bulk_create([
+            model(hour=hour, hits=hits, **{field: key})
+            for hour, counter in counters.items()
+            for key, hits in counter.items()
+        ], batch_size=1000)
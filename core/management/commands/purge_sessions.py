@@ -0,0 +1,34 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ("Delete expired rows from django_session in small batches, each its own short transaction, "
+            "instead of clearsessions' single DELETE over the whole table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help="Seconds to sleep between batches so live logins get the table in between.")
+        parser.add_argument('--limit', type=int, default=0, help="Stop after this many rows (0: no limit).")
+
+    def handle(self, *args, **options):
+        batch_size, limit = options['batch_size'], options['limit']
+        now = timezone.now()
+        started = time.perf_counter()
+        deleted = 0
+        while not limit or deleted < limit:
+            size = min(batch_size, limit - deleted) if limit else batch_size
+            # oldest first along the expire_date index; the DELETE is by primary key
+            keys = list(Session.objects.filter(expire_date__lt=now).order_by('expire_date')
+                        .values_list('session_key', flat=True)[:size])
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys, expire_date__lt=now).delete()[0]
+            if options['pause']:
+                time.sleep(options['pause'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired session(s) in {elapsed:.1f}s."))
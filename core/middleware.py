@@ -1,23 +1,89 @@
-from django.utils import timezone
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
-import os
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from . import profiling
+from .visitlog import get_writer
+
+logger = logging.getLogger(__name__)
+
 
 class VisitLogMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
+        if not getattr(settings, 'VISIT_LOG_ENABLED', True):
+            raise MiddlewareNotUsed
         self.get_response = get_response
+        self.writer = get_writer()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         response = self.get_response(request)
+        self.log(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.log(request)
+        return response
 
+    def log(self, request):
         try:
             path = request.path
             ip = request.META.get('REMOTE_ADDR', '')
             ua = request.META.get('HTTP_USER_AGENT', '')[:120]
-            line = f"{timezone.now().isoformat()} | {ip} | {path} | {ua}\n"
-            log_path = os.path.join(settings.BASE_DIR, 'visits.log')
-            with open(log_path, 'a', encoding='utf-8') as f:
-                f.write(line)
+            # only a non-blocking queue put here; the writer thread does the file I/O
+            self.writer.write(f"{timezone.now().isoformat()} | {ip} | {path} | {ua}\n")
         except Exception:
             pass
 
+
+class QueryProfileMiddleware:
+    """Per-view SQL count/time, duplicate queries and template render time into a ring buffer
+    (see core.profiling). Enabled with PROFILING_ENABLED; budgets come from QUERY_BUDGETS."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiling.install_query_hooks()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.record(request, *profiling.profile_request(self.get_response, request))
+
+    async def __acall__(self, request):
+        return self.record(request, *await profiling.aprofile_request(self.get_response, request))
+
+    def record(self, request, response, profile, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        over_budget = profiling.check_budget(view, profile)
+        if over_budget:
+            logger.warning(over_budget)
+        profiling.buffer.append(profile.record(
+            view=view,
+            path=request.path,
+            status=response.status_code,
+            total_ms=round(elapsed * 1000, 2),
+            at=timezone.now().isoformat(),
+            over_budget=over_budget,
+        ))
+        response['X-Query-Count'] = profile.queries  # read by the benchmark command over HTTP
         return response
@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyVisitStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(unique=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('unique_ips', models.PositiveIntegerField(default=0)),
+                ('ip_sketch', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VisitLogCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=60, unique=True)),
+                ('inode', models.BigIntegerField(default=0)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HourlyPathHits',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('path', models.CharField(max_length=255)),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hour', 'path'), name='uniq_hourly_path')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyUserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('user_agent', models.CharField(max_length=120)),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hour', 'user_agent'), name='uniq_hourly_user_agent')],
+            },
+        ),
+    ]
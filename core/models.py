@@ -8,4 +8,53 @@ class ContactMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.name} - {self.subject}"
\ No newline at end of file
+        return f"{self.name} - {self.subject}"
+
+
+class VisitLogCursor(models.Model):
+    # where `ingest_visits` stopped: file identity (inode) + byte offset of the last complete line
+    name = models.CharField(max_length=60, unique=True)
+    inode = models.BigIntegerField(default=0)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.inode}:{self.offset}"
+
+
+class HourlyVisitStats(models.Model):
+    hour = models.DateTimeField(unique=True)
+    hits = models.PositiveIntegerField(default=0)
+    unique_ips = models.PositiveIntegerField(default=0)
+    ip_sketch = models.BinaryField()  # core.hll.HyperLogLog registers, mergeable across hours
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}:00 - {self.hits}"
+
+
+class HourlyPathHits(models.Model):
+    hour = models.DateTimeField()
+    path = models.CharField(max_length=255)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'path'], name='uniq_hourly_path'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}:00 {self.path} - {self.hits}"
+
+
+class HourlyUserAgent(models.Model):
+    hour = models.DateTimeField()
+    user_agent = models.CharField(max_length=120)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'user_agent'], name='uniq_hourly_user_agent'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}:00 {self.user_agent} - {self.hits}"
@@ -0,0 +1,181 @@
+import contextvars
+import math
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestProfile:
+    """Collects SQL count/time for one request; fed by the hook install_query_hook() adds."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            # Django passes parameters separately, so the SQL text is already the query's shape
+            self.signatures[sql] += 1
+
+    def duplicates(self, limit=5):
+        return [(sql, n) for sql, n in self.signatures.most_common(limit) if n > 1]
+
+    def record(self, **extra):
+        dupes = self.duplicates()
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'render_ms': round(self.render_time * 1000, 2),
+            'duplicates': [{'sql': sql[:300], 'count': n} for sql, n in dupes],
+            **extra,
+        }
+
+
+_active = contextvars.ContextVar('request_profile', default=None)
+_rendering = contextvars.ContextVar('template_rendering', default=False)
+
+
+class TimedTemplate(Template):
+    # render() here is the backend's entry point (render(), render_to_string()); {% extends %} and
+    # {% include %} render the compiled template directly and never come through it
+    def render(self, context=None, request=None):
+        profile = _active.get()
+        if profile is None or _rendering.get():
+            return super().render(context, request)
+        # a card fragment rendered by a tag is inside the page render, so only the outermost counts
+        token = _rendering.set(True)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.render_time += time.perf_counter() - started
+            _rendering.reset(token)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time added to the active request profile."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class RingBuffer:
+    def __init__(self, size):
+        self._items = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, item):
+        with self._lock:
+            self._items.append(item)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._items)
+
+
+buffer = RingBuffer(getattr(settings, 'PROFILING_BUFFER_SIZE', 500))
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _active.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def install_query_hook(connection, **kwargs):
+    """Route a connection's queries to the active request profile (connection_created receiver).
+
+    Connections are per thread, but the profile is context-local and so follows an async
+    request into the sync_to_async thread that runs its queries.
+    """
+    if _record_query not in connection.execute_wrappers:
+        # at the front: execute_wrapper() blocks pop() the last wrapper on exit
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def install_query_hooks():
+    connection_created.connect(install_query_hook)
+    for connection in connections.all(initialized_only=True):
+        install_query_hook(connection)
+
+
+@contextmanager
+def _profiling():
+    profile = RequestProfile()
+    token = _active.set(profile)
+    try:
+        yield profile
+    finally:
+        _active.reset(token)
+
+
+def profile_request(get_response, request):
+    started = time.perf_counter()
+    with _profiling() as profile:
+        response = get_response(request)
+    return response, profile, time.perf_counter() - started
+
+
+async def aprofile_request(get_response, request):
+    started = time.perf_counter()
+    with _profiling() as profile:
+        response = await get_response(request)
+    return response, profile, time.perf_counter() - started
+
+
+def check_budget(view_name, profile):
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+    if budget is None or profile.queries <= budget:
+        return None
+    message = f"{view_name} ran {profile.queries} queries (budget {budget})"
+    if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    return message
+
+
+def summarize(records):
+    by_view = {}
+    for r in records:
+        s = by_view.setdefault(r['view'], {'view': r['view'], 'hits': 0, 'queries': [], 'total_ms': [], 'db_ms': []})
+        s['hits'] += 1
+        s['queries'].append(r['queries'])
+        s['total_ms'].append(r['total_ms'])
+        s['db_ms'].append(r['db_ms'])
+    out = []
+    for s in by_view.values():
+        total = sorted(s['total_ms'])
+        out.append({
+            'view': s['view'],
+            'hits': s['hits'],
+            'avg_queries': round(sum(s['queries']) / s['hits'], 1),
+            'max_queries': max(s['queries']),
+            'avg_db_ms': round(sum(s['db_ms']) / s['hits'], 2),
+            'p50_ms': total[len(total) // 2],
+            'p95_ms': total[math.ceil(len(total) * 0.95) - 1],
+        })
+    return sorted(out, key=lambda s: -s['avg_queries'])
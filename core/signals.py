@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from library.models import Author, Book, Category, Review
+
+from .cache import HOME_LATEST, HOME_STATS, HOME_TOP_RATED, invalidate_on_commit
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_home_catalog(sender, **kwargs):
+    invalidate_on_commit(HOME_STATS, HOME_LATEST, HOME_TOP_RATED)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_home_books(sender, **kwargs):
+    invalidate_on_commit(HOME_LATEST, HOME_TOP_RATED)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_home_ratings(sender, **kwargs):
+    invalidate_on_commit(HOME_TOP_RATED)
+
+
+@receiver(post_save, sender=User)
+def invalidate_home_students_on_save(sender, created, update_fields=None, **kwargs):
+    # logins save only last_login; that doesn't change the student count
+    if created or update_fields is None or 'is_staff' in update_fields:
+        invalidate_on_commit(HOME_STATS)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_home_students_on_delete(sender, **kwargs):
+    invalidate_on_commit(HOME_STATS)
@@ -0,0 +1,6 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    # without a manifest (collectstatic not run yet) hash the file on disk instead of raising a 500
+    manifest_strict = False
@@ -1,3 +1,283 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from library.models import Author, Book, Category, Review
+
+from . import cache as core_cache, visitlog
+from .middleware import VisitLogMiddleware
+from .cache import HOME_LATEST, HOME_STATS, HOME_TOP_RATED, aget_or_build
+from .models import HourlyPathHits, HourlyUserAgent, HourlyVisitStats
+from .topk import SpaceSaving
+from .views import ahome
+from .visitlog import VisitLogWriter
+
+LOCMEM = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'core-tests-{alias}'}
+    for alias in ('default', 'fragments')
+}
+
+
+@override_settings(CACHES=LOCMEM)
+class AsyncColdKeyTests(TestCase):
+    # another worker holds the rebuild lock of a key that has never been built
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_builds_itself_after_waiting(self):
+        calls = []
+
+        async def build():
+            calls.append(1)
+            return 'built'
+
+        await cache.aadd('cold:lock', 1)
+        with mock.patch.object(core_cache, 'COLD_WAIT', 0.1):
+            self.assertEqual(await aget_or_build('cold', build), 'built')
+        self.assertEqual(calls, [1])
+
+    async def test_uses_value_built_by_lock_holder(self):
+        async def build():
+            raise AssertionError("should have waited for the lock holder")
+
+        await cache.aadd('cold:lock', 1)
+        await cache.aset('cold', (0, 'from the other worker'))
+        self.assertEqual(await aget_or_build('cold', build), 'from the other worker')
+
+    async def test_home_while_stats_are_rebuilt_elsewhere(self):
+        await cache.aadd(f'{HOME_STATS}:lock', 1)
+        request = RequestFactory().get('/')
+
+        async def auser():
+            return AnonymousUser()
+
+        request.auser = auser
+        with mock.patch.object(core_cache, 'COLD_WAIT', 0.1):
+            response = await ahome(request)
+        self.assertEqual(response.status_code, 200)
+
+
+class VisitLogMiddlewareTests(SimpleTestCase):
+
+    def test_off_under_manage_py_test(self):
+        self.assertFalse(settings.VISIT_LOG_ENABLED)
+        with self.assertRaises(MiddlewareNotUsed):
+            VisitLogMiddleware(lambda request: HttpResponse())
+
+    def test_logs_to_configured_path(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'visits.log')
+        with override_settings(VISIT_LOG_ENABLED=True, VISIT_LOG_PATH=path), \
+                mock.patch.object(visitlog, '_writer', None):
+            middleware = VisitLogMiddleware(lambda request: HttpResponse())
+            middleware(RequestFactory().get('/books/', headers={'user-agent': 'tests'}))
+            middleware.writer.close()
+        with open(path) as f:
+            self.assertTrue(f.read().endswith(' | 127.0.0.1 | /books/ | tests\n'))
+        # rotation is opt-in: nothing renamed
+        self.assertEqual(set(os.listdir(tmp.name)) - {'visits.log', 'visits.log.lock'}, set())
+
+
+class VisitLogWriterTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'visits.log')
+        self.writer = VisitLogWriter(self.path, rotate_daily=False, flush_interval=60)
+
+    def read(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def test_close_flushes_pending_lines(self):
+        self.writer.write('a\n')
+        self.writer.write('b\n')
+        self.writer.close()
+        self.assertEqual(self.read(), 'a\nb\n')
+        self.assertIsNone(self.writer._pid)
+        self.assertIsNone(self.writer._fd)
+
+    def test_write_after_close_goes_straight_to_disk(self):
+        self.writer.write('a\n')
+        self.writer.close()
+        self.writer.write('late\n')
+        self.assertEqual(self.read(), 'a\nlate\n')
+        self.assertIsNone(self.writer._pid)
+        self.assertIsNone(self.writer._fd)
+
+    def test_full_queue_counts_drops(self):
+        writer = VisitLogWriter(self.path, rotate_daily=False, flush_interval=60, max_pending=1)
+        self.addCleanup(writer.close)
+        with mock.patch.object(VisitLogWriter, '_run'):  # nothing drains the queue
+            for _ in range(3):
+                writer.write('x\n')
+        self.assertEqual(writer.dropped, 2)
+
+
+class SpaceSavingTests(SimpleTestCase):
+
+    def test_exact_below_capacity(self):
+        counter = SpaceSaving(3)
+        for key in 'aabacb':
+            counter.add(key)
+        self.assertEqual(dict(counter.items()), {'a': 3, 'b': 2, 'c': 1})
+        self.assertEqual(counter.min_count(), 1)
+
+    def test_bounded_and_keeps_heavy_hitters(self):
+        counter = SpaceSaving(10)
+        stream = ['hot'] * 500 + [f'cold{i}' for i in range(1000)] + ['warm'] * 200
+        for key in stream:
+            counter.add(key)
+        counts = dict(counter.items())
+        self.assertEqual(len(counts), 10)
+        self.assertEqual(sum(counts.values()), len(stream))
+        self.assertEqual(counts['hot'], 500)
+        self.assertGreaterEqual(counts['warm'], 200)
+        self.assertLessEqual(counts['warm'], 200 + counter.min_count())
+
+
+class IngestVisitsTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'visits.log')
+
+    def append(self, lines):
+        with open(self.path, 'a') as f:
+            f.writelines(lines)
+
+    def test_counts_survive_mid_hour_flushes_and_runs(self):
+        lines = [
+            f'2026-01-01T10:{i % 60:02d}:00 | 10.0.0.{i % 7} | /books/{i % 3}/ | agent-{i % 4}\n'
+            for i in range(120)
+        ]
+        self.append(lines[:50])
+        call_command('ingest_visits', path=self.path, flush_every=7, stdout=io.StringIO())
+        self.append(lines[50:])
+        call_command('ingest_visits', path=self.path, flush_every=11, stdout=io.StringIO())
+
+        self.assertEqual(HourlyVisitStats.objects.get().hits, 120)
+        self.assertEqual(dict(HourlyPathHits.objects.values_list('path', 'hits')),
+                         {f'/books/{n}/': 40 for n in range(3)})
+        self.assertEqual(dict(HourlyUserAgent.objects.values_list('user_agent', 'hits')),
+                         {f'agent-{n}': 30 for n in range(4)})
+
+
+@override_settings(CACHES=LOCMEM)
+class HomeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author, category = Author.objects.create(name='Toni Morrison'), Category.objects.create(name='Fiction')
+        cls.books = [
+            Book.objects.create(title=title, author=author, category=category, publication_year=1987,
+                                pages=300, language='English', description='')
+            for title in ('Beloved', 'Jazz', 'Sula')
+        ]
+        cls.user = User.objects.create_user('reader', password='secret-pass-123')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_and_logged_in(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Sula')
+        self.assertEqual(response.context['stats'], {'books': 3, 'authors': 1, 'students': 1})
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('home')), 'Beloved')
+
+    def test_review_reaches_top_rated(self):
+        self.assertEqual(list(self.client.get(reverse('home')).context['top_rated']), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.user, book=self.books[1], stars=5)
+        self.assertEqual(list(self.client.get(reverse('home')).context['top_rated']), [self.books[1]])
+
+    def test_cached_until_invalidated(self):
+        self.client.get(reverse('home'))
+        Book.objects.filter(title='Sula').update(title='Tar Baby')
+        self.assertContains(self.client.get(reverse('home')), 'Sula')
+        core_cache.invalidate(HOME_LATEST, HOME_TOP_RATED, HOME_STATS)
+        self.assertContains(self.client.get(reverse('home')), 'Tar Baby')
+
+    def cached_blocks(self):
+        # which home blocks are still served from the cache (a rebuild would return None)
+        cache.clear()
+        self.client.get(reverse('home'))
+        return lambda: {key for key in (HOME_STATS, HOME_LATEST, HOME_TOP_RATED)
+                        if core_cache.get_or_build(key, lambda: None) is not None}
+
+    def test_changes_invalidate_only_their_blocks(self):
+        cached = self.cached_blocks()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Essays')
+        self.assertEqual(cached(), {HOME_STATS})
+
+        cached = self.cached_blocks()
+        self.client.login(username='reader', password='secret-pass-123')  # saves last_login only
+        self.assertEqual(cached(), {HOME_STATS, HOME_LATEST, HOME_TOP_RATED})
+
+        cached = self.cached_blocks()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('newcomer')
+        self.assertEqual(cached(), {HOME_LATEST, HOME_TOP_RATED})
+
+    def test_invalidated_on_commit(self):
+        cached = self.cached_blocks()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.books[0].delete()
+        self.assertEqual(cached(), {HOME_STATS, HOME_LATEST, HOME_TOP_RATED})
+        cached = self.cached_blocks()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cached(), set())
+
+    def test_dashboards_are_staff_only(self):
+        self.client.force_login(self.user)
+        for name in ('visits_dashboard', 'query_profile'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 302)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        for name in ('visits_dashboard', 'query_profile'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+
+class PurgeSessionsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(hours=i + 1))
+             for i in range(7)]
+            + [Session(session_key=f'live{i}', session_data='', expire_date=now + timedelta(days=1)) for i in range(2)]
+        )
+
+    def purge(self, **options):
+        out = io.StringIO()
+        call_command('purge_sessions', pause=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_deletes_expired_in_batches(self):
+        self.assertIn('Deleted 7 expired session(s)', self.purge(batch_size=3))
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)), ['live0', 'live1'])
+
+    def test_limit_takes_the_oldest_first(self):
+        self.assertIn('Deleted 4 expired session(s)', self.purge(batch_size=3, limit=4))
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)),
+                         ['expired0', 'expired1', 'expired2', 'live0', 'live1'])
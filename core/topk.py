@@ -0,0 +1,40 @@
+import heapq
+
+
+class SpaceSaving:
+    """Heavy-hitters counter that keeps at most `capacity` keys (Space-Saving).
+
+    A new key arriving when full takes over the smallest counter and inherits its count,
+    so counts are never too low, each is at most `min_count()` too high, and they still
+    add up to the total number of hits.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self._heap = []  # one (count, key) entry per key; may lag behind counts until it surfaces
+
+    def add(self, key, n=1):
+        counts = self.counts
+        if key in counts:
+            counts[key] += n
+            return
+        if len(counts) < self.capacity:
+            counts[key] = n
+            heapq.heappush(self._heap, (n, key))
+            return
+        heap = self._heap
+        while True:
+            count, smallest = heap[0]
+            if counts[smallest] == count:
+                break
+            heapq.heapreplace(heap, (counts[smallest], smallest))
+        del counts[smallest]
+        counts[key] = count + n
+        heapq.heapreplace(heap, (count + n, key))
+
+    def min_count(self):
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def items(self):
+        return self.counts.items()
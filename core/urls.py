@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from .views import home
+from .views import ahome, home, query_profile, visits_dashboard
 
 urlpatterns = [
-    path('', home, name='home'),
+    path('', ahome if settings.ASYNC_VIEWS else home, name='home'),
+    path('dashboard/visits/', visits_dashboard, name='visits_dashboard'),
+    path('dashboard/queries/', query_profile, name='query_profile'),
 ]
@@ -1,23 +1,115 @@
-from django.db.models import Count
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Sum
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.contrib.auth.models import User
+from django.utils import timezone
 from library.models import Book, Author
 
+from .cache import HOME_LATEST, HOME_STATS, HOME_TOP_RATED, aget_or_build, get_or_build
+from . import conditional, profiling
+from .hll import HyperLogLog
+from .models import HourlyPathHits, HourlyUserAgent, HourlyVisitStats
+
+
 def home(request):
-    latest_books = Book.objects.select_related('author','category').order_by('-created_at')[:6]
+    latest_books = get_or_build(HOME_LATEST, lambda: list(
+        Book.objects.select_related('author','category').order_by('-created_at')[:6]
+    ))
 
-    # top rated: ترتيب بسيط حسب عدد المراجعات كحد أدنى (حل عملي وسريع)
-    top_rated = Book.objects.annotate(rc=Count('reviews')).order_by('-rc', '-created_at')[:3]
+    top_rated = get_or_build(HOME_TOP_RATED, lambda: list(
+        Book.objects.select_related('author','category').filter(rating_count__gt=0).order_by('-avg_rating', '-id')[:3]
+    ))
 
-    stats = {
+    stats = get_or_build(HOME_STATS, lambda: {
         'books': Book.objects.count(),
         'authors': Author.objects.count(),
         'students': User.objects.filter(is_staff=False).count(),
-    }
+    })
+
+    return render(request, 'core/home.html', {
+        'latest_books': latest_books,
+        'top_rated': top_rated,
+        'stats': stats
+    })
+
+
+async def ahome(request):
+    # see home() for the sync version; the awaits run one after another (the async ORM and
+    # cache calls share one sync thread), so this frees the event loop but is not faster
+    async def build_stats():
+        return {
+            'books': await Book.objects.acount(),
+            'authors': await Author.objects.acount(),
+            'students': await User.objects.filter(is_staff=False).acount(),
+        }
+
+    async def build_latest():
+        return [b async for b in Book.objects.select_related('author','category').order_by('-created_at')[:6]]
+
+    async def build_top():
+        return [b async for b in Book.objects.select_related('author','category')
+                .filter(rating_count__gt=0).order_by('-avg_rating', '-id')[:3]]
+
+    request.user = await request.auser()
+    latest_books = await aget_or_build(HOME_LATEST, build_latest)
+    top_rated = await aget_or_build(HOME_TOP_RATED, build_top)
+    stats = await aget_or_build(HOME_STATS, build_stats)
 
     return render(request, 'core/home.html', {
         'latest_books': latest_books,
         'top_rated': top_rated,
         'stats': stats
     })
+
+
+@staff_member_required
+def visits_dashboard(request):
+    # reads only the rollups written by `manage.py ingest_visits`, never visits.log itself
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 90)
+    except ValueError:
+        days = 7
+    since = timezone.now() - timedelta(days=days)
+
+    daily = {}
+    overall = HyperLogLog()
+    for row in HourlyVisitStats.objects.filter(hour__gte=since).order_by('hour'):
+        sketch = HyperLogLog.from_bytes(bytes(row.ip_sketch))
+        day = daily.setdefault(row.hour.date(), {'date': row.hour.date(), 'hits': 0, 'ips': HyperLogLog()})
+        day['hits'] += row.hits
+        day['ips'].merge(sketch)
+        overall.merge(sketch)
+    for day in daily.values():
+        day['unique_ips'] = day.pop('ips').count()
+
+    top_paths = (HourlyPathHits.objects.filter(hour__gte=since)
+                 .values('path').annotate(total=Sum('hits')).order_by('-total')[:20])
+    top_agents = (HourlyUserAgent.objects.filter(hour__gte=since)
+                  .values('user_agent').annotate(total=Sum('hits')).order_by('-total')[:10])
+
+    return render(request, 'core/visits_dashboard.html', {
+        'days': days,
+        'daily': sorted(daily.values(), key=lambda d: d['date'], reverse=True),
+        'total_hits': sum(d['hits'] for d in daily.values()),
+        'unique_ips': overall.count(),
+        'top_paths': top_paths,
+        'top_agents': top_agents,
+    })
+
+
+@staff_member_required
+def query_profile(request):
+    # this worker's recent requests only: the ring buffer is per process
+    records = profiling.buffer.snapshot()
+    return JsonResponse({
+        'enabled': bool(getattr(settings, 'PROFILING_ENABLED', False)),
+        'summary': profiling.summarize(records),
+        'recent': records[-50:][::-1],
+        'over_budget': [r for r in records if r['over_budget']][-20:][::-1],
+        'conditional': conditional.summary(),  # 304 share of the anonymous catalog pages
+    })
 from django.shortcuts import render
@@ -0,0 +1,208 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server, no cross-process locking needed
+    fcntl = None
+
+
+class VisitLogWriter:
+    """Buffers visit lines in memory and appends them to disk from a background thread.
+
+    The request path only does a non-blocking queue put. Batches are flushed when
+    `batch_size` lines are pending or `flush_interval` seconds have passed, with a
+    single O_APPEND write so lines from several worker processes never interleave.
+    Rotation (by size or by day) is coordinated between processes with a lock file.
+    """
+
+    def __init__(self, path, max_bytes=0, rotate_daily=False, batch_size=256,
+                 flush_interval=1.0, max_pending=10000):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pid = None
+        self._closed_pid = None
+        self._started_cache = (None, '')
+        self._start_lock = threading.Lock()
+        self._dropped_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def write(self, line):
+        if self._closed_pid == os.getpid():
+            # closed (e.g. late requests during shutdown): no thread left to drain the queue
+            self._write_now(line)
+            return
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self._count_dropped(1)
+
+    def _count_dropped(self, n):
+        # the request threads and the writer thread both count
+        with self._dropped_lock:
+            self.dropped += n
+
+    def _write_now(self, line):
+        with self._sync_lock:
+            self._flush([line])
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # first use in this process (or first use after a fork: the parent's thread is gone)
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            self._stop = threading.Event()
+            self._fd = None
+            self._thread = threading.Thread(target=self._run, name='visit-log-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def close(self):
+        with self._start_lock:
+            if self._pid != os.getpid():
+                return
+            # writes from here on go straight to disk; a forked child still starts its own thread
+            self._closed_pid = self._pid
+            self._pid = None
+        self._stop.set()
+        self._thread.join(timeout=5)
+        with self._sync_lock:
+            while not self._queue.empty():
+                self._flush(self._drain())
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _drain(self, first=None):
+        batch = [] if first is None else [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        pending = []
+        while not self._stop.is_set():
+            try:
+                timeout = max(0.0, deadline - time.monotonic())
+                pending.extend(self._drain(self._queue.get(timeout=timeout)))
+            except queue.Empty:
+                pass
+            if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(pending)
+                pending = []
+                deadline = time.monotonic() + self.flush_interval
+        self._flush(pending)
+
+    def _flush(self, lines):
+        if not lines:
+            return
+        data = ''.join(lines).encode('utf-8')
+        try:
+            with self._locked(exclusive=False):
+                self._reopen_if_rotated()
+                os.write(self._fd, data)
+            if self._needs_rotation():
+                self._rotate()
+        except OSError:
+            self._count_dropped(len(lines))
+
+    def _locked(self, exclusive):
+        return _FileLock(self.path + '.lock', exclusive)
+
+    def _reopen_if_rotated(self):
+        if self._fd is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _needs_rotation(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if st.st_size == 0:
+            return False
+        if self.max_bytes and st.st_size >= self.max_bytes:
+            return True
+        if self.rotate_daily:
+            return self._started_on(st) < datetime.now(dt_timezone.utc).strftime('%Y-%m-%d')
+        return False
+
+    def _started_on(self, st):
+        # lines start with an ISO timestamp, so the first 10 bytes are the day the file was begun
+        if self._started_cache[0] != st.st_ino:
+            with open(self.path, 'rb') as f:
+                self._started_cache = (st.st_ino, f.read(10).decode('ascii', 'replace'))
+        return self._started_cache[1]
+
+    def _rotate(self):
+        with self._locked(exclusive=True):
+            # another worker may have rotated while we waited for the lock
+            if not self._needs_rotation():
+                return
+            stamp = datetime.now(dt_timezone.utc).strftime('%Y%m%d-%H%M%S')
+            target = f"{self.path}.{stamp}"
+            n = 1
+            while os.path.exists(target):
+                target = f"{self.path}.{stamp}-{n}"
+                n += 1
+            os.rename(self.path, target)
+
+
+class _FileLock:
+    def __init__(self, path, exclusive):
+        self.path = path
+        self.mode = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) if fcntl else None
+
+    def __enter__(self):
+        if fcntl:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, self.mode)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+
+
+_writer = None
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        _writer = VisitLogWriter(
+            settings.VISIT_LOG_PATH,
+            max_bytes=getattr(settings, 'VISIT_LOG_MAX_BYTES', 0),
+            rotate_daily=getattr(settings, 'VISIT_LOG_ROTATE_DAILY', False),
+            batch_size=getattr(settings, 'VISIT_LOG_BATCH_SIZE', 256),
+            flush_interval=getattr(settings, 'VISIT_LOG_FLUSH_INTERVAL', 1.0),
+        )
+    return _writer
@@ -0,0 +1,115 @@
+"""Startup warmup for production workers (enabled with WARMUP_ON_STARTUP, see gunicorn.conf.py).
+
+Runs from CoreConfig.ready(), so with gunicorn's preload_app it happens once in the master and
+every forked worker starts with resolved URLs, compiled templates and a loaded static manifest
+instead of paying for them on its first requests. DB connections are opened and closed again
+here (sockets and pools must not be shared across a fork); each worker opens its own in
+post_worker_init.
+"""
+import logging
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SUFFIXES = ('.html', '.txt')
+timings = {}
+
+
+def _timed(name, fn):
+    started = time.perf_counter()
+    result = fn()
+    timings[name] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def warm_urls():
+    from django.urls import get_resolver
+    resolver = get_resolver()
+    # reverse_dict builds the lookup tables for every URL name; it also imports all view modules
+    resolver.reverse_dict
+    return len(resolver.url_patterns)
+
+
+def _template_names(engine):
+    dirs = list(engine.dirs)
+    if engine.app_dirs or any('app_directories' in str(loader) for loader in engine.loaders):
+        from django.template.utils import get_app_template_dirs
+        dirs += get_app_template_dirs('templates')
+    seen = set()
+    for base in map(Path, dirs):
+        for path in base.rglob('*'):
+            if path.suffix in TEMPLATE_SUFFIXES and path.is_file():
+                name = path.relative_to(base).as_posix()
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+
+
+def warm_templates():
+    # get_template() fills the cached loader, so workers never parse a template at request time
+    count = 0
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            continue
+        for name in _template_names(engine):
+            try:
+                backend.get_template(name)
+                count += 1
+            except (TemplateDoesNotExist, TemplateSyntaxError) as exc:
+                # admin ships templates for apps we don't install; they are never rendered
+                logger.debug("warmup skipped %s: %s", name, exc)
+    from library.cards import template_version
+    template_version()
+    return count
+
+
+def warm_static():
+    from django.contrib.staticfiles.storage import staticfiles_storage
+    # ManifestStaticFilesStorage reads staticfiles.json when first used
+    hashed = getattr(staticfiles_storage, 'hashed_files', None)
+    if hashed is None:
+        return 0
+    if not hashed and not settings.DEBUG:
+        logger.warning("No static files manifest in %s; run collectstatic.", settings.STATIC_ROOT)
+    return len(hashed)
+
+
+def warm_db():
+    # pays for the driver import, DNS/TLS and auth once, then closes so nothing is inherited
+    for conn in connections.all():
+        conn.ensure_connection()
+    connections.close_all()
+    for conn in connections.all():
+        if conn.settings_dict['OPTIONS'].get('pool'):
+            conn.close_pool()  # the pool's worker threads would not survive the fork
+    return len(connections.all())
+
+
+def warm_up():
+    counts = {
+        'urls': _timed('urls', warm_urls),
+        'templates': _timed('templates', warm_templates),
+        'static': _timed('static', warm_static),
+        'db': _timed('db', warm_db),
+    }
+    logger.info(
+        "warmup in %.0f ms (pid %s): %s",
+        sum(timings.values()), os.getpid(),
+        ", ".join(f"{name} {timings[name]:.0f} ms ({counts[name]})" for name in counts),
+    )
+
+
+def report_startup(started):
+    """Log how long loading the application took, split into warmup and everything else
+    (imports, settings, app registry, middleware)."""
+    total = (time.perf_counter() - started) * 1000
+    warm = sum(timings.values())
+    logger.info("application loaded in %.0f ms (pid %s): imports and setup %.0f ms, warmup %.0f ms",
+                total, os.getpid(), total - warm, warm)
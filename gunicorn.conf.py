@@ -0,0 +1,36 @@
+# Picked up automatically by `gunicorn config.wsgi` when run from the project root.
+import os
+
+# load (and warm, see core.warmup) the app once in the master; workers are forked from it
+# with URLs resolved and templates compiled, so a fresh or recycled worker serves its first
+# request at steady-state latency and shares that memory copy-on-write
+preload_app = True
+os.environ.setdefault("WARMUP_ON_STARTUP", "True")
+
+# ASGI=True serves config.asgi with uvicorn workers, which switches the catalog pages to their
+# async views (see library/urls.py); the default is the WSGI app with sync workers
+if os.environ.get("ASGI", "False") == "True":
+    wsgi_app = "config.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "config.wsgi:application"
+
+
+def post_worker_init(worker):
+    # the master closed its connections (and pool) before forking; open this worker's own now
+    # rather than on its first request. With the Postgres pool this fills it to min_size.
+    from django.db import connections
+    # Under uvicorn workers this runs on the event-loop thread, which never queries: async
+    # views run their ORM calls in sync_to_async threads. Kept, the connection would hold a pool
+    # slot (or a server connection) for nothing, so it is handed back once it has connected.
+    asgi = type(worker).__name__ == "UvicornWorker"
+    for conn in connections.all():
+        conn.ensure_connection()
+        if asgi:
+            conn.close()
+
+
+def worker_exit(server, worker):
+    # flush buffered visit log lines before the worker goes away
+    from core.visitlog import get_writer
+    get_writer().close()
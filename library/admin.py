@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Category, Author, Book, Borrow, Review
+from django.utils import timezone
+
+from . import services
+from .models import Category, Author, Book, Borrow, BorrowNotification, Hold, RecommendationRun, Review
+from .pagination import EstimatedCountPaginator
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -18,20 +22,86 @@ class BookAdmin(admin.ModelAdmin):
     list_display = ('id','title','author','category','total_copies','available_copies','created_at')
     list_filter = ('category','language')
     search_fields = ('title','author__name')
+    list_select_related = ('author','category')
+    raw_id_fields = ('author',)
     list_per_page = 25
 
+class BorrowStatusFilter(admin.SimpleListFilter):
+    # each choice is a range on borrow_due_idx (returned_at, expected_return_at)
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return (('open', 'On loan'), ('overdue', 'Overdue'), ('returned', 'Returned'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'open':
+            return queryset.filter(returned_at__isnull=True)
+        if self.value() == 'overdue':
+            return queryset.filter(returned_at__isnull=True, expected_return_at__lt=timezone.now())
+        if self.value() == 'returned':
+            return queryset.filter(returned_at__isnull=False)
+        return queryset
+
+
+# Borrow and Review grow to millions of rows: FKs are joined in the list query and edited by id,
+# the page count is the planner's estimate, and search sticks to exact / prefix matches
 @admin.register(Borrow)
 class BorrowAdmin(admin.ModelAdmin):
     list_display = ('id','user','book','borrowed_at','expected_return_at','returned_at')
-    list_filter = ('returned_at',)
-    search_fields = ('user__username','book__title')
+    list_filter = (BorrowStatusFilter, 'returned_at')
+    list_select_related = ('user','book')
+    search_fields = ('=user__username','^book__title')
+    search_help_text = "Exact username, or the start of a book title."
+    raw_id_fields = ('user','book')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('mark_returned','extend_due_date')
     list_per_page = 25
 
+    @admin.action(description="Mark selected borrows as returned")
+    def mark_returned(self, request, queryset):
+        returned = services.return_borrows(queryset)
+        self.message_user(request, f"{returned} borrow(s) marked as returned.")
+
+    @admin.action(description=f"Extend due date by {services.BORROW_DAYS} days")
+    def extend_due_date(self, request, queryset):
+        extended = services.extend_borrows(queryset)
+        self.message_user(request, f"{extended} open borrow(s) extended.")
+
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('id','user','book','stars','created_at')
     list_filter = ('stars',)
+    list_select_related = ('user','book')
+    search_fields = ('=user__username','^book__title')
+    search_help_text = "Exact username, or the start of a book title."
+    raw_id_fields = ('user','book')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 25
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('id','user','book','status','created_at','ready_at','expires_at')
+    list_filter = ('status',)
     search_fields = ('user__username','book__title')
+    list_select_related = ('user','book')
+    raw_id_fields = ('user','book')
+    list_per_page = 25
+
+@admin.register(BorrowNotification)
+class BorrowNotificationAdmin(admin.ModelAdmin):
+    list_display = ('id','user','kind','created_at','sent_at','attempts','last_error')
+    list_filter = ('kind','sent_at')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    raw_id_fields = ('borrow','hold','user')
     list_per_page = 25
 from django.contrib import admin
 
+@admin.register(RecommendationRun)
+class RecommendationRunAdmin(admin.ModelAdmin):
+    list_display = ('id','full','last_borrow_id','pairs','books','seconds','finished_at')
+    list_filter = ('full',)
+    list_per_page = 25
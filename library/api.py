@@ -0,0 +1,203 @@
+import hashlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from core.cache import get_versions
+
+from .models import Author, Book, Category, Review
+from .pagination import KeysetPaginator
+from .search import get_backend as get_search_backend
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# public field name -> values() path
+BOOK_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'author_id': 'author_id',
+    'author': 'author__name',
+    'category_id': 'category_id',
+    'category': 'category__name',
+    'publication_year': 'publication_year',
+    'pages': 'pages',
+    'language': 'language',
+    'description': 'description',
+    'cover': 'cover',
+    'total_copies': 'total_copies',
+    'available_copies': 'available_copies',
+    'avg_rating': 'avg_rating',
+    'rating_count': 'rating_count',
+    'created_at': 'created_at',
+}
+BOOK_LIST_DEFAULT = ('id', 'title', 'author', 'category', 'available_copies', 'avg_rating', 'created_at')
+BOOK_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'rated': ('-avg_rating', '-id'),
+}
+
+AUTHOR_FIELDS = {'id': 'id', 'name': 'name', 'bio': 'bio', 'photo': 'photo'}
+CATEGORY_FIELDS = {'id': 'id', 'name': 'name', 'icon': 'icon'}
+REVIEW_FIELDS = {
+    'id': 'id',
+    'book_id': 'book_id',
+    'user': 'user__username',
+    'stars': 'stars',
+    'comment': 'comment',
+    'created_at': 'created_at',
+}
+FILE_FIELDS = {'cover', 'photo'}
+
+
+class ApiError(Exception):
+    pass
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=DjangoJSONEncoder().default)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+def select_fields(request, available, default=None):
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(default or available)
+    names = [f.strip() for f in requested.split(',') if f.strip()]
+    unknown = [f for f in names if f not in available]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}")
+    return names
+
+
+def project(rows, names, mapping):
+    media = settings.MEDIA_URL
+    out = []
+    for row in rows:
+        item = {name: row[mapping[name]] for name in names}
+        for name in FILE_FIELDS.intersection(names):
+            if item[name]:
+                item[name] = media + item[name]
+        out.append(item)
+    return out
+
+
+def conditional(*tables):
+    """Answer from the per-table change versions alone: a matching If-None-Match /
+    If-Modified-Since gets a 304 before any query runs."""
+    def decorator(view):
+        @require_safe
+        def wrapper(request, *args, **kwargs):
+            versions = get_versions(*tables)
+            digest = hashlib.sha1(
+                f"{request.get_full_path()}|{'|'.join(map(str, versions))}".encode()
+            ).hexdigest()
+            etag = f'"{digest}"'
+            last_modified = max(versions) // 1_000_000_000
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                try:
+                    response = view(request, *args, **kwargs)
+                except ApiError as exc:
+                    return json_response({'error': str(exc)}, status=400)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'public, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def not_found():
+    return json_response({'error': 'Not found.'}, status=404)
+
+
+def page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE))
+    except ValueError:
+        raise ApiError("limit must be an integer")
+
+
+def keyset_response(request, qs, ordering, names, mapping):
+    paths = {mapping[n] for n in names} | {o.lstrip('-') for o in ordering}
+    paginator = KeysetPaginator(qs.values(*paths), ordering, page_size(request))
+    page = paginator.get_page(request.GET.get('cursor'))
+    return json_response({
+        'results': project(page.object_list, names, mapping),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@conditional('library.book', 'library.author', 'library.category')
+def book_list(request):
+    names = select_fields(request, BOOK_FIELDS, BOOK_LIST_DEFAULT)
+    qs = Book.objects.all()
+    q = request.GET.get('q', '').strip()
+    if q:
+        qs = get_search_backend().filter(qs, q)
+    category = request.GET.get('category', '').strip()
+    if category.isdigit():
+        qs = qs.filter(category_id=category)
+    author = request.GET.get('author', '').strip()
+    if author.isdigit():
+        qs = qs.filter(author_id=author)
+    ordering = BOOK_ORDERINGS.get(request.GET.get('sort'), BOOK_ORDERINGS['newest'])
+    return keyset_response(request, qs, ordering, names, BOOK_FIELDS)
+
+
+@conditional('library.book', 'library.author', 'library.category')
+def book_item(request, id):
+    names = select_fields(request, BOOK_FIELDS)
+    row = Book.objects.filter(id=id).values(*{BOOK_FIELDS[n] for n in names}).first()
+    if row is None:
+        return not_found()
+    return json_response(project([row], names, BOOK_FIELDS)[0])
+
+
+@conditional('library.review', 'library.book', 'auth.user')
+def book_reviews(request, id):
+    names = select_fields(request, REVIEW_FIELDS)
+    if not Book.objects.filter(id=id).exists():
+        return not_found()
+    qs = Review.objects.filter(book_id=id)
+    return keyset_response(request, qs, ('-created_at', '-id'), names, REVIEW_FIELDS)
+
+
+@conditional('library.author')
+def author_list(request):
+    names = select_fields(request, AUTHOR_FIELDS, ('id', 'name', 'photo'))
+    return keyset_response(request, Author.objects.all(), ('name', 'id'), names, AUTHOR_FIELDS)
+
+
+@conditional('library.author')
+def author_item(request, id):
+    names = select_fields(request, AUTHOR_FIELDS)
+    row = Author.objects.filter(id=id).values(*{AUTHOR_FIELDS[n] for n in names}).first()
+    if row is None:
+        return not_found()
+    return json_response(project([row], names, AUTHOR_FIELDS)[0])
+
+
+@conditional('library.category')
+def category_list(request):
+    names = select_fields(request, CATEGORY_FIELDS)
+    rows = Category.objects.order_by('name').values(*{CATEGORY_FIELDS[n] for n in names})
+    return json_response({'results': project(rows, names, CATEGORY_FIELDS)})
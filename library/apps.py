@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LibraryConfig(AppConfig):
     name = 'library'
+
+    def ready(self):
+        import library.signals
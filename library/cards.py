@@ -0,0 +1,79 @@
+"""Cached book-card fragments shared by the listing templates.
+
+A card's cache key is the book id plus a digest of everything the card shows (title,
+names, availability, cover thumbnails) and of the card templates themselves, so a save,
+a borrow/return flipping availability, or a template change all land on a new key
+without explicit invalidation. A page of cards costs one get_many() on the "fragments"
+cache plus a render for the misses only.
+"""
+import hashlib
+
+from django.core.cache import caches
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = 'library/_book_card.html'
+CARD_TTL = 60 * 60 * 24
+
+# which lines each listing shows under the title (the related names must be select_related there)
+VARIANTS = {
+    'catalog': {'lines': ('author', 'category'), 'badge': True, 'details': True},
+    'category': {'lines': ('author',), 'badge': True, 'details': False},
+    'author': {'lines': ('category',), 'badge': True, 'details': False},
+    'home': {'lines': ('author_and_category',), 'badge': False, 'details': False},
+}
+
+_template_version = None
+
+
+def template_version():
+    # the card markup is part of every key; changes to it need no manual cache flush
+    global _template_version
+    if _template_version is None:
+        sources = [get_template(name).template.source for name in (CARD_TEMPLATE, 'library/_responsive_img.html')]
+        _template_version = hashlib.blake2b('\0'.join(sources).encode(), digest_size=6).hexdigest()
+    return _template_version
+
+
+def card_context(book, variant):
+    spec = VARIANTS[variant]
+    lines = []
+    for line in spec['lines']:
+        if line == 'author':
+            lines.append(book.author.name)
+        elif line == 'category':
+            lines.append(book.category.name)
+        else:
+            lines.append(f"{book.author.name} • {book.category.name}")
+    thumbs = book.cover_thumbs or {}
+    return {
+        'book': book,
+        'lines': lines,
+        'badge': spec['badge'],
+        'available': book.is_available,
+        'details': f"{book.publication_year} • {book.pages} pages • {book.language}" if spec['details'] else '',
+        # not rendered directly, but the cover markup depends on them
+        '_cover': (book.cover.name, thumbs.get('source'), thumbs.get('hash'), tuple(thumbs.get('widths', ()))),
+    }
+
+
+def card_key(ctx, variant):
+    shown = (ctx['book'].title, ctx['lines'], ctx['badge'] and ctx['available'], ctx['details'], ctx['_cover'])
+    digest = hashlib.blake2b(repr(shown).encode(), digest_size=8).hexdigest()
+    return f"card:{template_version()}:{variant}:{ctx['book'].pk}:{digest}"
+
+
+def render_cards(books, variant):
+    contexts = [card_context(book, variant) for book in books]
+    keys = [card_key(ctx, variant) for ctx in contexts]
+    cache = caches['fragments']
+    cached = cache.get_many(keys)
+
+    missing = {}
+    for key, ctx in zip(keys, contexts):
+        if key not in cached:
+            missing[key] = render_to_string(CARD_TEMPLATE, ctx)
+    if missing:
+        cache.set_many(missing, CARD_TTL)
+    cached.update(missing)
+    return mark_safe(''.join(cached[key] for key in keys))
@@ -0,0 +1,112 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.functions import Now
+
+from core.cache import HOME_LATEST, HOME_TOP_RATED, invalidate, touch
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (160, 320, 640)
+FORMATS = (('WEBP', 'webp'), ('JPEG', 'jpg'))
+QUALITY = 80
+
+# one background thread per process; uploads only pay for a submit()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+
+
+def derivative_name(name, digest, width, ext):
+    base, _ = os.path.splitext(name)
+    return f"{base}.{digest}.w{width}.{ext}"
+
+
+def render_derivatives(source_path, widths=WIDTHS):
+    """Write resized WebP and JPEG copies next to `source_path`.
+
+    File names carry a hash of the original's bytes, so a replaced upload never reuses
+    a cached URL. Doesn't import Django models, so it can run in a process pool.
+    """
+    from PIL import Image, ImageOps
+
+    with open(source_path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        done = []
+        for width in sorted(widths):
+            if done and width >= image.width:
+                break  # never upscale; the smallest width is always produced
+            resized = image.copy()
+            resized.thumbnail((width, width * 10), Image.LANCZOS)
+            for fmt, ext in FORMATS:
+                target = derivative_name(source_path, digest, width, ext)
+                if os.path.exists(target):
+                    continue
+                out = resized
+                if fmt == 'JPEG' and out.mode == 'RGBA':
+                    out = Image.new('RGB', out.size, (255, 255, 255))
+                    out.paste(resized, mask=resized.getchannel('A'))
+                tmp = f"{target}.tmp"
+                out.save(tmp, fmt, quality=QUALITY, optimize=True)
+                os.replace(tmp, target)
+            done.append(width)
+
+        return {'hash': digest, 'widths': done, 'width': image.width, 'height': image.height}
+
+
+def needs_derivatives(instance, field_name):
+    field_file = getattr(instance, field_name)
+    thumbs = getattr(instance, f'{field_name}_thumbs') or {}
+    return bool(field_file) and thumbs.get('source') != field_file.name
+
+
+def store_manifest(model, pk, field_name, name, manifest):
+    manifest['source'] = name
+    # conditional on the file name: a newer upload must not get an older manifest
+    changes = {f'{field_name}_thumbs': manifest}
+    if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+        changes['updated_at'] = Now()
+    if model.objects.filter(pk=pk, **{field_name: name}).update(**changes):
+        transaction.on_commit(lambda: manifest_stored(model))
+
+
+def manifest_stored(model):
+    # srcsets live in the cached home page and behind the page/API validators
+    label = model._meta.label_lower
+    if label in ('library.book', 'library.author'):
+        invalidate(HOME_LATEST, HOME_TOP_RATED)
+        touch(label)
+
+
+def _build(model, pk, field_name, name):
+    close_old_connections()
+    try:
+        store_manifest(model, pk, field_name, name, render_derivatives(default_storage.path(name)))
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", name)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance, field_name):
+    if not needs_derivatives(instance, field_name):
+        return
+    model, pk, name = type(instance), instance.pk, getattr(instance, field_name).name
+    transaction.on_commit(lambda: _executor.submit(_build, model, pk, field_name, name))
+
+
+def srcset(field_file, thumbs, ext):
+    return ', '.join(
+        f"{default_storage.url(derivative_name(field_file.name, thumbs['hash'], w, ext))} {w}w"
+        for w in thumbs['widths']
+    )
@@ -0,0 +1,48 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from library.models import Author, Book
+
+
+class Command(BaseCommand):
+    help = "Compare latency of the JSON API against the equivalent HTML views (in-process test client)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        book = Book.objects.order_by('id').first()
+        author = Author.objects.order_by('id').first()
+        if book is None or author is None:
+            self.stderr.write("Need at least one book and author.")
+            return
+
+        pairs = [
+            ('book list', '/books/', '/api/books/'),
+            ('book detail', f'/book/{book.id}/', f'/api/books/{book.id}/'),
+            ('authors', '/authors/', '/api/authors/'),
+            ('author books', f'/author/{author.id}/', f'/api/books/?author={author.id}'),
+        ]
+        client = Client()
+        self.stdout.write(f"{'':14}{'html p50':>10}{'html p95':>10}{'api p50':>10}{'api p95':>10}{'api 304':>10}  (ms)")
+        for label, html_url, api_url in pairs:
+            html = self.measure(client, html_url, n)
+            api = self.measure(client, api_url, n)
+            etag = client.get(api_url)['ETag']
+            not_modified = self.measure(client, api_url, n, HTTP_IF_NONE_MATCH=etag)
+            self.stdout.write(
+                f"{label:14}{html[0]:10.2f}{html[1]:10.2f}{api[0]:10.2f}{api[1]:10.2f}{not_modified[0]:10.2f}"
+            )
+
+    def measure(self, client, url, n, **headers):
+        timings = []
+        for _ in range(n):
+            started = time.perf_counter()
+            client.get(url, **headers)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
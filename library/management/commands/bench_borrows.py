@@ -0,0 +1,137 @@
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection
+from django.http import Http404
+
+from library import services
+from library.models import Author, Book, Borrow, Category
+
+from .bench_holds import percentile
+
+USER_PREFIX = 'borrow_bench_'
+
+
+class Command(BaseCommand):
+    help = ("Load-test borrowing: many simultaneous borrows of one title with few copies, then a mixed "
+            "borrow/return load. Checks that no copy is oversold, then cleans up.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--borrowers', type=int, default=500, help="Simultaneous borrows of the title.")
+        parser.add_argument('--copies', type=int, default=20)
+        parser.add_argument('--mixed-ops', type=int, default=2000, help="Borrow/return calls in the mixed phase.")
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Leave the bench book and users in place.")
+
+    def handle(self, *args, **options):
+        borrowers, copies = options['borrowers'], options['copies']
+        if borrowers <= copies:
+            raise CommandError("--borrowers must exceed --copies, or nobody is turned away.")
+        author, category = Author.objects.first(), Category.objects.first()
+        if author is None or category is None:
+            raise CommandError("Need at least one author and category (run seed_catalog).")
+
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+        book = Book.objects.create(
+            title="Borrow Bench Title", author=author, category=category, publication_year=2000, pages=1,
+            language="English", description="borrow benchmark", total_copies=copies, available_copies=copies,
+        )
+        users = User.objects.bulk_create([User(username=f"{USER_PREFIX}{i}") for i in range(borrowers)])
+        self.random = random.Random(options['seed'])
+        self.pool = ThreadPoolExecutor(max_workers=options['threads'])
+        try:
+            self.rush(book, users)
+            self.mixed(book, users, options['mixed_ops'])
+        finally:
+            self.pool.shutdown()
+            if not options['keep']:
+                User.objects.filter(username__startswith=USER_PREFIX).delete()
+                book.delete()
+
+    def call(self, fn, *args):
+        """Run one service call on a fresh connection; returns (outcome, seconds)."""
+        connection.ensure_connection()
+        started = time.perf_counter()
+        try:
+            fn(*args)
+            outcome = 'ok'
+        except services.BorrowError as exc:
+            outcome = type(exc).__name__
+        except Http404:
+            outcome = 'not_found'
+        except IntegrityError as exc:
+            # book_available_copies_in_range (or any other constraint) refused a write
+            outcome = f'integrity_error: {exc}'
+        finally:
+            connection.close()
+        return outcome, time.perf_counter() - started
+
+    def phase(self, calls):
+        started = time.perf_counter()
+        results = list(self.pool.map(lambda c: self.call(*c), calls))
+        return results, time.perf_counter() - started
+
+    def report(self, label, results, wall):
+        ms = [seconds * 1000 for _, seconds in results]
+        outcomes = Counter(outcome.split(':')[0] for outcome, _ in results)
+        self.stdout.write(
+            f"{label:8}{len(ms):7}{percentile(ms, .5):9.2f}{percentile(ms, .95):9.2f}{percentile(ms, .99):9.2f}"
+            f"{len(ms) / wall:9.0f}/s  " + ', '.join(f"{k} {v}" for k, v in sorted(outcomes.items()))
+        )
+        return outcomes
+
+    def rush(self, book, users):
+        # everyone asks for the same title at once; exactly `copies` of them may get it
+        results, wall = self.phase([(services.borrow_book, user, book.id) for user in users])
+        self.stdout.write(f"{'':8}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'rate':>11}  (ms)")
+        outcomes = self.report('rush', results, wall)
+        book.refresh_from_db()
+        problems = self.accounting(book)
+        if outcomes['ok'] != book.total_copies:
+            problems.append(f"{outcomes['ok']} borrows succeeded for {book.total_copies} copies")
+        if book.available_copies != 0:
+            problems.append(f"{book.available_copies} copies left on the shelf after the rush")
+        self.fail_on(problems, results)
+
+    def mixed(self, book, users, ops):
+        # the current borrowers plus as many others: about half the calls are returns, and
+        # a return races the borrows that want the copy it frees
+        on_loan = set(Borrow.objects.filter(book=book, returned_at__isnull=True).values_list('user_id', flat=True))
+        others = [u for u in users if u.id not in on_loan]
+        players = [u for u in users if u.id in on_loan] + self.random.sample(others, min(len(on_loan), len(others)))
+        calls = [(self.borrow_or_return, self.random.choice(players), book.id) for _ in range(ops)]
+        results, wall = self.phase(calls)
+        self.report('mixed', results, wall)
+        book.refresh_from_db()
+        self.fail_on(self.accounting(book), results)
+        self.stdout.write(self.style.SUCCESS("No copy oversold; copy accounting OK."))
+
+    def borrow_or_return(self, user, book_id):
+        borrow_id = Borrow.objects.filter(user=user, book_id=book_id, returned_at__isnull=True) \
+            .values_list('id', flat=True).first()
+        if borrow_id is None:
+            services.borrow_book(user, book_id)
+        else:
+            services.return_borrow(user, borrow_id)
+
+    def accounting(self, book):
+        problems = []
+        on_loan = Borrow.objects.filter(book=book, returned_at__isnull=True).count()
+        if not 0 <= book.available_copies <= book.total_copies:
+            problems.append(f"available_copies {book.available_copies} outside 0..{book.total_copies}")
+        if book.available_copies + on_loan != book.total_copies:
+            problems.append(f"copies don't add up: {book.available_copies} shelf + {on_loan} on loan "
+                            f"!= {book.total_copies}")
+        return problems
+
+    def fail_on(self, problems, results):
+        errors = [outcome for outcome, _ in results if outcome.startswith('integrity_error')]
+        if errors:
+            problems.append(f"{len(errors)} writes rejected by a constraint, e.g. {errors[0]}")
+        if problems:
+            raise CommandError("; ".join(problems))
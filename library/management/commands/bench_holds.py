@@ -0,0 +1,121 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+
+from library import services
+from library.models import Author, Book, Borrow, Category, Hold
+
+USER_PREFIX = 'hold_bench_'
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * p) - 1)] if values else 0
+
+
+class Command(BaseCommand):
+    help = ("Load-test the hold queue: thousands of holds on one popular title, copies returned and "
+            "picked up by concurrent threads. Checks FIFO order and copy accounting, then cleans up.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--holds', type=int, default=2000)
+        parser.add_argument('--copies', type=int, default=20)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--keep', action='store_true', help="Leave the bench book and users in place.")
+
+    def handle(self, *args, **options):
+        n_holds, copies = options['holds'], options['copies']
+        author, category = Author.objects.first(), Category.objects.first()
+        if author is None or category is None:
+            raise CommandError("Need at least one author and category (run seed_catalog).")
+
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+        book = Book.objects.create(
+            title="Hold Bench Title", author=author, category=category, publication_year=2000, pages=1,
+            language="English", description="hold queue benchmark", total_copies=copies, available_copies=copies,
+        )
+        users = User.objects.bulk_create([User(username=f"{USER_PREFIX}{i}") for i in range(copies + n_holds)])
+        borrowers, holders = users[:copies], users[copies:]
+        self.pool = ThreadPoolExecutor(max_workers=options['threads'])
+        try:
+            self.run(book, borrowers, holders)
+        finally:
+            self.pool.shutdown()
+            if not options['keep']:
+                User.objects.filter(username__startswith=USER_PREFIX).delete()
+                book.delete()
+
+    def timed(self, fn, *args):
+        def call():
+            connection.ensure_connection()
+            started = time.perf_counter()
+            try:
+                fn(*args)
+                return time.perf_counter() - started
+            finally:
+                connection.close()
+        return call
+
+    def phase(self, fn, arg_lists):
+        return list(self.pool.map(lambda call: call(), [self.timed(fn, *args) for args in arg_lists]))
+
+    def run(self, book, borrowers, holders):
+        self.phase(services.borrow_book, [(u, book.id) for u in borrowers])
+
+        started = time.perf_counter()
+        hold_times = self.phase(services.place_hold, [(u, book.id) for u in holders])
+        hold_wall = time.perf_counter() - started
+
+        # each round: every current borrower returns at once (each copy goes to the next hold),
+        # then everyone whose hold just became ready picks the copy up
+        return_times, pickup_times = [], []
+        current = list(borrowers)
+        started = time.perf_counter()
+        while True:
+            borrows = list(Borrow.objects.filter(book=book, returned_at__isnull=True).values_list('id', 'user_id'))
+            by_user = {u.id: u for u in current}
+            return_times += self.phase(services.return_borrow, [(by_user[uid], bid) for bid, uid in borrows])
+            ready = list(Hold.objects.filter(book=book, status=Hold.READY).select_related('user'))
+            if not ready:
+                break
+            pickup_times += self.phase(services.borrow_book, [(h.user, book.id) for h in ready])
+            current = [h.user for h in ready]
+        drain_wall = time.perf_counter() - started
+
+        self.stdout.write(f"{'':14}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+        for label, values in (('place_hold', hold_times), ('return', return_times), ('pickup', pickup_times)):
+            ms = [v * 1000 for v in values]
+            self.stdout.write(
+                f"{label:14}{len(ms):7}{percentile(ms, .5):9.2f}{percentile(ms, .95):9.2f}{percentile(ms, .99):9.2f}"
+            )
+        self.stdout.write(f"holds placed: {len(hold_times) / hold_wall:.0f}/s; "
+                          f"queue drained: {len(pickup_times) / drain_wall:.0f} hand-overs/s")
+        self.check_invariants(book, len(holders))
+
+    def check_invariants(self, book, n_holds):
+        book.refresh_from_db()
+        statuses = dict(Hold.objects.filter(book=book).values_list('status').annotate(n=Count('id')).order_by())
+        ready_order = list(Hold.objects.filter(book=book, ready_at__isnull=False).order_by('ready_at', 'id')
+                           .values_list('id', flat=True))
+        problems = []
+        if statuses.get(Hold.FULFILLED, 0) != n_holds:
+            problems.append(f"expected {n_holds} fulfilled holds, got {statuses}")
+        if ready_order != sorted(ready_order):
+            problems.append("holds were not served in FIFO order")
+        on_loan = Borrow.objects.filter(book=book, returned_at__isnull=True).count()
+        held = Hold.objects.filter(book=book, status=Hold.READY).count()
+        if book.available_copies + on_loan + held != book.total_copies:
+            problems.append(f"copies don't add up: {book.available_copies} shelf + {on_loan} on loan + "
+                            f"{held} held != {book.total_copies}")
+        doubled = (Borrow.objects.filter(book=book).values('user').annotate(n=Count('id', filter=Q(returned_at__isnull=True)))
+                   .filter(n__gt=1).count())
+        if doubled:
+            problems.append(f"{doubled} users hold two copies at once")
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("FIFO order and copy accounting OK."))
@@ -0,0 +1,352 @@
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.cookies import SimpleCookie
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from library.models import Author, Book, Borrow, Category
+from library.services import MAX_BORROW_LIMIT
+
+SEARCH_TERMS = ("python", "history", "machine learning", "design", "ocean", "clean code")
+
+# name -> (path builder, needs login)
+SCENARIOS = {
+    'home': (lambda ctx, rng: '/', False),
+    'books_newest': (lambda ctx, rng: '/books/?sort=newest', False),
+    'books_oldest': (lambda ctx, rng: '/books/?sort=oldest', False),
+    'books_rated': (lambda ctx, rng: '/books/?sort=rated', False),
+    'books_search': (lambda ctx, rng: f"/books/?q={rng.choice(SEARCH_TERMS).replace(' ', '+')}", False),
+    'book_detail': (lambda ctx, rng: f"/book/{rng.choice(ctx['book_ids'])}/", False),
+    'categories': (lambda ctx, rng: '/categories/', False),
+    'category_books': (lambda ctx, rng: f"/category/{rng.choice(ctx['category_ids'])}/", False),
+    'authors': (lambda ctx, rng: '/authors/', False),
+    'author_detail': (lambda ctx, rng: f"/author/{rng.choice(ctx['author_ids'])}/", False),
+    'my_books': (lambda ctx, rng: '/my-books/', True),
+    'borrow_return': (None, True),  # borrow an available book, then return it; timed as two samples
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * p) - 1)]
+
+
+class HttpSession:
+    """One keep-alive connection plus a cookie jar; no redirects are followed."""
+
+    def __init__(self, host, port, cookies=None):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookies = dict(cookies or {})
+
+    def get(self, path):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        try:
+            self.conn.request('GET', path, headers=headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # the server closed the idle connection (gunicorn sync workers do); retry once
+            self.conn.close()
+            self.conn.request('GET', path, headers=headers)
+            response = self.conn.getresponse()
+        response.read()
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for key, morsel in SimpleCookie(header).items():
+                self.cookies[key] = morsel.value
+        queries = response.getheader('X-Query-Count')
+        return response.status, int(queries) if queries is not None else None
+
+
+class Command(BaseCommand):
+    help = ("Drive the public and authenticated views through the test client or a local gunicorn and "
+            "report p50/p95/p99 latency, queries per request and throughput. Seed data with seed_catalog.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Repeatable; default all.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--url', help="Benchmark a running server (e.g. http://127.0.0.1:8000) instead of the test client.")
+        parser.add_argument('--gunicorn', action='store_true', help="Start a local gunicorn and benchmark it over HTTP.")
+        parser.add_argument('--bind', default='127.0.0.1:8765')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--asgi', action='store_true',
+                            help="With --gunicorn, serve config.asgi with uvicorn workers (async views).")
+        parser.add_argument('--profiling', action='store_true',
+                            help="With --gunicorn, turn the query profiler on for q/req; its overhead is in the latencies.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Client threads in HTTP mode.")
+        parser.add_argument('--save-baseline', metavar='PATH')
+        parser.add_argument('--baseline', metavar='PATH', help="Compare against a saved baseline.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 slowdown (0.2 = 20%%).")
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        ctx = self.context()
+        names = options['scenario'] or list(SCENARIOS)
+
+        server = None
+        if options['gunicorn']:
+            server = self.start_gunicorn(options['bind'], options['workers'], options['asgi'], options['profiling'])
+            options['url'] = f"http://{options['bind']}"
+        try:
+            results = {}
+            for name in names:
+                if SCENARIOS[name][1] and not ctx['users']:
+                    self.stderr.write(f"skipping {name}: no non-staff user with free borrow slots")
+                    continue
+                if options['url']:
+                    results.update(self.run_http(name, ctx, options['url']))
+                else:
+                    results.update(self.run_client(name, ctx))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(10)
+
+        meta = {
+            'mode': 'gunicorn' if options['gunicorn'] else ('http' if options['url'] else 'client'),
+            'workers': options['workers'] if options['gunicorn'] else None,
+            'server': ('asgi' if options['asgi'] else 'wsgi') if options['gunicorn'] else None,
+            'profiling': options['profiling'] if options['gunicorn'] else None,
+            'concurrency': options['concurrency'] if options['url'] else 1,
+            'books': len(ctx['book_ids']),
+            'database': connection.vendor,
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        baseline = None
+        if options['baseline']:
+            baseline = self.load_baseline(options['baseline'])
+            before = baseline.get('meta', {})
+            if (before.get('mode'), before.get('concurrency')) != (meta['mode'], meta['concurrency']):
+                self.stdout.write(self.style.WARNING(
+                    f"Baseline was recorded in {before.get('mode')} mode with concurrency "
+                    f"{before.get('concurrency')}; latencies are not comparable."
+                ))
+            elif before.get('server') != meta['server']:
+                self.stdout.write(f"Comparing {meta['server']} against a {before.get('server')} baseline.")
+            if before.get('profiling', meta['profiling']) != meta['profiling']:
+                self.stdout.write(self.style.WARNING(
+                    "Baseline was recorded with the query profiler "
+                    f"{'on' if before.get('profiling') else 'off'}; its overhead skews the comparison."
+                ))
+            baseline = baseline['results']
+        regressions = self.report(results, baseline, options['tolerance'])
+
+        if options['save_baseline']:
+            path = Path(options['save_baseline'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({'meta': meta, 'results': results}, indent=2))
+            self.stdout.write(f"Baseline saved to {path}")
+        if regressions:
+            message = f"{len(regressions)} regression(s): {', '.join(regressions)}"
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+
+    def context(self):
+        book_ids = list(Book.objects.values_list('id', flat=True))
+        if not book_ids:
+            raise CommandError("No books; run seed_catalog first.")
+        users = list(
+            User.objects.filter(is_staff=False)
+            .annotate(active=Count('borrows', filter=Q(borrows__returned_at__isnull=True)))
+            .filter(active__lt=MAX_BORROW_LIMIT)
+            .order_by('-active', 'id')[:self.options['concurrency']]
+        )
+        return {
+            'book_ids': book_ids,
+            'author_ids': list(Author.objects.values_list('id', flat=True)),
+            'category_ids': list(Category.objects.values_list('id', flat=True)),
+            'users': users,
+        }
+
+    def available_book(self, rng, user):
+        held = set(Borrow.objects.filter(user=user, returned_at__isnull=True).values_list('book_id', flat=True))
+        ids = Book.objects.filter(available_copies__gt=0).values_list('id', flat=True)
+        offset = rng.randrange(max(1, ids.count()))
+        for book_id in ids[offset:offset + 20]:
+            if book_id not in held:
+                return book_id
+        return next(i for i in ids if i not in held)
+
+    def active_borrow(self, user, book_id):
+        return Borrow.objects.filter(user=user, book_id=book_id, returned_at__isnull=True).values_list('id', flat=True).first()
+
+    # --- test client ----------------------------------------------------------
+
+    def run_client(self, name, ctx):
+        client = Client()
+        user = ctx['users'][0]
+        if SCENARIOS[name][1]:
+            client.force_login(user)
+
+        def timed(path):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(path)
+                elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise CommandError(f"{name}: GET {path} returned {response.status_code}")
+            return elapsed, len(captured)
+
+        samples = {}
+        total = self.options['warmup'] + self.options['requests']
+        started = time.perf_counter()
+        for i in range(total):
+            if i == self.options['warmup']:
+                samples.clear()
+                started = time.perf_counter()
+            if name == 'borrow_return':
+                book_id = self.available_book(self.rng, user)
+                samples.setdefault('borrow', []).append(timed(f"/borrow/{book_id}/"))
+                borrow_id = self.active_borrow(user, book_id)
+                if borrow_id:
+                    samples.setdefault('return', []).append(timed(f"/return/{borrow_id}/"))
+            else:
+                samples.setdefault(name, []).append(timed(SCENARIOS[name][0](ctx, self.rng)))
+        wall = time.perf_counter() - started
+        return {key: self.summarize(values, wall) for key, values in samples.items()}
+
+    # --- HTTP (gunicorn or any running server) --------------------------------
+
+    def run_http(self, name, ctx, url):
+        host, _, port = url.split('://', 1)[-1].rstrip('/').partition(':')
+        port = int(port or 80)
+        concurrency = self.options['concurrency']
+        per_thread = max(1, self.options['requests'] // concurrency)
+        samples, errors, lock = {}, [], threading.Lock()
+        barrier = threading.Barrier(concurrency)
+
+        def worker(index):
+            rng = random.Random(self.options['seed'] * 1000 + index)
+            user = ctx['users'][index % len(ctx['users'])]
+            cookies = {}
+            if SCENARIOS[name][1]:
+                client = Client()
+                client.force_login(user)
+                cookies = {key: morsel.value for key, morsel in client.cookies.items()}
+            session = HttpSession(host, port, cookies)
+            local = {}
+
+            def timed(path):
+                started = time.perf_counter()
+                status, queries = session.get(path)
+                elapsed = time.perf_counter() - started
+                if status >= 400:
+                    errors.append(f"GET {path} returned {status}")
+                return elapsed, queries
+
+            try:
+                for i in range(self.options['warmup'] // concurrency + per_thread):
+                    if i == self.options['warmup'] // concurrency:
+                        local.clear()
+                        barrier.wait()
+                    if name == 'borrow_return':
+                        book_id = self.available_book(rng, user)
+                        local.setdefault('borrow', []).append(timed(f"/borrow/{book_id}/"))
+                        borrow_id = self.active_borrow(user, book_id)
+                        if borrow_id:
+                            local.setdefault('return', []).append(timed(f"/return/{borrow_id}/"))
+                    else:
+                        local.setdefault(name, []).append(timed(SCENARIOS[name][0](ctx, rng)))
+            except (OSError, http.client.HTTPException) as exc:
+                errors.append(f"{url}: {exc}")
+                barrier.abort()  # release threads still waiting for the warmup to finish
+            except threading.BrokenBarrierError:
+                pass
+            finally:
+                close_old_connections()
+                connection.close()
+            with lock:
+                for key, values in local.items():
+                    samples.setdefault(key, []).extend(values)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+        if errors:
+            raise CommandError(f"{name}: {errors[0]} ({len(errors)} errors)")
+        return {key: self.summarize(values, wall) for key, values in samples.items()}
+
+    def start_gunicorn(self, bind, workers, asgi=False, profiling=False):
+        host, _, port = bind.partition(':')
+        env = {**os.environ, 'PROFILING_ENABLED': str(profiling), 'DJANGO_SETTINGS_MODULE': os.environ['DJANGO_SETTINGS_MODULE']}
+        app = ['config.asgi', '--worker-class', 'uvicorn_worker.UvicornWorker'] if asgi else ['config.wsgi']
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', *app, '--bind', bind, '--workers', str(workers)],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError("gunicorn exited during startup (is it installed?)")
+            try:
+                socket.create_connection((host, int(port)), timeout=1).close()
+                return process
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f"gunicorn did not start listening on {bind}")
+
+    # --- reporting ------------------------------------------------------------
+
+    def summarize(self, samples, wall):
+        timings = [s[0] * 1000 for s in samples]
+        queries = [s[1] for s in samples if s[1] is not None]
+        return {
+            'requests': len(samples),
+            'p50_ms': round(percentile(timings, 0.50), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries': round(sum(queries) / len(queries), 1) if queries else None,
+            'rps': round(len(samples) / wall, 1) if wall else None,
+        }
+
+    def load_baseline(self, path):
+        try:
+            baseline = json.loads(Path(path).read_text())
+            baseline['results']
+            return baseline
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            raise CommandError(f"Cannot read baseline {path}: {exc}")
+
+    def report(self, results, baseline, tolerance):
+        regressions = []
+        self.stdout.write(f"{'scenario':16}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'q/req':>8}{'req/s':>9}  (ms)")
+        for name, r in results.items():
+            flag = ''
+            before = (baseline or {}).get(name)
+            if before:
+                # 1ms floor so sub-millisecond jitter on fast views is not reported
+                slower = r['p95_ms'] > before['p95_ms'] * (1 + tolerance) and r['p95_ms'] - before['p95_ms'] > 1
+                more_queries = r['queries'] is not None and before.get('queries') is not None and r['queries'] > before['queries']
+                if slower or more_queries:
+                    regressions.append(name)
+                    flag = f"  REGRESSION (p95 was {before['p95_ms']}, queries {before.get('queries')})"
+            queries = '-' if r['queries'] is None else r['queries']
+            line = (f"{name:16}{r['requests']:6}{r['p50_ms']:9.2f}{r['p95_ms']:9.2f}{r['p99_ms']:9.2f}"
+                    f"{queries:>8}{r['rps'] or 0:9.1f}{flag}")
+            self.stdout.write(self.style.ERROR(line) if flag else line)
+        return regressions
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from library import recommendations
+
+
+class Command(BaseCommand):
+    help = ("Precompute \"readers who borrowed this also borrowed\" for book_detail from the Borrow history. "
+            "Incremental by default: only books of users who borrowed since the last run are recomputed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every book.")
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K)
+        parser.add_argument('--max-history', type=int, default=recommendations.MAX_HISTORY,
+                            help="Most recent distinct books per user taken into account.")
+        parser.add_argument('--min-support', type=int, default=recommendations.MIN_SUPPORT,
+                            help="Shared readers needed before a book is recommended.")
+        parser.add_argument('--max-pairs', type=int, default=recommendations.MAX_PAIRS,
+                            help="Pairs counted at once; bounds memory (about 16 bytes each).")
+
+    def handle(self, *args, **options):
+        run = recommendations.build(
+            full=options['full'],
+            top_k=options['top_k'],
+            max_history=options['max_history'],
+            min_support=options['min_support'],
+            max_pairs=options['max_pairs'],
+            progress=lambda message: self.stderr.write(message),
+        )
+        if run is None:
+            self.stdout.write("No new borrows since the last run.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Full' if run.full else 'Incremental'} build: {run.books} books from {run.pairs} "
+            f"(user, book) pairs in {run.seconds:.1f}s."
+        ))
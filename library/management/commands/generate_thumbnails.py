@@ -0,0 +1,53 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from accounts.models import Profile
+from library import images
+from library.models import Author, Book
+
+TARGETS = (
+    (Book, 'cover'),
+    (Author, 'photo'),
+    (Profile, 'photo'),
+)
+
+
+class Command(BaseCommand):
+    help = "Generate missing cover/photo thumbnails for existing uploads using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--force', action='store_true', help="Rebuild even if a manifest exists.")
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, field_name in TARGETS:
+            qs = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for obj in qs.only('pk', field_name, f'{field_name}_thumbs').iterator(chunk_size=2000):
+                if options['force'] or images.needs_derivatives(obj, field_name):
+                    name = getattr(obj, field_name).name
+                    jobs.append((model, obj.pk, field_name, name, default_storage.path(name)))
+
+        started = time.perf_counter()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(images.render_derivatives, path): job for *job, path in jobs}
+            for future in as_completed(futures):
+                model, pk, field_name, name = futures[future]
+                try:
+                    manifest = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{name}: {exc}")
+                    continue
+                images.store_manifest(model, pk, field_name, name, manifest)
+                done += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated thumbnails for {done} image(s), {failed} failed, in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,209 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+
+from core.cache import HOME_LATEST, HOME_STATS, HOME_TOP_RATED, invalidate, touch
+from library.models import Author, Book, Category
+from library.search import get_backend
+
+# columns shared with export_catalog; "id" is optional and turns the row into an upsert
+INT_FIELDS = ('publication_year', 'pages', 'total_copies', 'available_copies')
+# available_copies is not overwritten on upsert: it moves by the change in total_copies
+UPDATE_FIELDS = ('title', 'author', 'category', 'publication_year', 'pages', 'language',
+                 'description', 'total_copies', 'available_copies')
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row, error); a malformed line comes back as its error."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as exc:
+                yield reader.line_num, None, exc
+            else:
+                yield reader.line_num, row, None
+    else:
+        for line_no, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield line_no, json.loads(line), None
+                except ValueError as exc:
+                    yield line_no, None, exc
+
+
+class Command(BaseCommand):
+    help = ("Stream books from CSV or JSONL into the catalog in batches. Authors and categories are matched "
+            "by name and created when missing; rows with an id update that book, the rest are inserted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV/JSONL file, or - for stdin.")
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        self.batch_size = options['batch_size']
+        self.authors = dict(Author.objects.order_by('-id').values_list('name', 'id'))  # lowest id wins on duplicates
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.search = get_backend()
+        self.inserted = self.upserted = self.skipped = self.malformed = 0
+        self.explicit_ids = False
+        self.progress_step = self.next_progress = self.batch_size * 20
+
+        started = time.perf_counter()
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as exc:
+            raise CommandError(f"Cannot open {path}: {exc.strerror}")
+        try:
+            batch = []
+            for line_no, row, error in read_rows(stream, fmt):
+                if error is not None:
+                    self.stderr.write(f"line {line_no}: malformed ({error}); skipped")
+                    self.malformed += 1
+                    continue
+                book = self.build(line_no, row)
+                if book is None:
+                    continue
+                batch.append(book)
+                if len(batch) >= self.batch_size:
+                    self.flush(batch)
+                    batch = []
+                    self.progress(started)
+            self.flush(batch)
+        except UnicodeDecodeError as exc:
+            raise CommandError(f"{path}: {exc}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            # batches already committed stay committed, so reconcile even when a later one failed
+            if self.inserted or self.upserted:
+                self.reconcile()
+
+        elapsed = time.perf_counter() - started
+        total = self.inserted + self.upserted
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total} books ({self.inserted} new, {self.upserted} upserted by id, {self.skipped} skipped, "
+            f"{self.malformed} malformed lines) in {elapsed:.1f}s, {total / elapsed if elapsed else 0:.0f} rows/s."
+        ))
+
+    def reconcile(self):
+        if self.explicit_ids:
+            # explicit primary keys don't advance the Postgres sequence
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Book, Author, Category]):
+                    cursor.execute(sql)
+        # bulk_create sends no signals; do what the Book/Author/Category handlers would have done
+        call_command('rebuild_book_counts', stdout=self.stdout)
+        invalidate(HOME_STATS, HOME_LATEST, HOME_TOP_RATED)
+        touch('library.book', 'library.author', 'library.category')
+
+    def build(self, line_no, row):
+        try:
+            title = (row.get('title') or '').strip()
+            author = (row.get('author') or '').strip()
+            category = (row.get('category') or '').strip()
+            if not (title and author and category):
+                raise ValueError("title, author and category are required")
+            values = {}
+            for field in INT_FIELDS:
+                raw = row.get(field)
+                if raw not in (None, ''):
+                    values[field] = int(raw)
+                    if values[field] < 0:
+                        raise ValueError(f"{field} must not be negative")
+            values.setdefault('total_copies', 1)
+            values.setdefault('available_copies', values['total_copies'])
+            if values['available_copies'] > values['total_copies']:
+                raise ValueError("available_copies exceeds total_copies")
+            book_id = int(row['id']) if row.get('id') not in (None, '') else None
+        except (ValueError, TypeError, AttributeError) as exc:
+            self.stderr.write(f"line {line_no}: {exc}; skipped")
+            self.skipped += 1
+            return None
+
+        book = Book(
+            id=book_id,
+            title=title[:220],
+            publication_year=values.get('publication_year', 0),
+            pages=values.get('pages', 0),
+            language=(row.get('language') or '').strip()[:60],
+            description=row.get('description') or '',
+            total_copies=values['total_copies'],
+            available_copies=values['available_copies'],
+        )
+        book._author_name, book._category_name = author[:150], category[:120]
+        return book
+
+    def resolve(self, model, names, cache):
+        missing = sorted({n for n in names if n not in cache})
+        if missing:
+            model.objects.bulk_create([model(name=n) for n in missing], ignore_conflicts=True)
+            cache.update(model.objects.filter(name__in=missing).order_by('-id').values_list('name', 'id'))
+
+    def flush(self, batch):
+        if not batch:
+            return
+        try:
+            with transaction.atomic():
+                self.resolve(Author, [b._author_name for b in batch], self.authors)
+                self.resolve(Category, [b._category_name for b in batch], self.categories)
+                for book in batch:
+                    book.author_id = self.authors[book._author_name]
+                    book.category_id = self.categories[book._category_name]
+
+                new = [b for b in batch if b.id is None]
+                existing = self.keep_loans([b for b in batch if b.id is not None])
+                Book.objects.bulk_create(new)
+                if existing:
+                    self.explicit_ids = True
+                    Book.objects.bulk_create(
+                        existing, update_conflicts=True, unique_fields=['id'],
+                        update_fields=(*UPDATE_FIELDS, 'updated_at'),
+                    )
+                self.search.index_books([b.id for b in (*new, *existing)])
+        except IntegrityError as exc:
+            # e.g. a constraint the per-row checks above do not cover
+            raise CommandError(f"Batch ending at {batch[-1].title!r} rejected: {exc}")
+        self.inserted += len(new)
+        self.upserted += len(existing)
+
+    def keep_loans(self, books):
+        """Carry the copies on loan over to the imported total_copies; drop rows that would
+        leave fewer copies than are out."""
+        current = {
+            book_id: (total, available)
+            for book_id, total, available in Book.objects.select_for_update()
+            .filter(id__in=[b.id for b in books]).values_list('id', 'total_copies', 'available_copies')
+        }
+        kept = []
+        for book in books:
+            if book.id in current:
+                total, available = current[book.id]
+                book.available_copies = available + book.total_copies - total
+                if book.available_copies < 0:
+                    self.stderr.write(f"book {book.id}: total_copies {book.total_copies} is below the "
+                                      f"{total - available} copies on loan; skipped")
+                    self.skipped += 1
+                    continue
+            kept.append(book)
+        return kept
+
+    def progress(self, started):
+        done = self.inserted + self.upserted
+        if done >= self.next_progress:
+            # rows are skipped, so done rarely lands on a multiple of the step
+            self.next_progress = (done // self.progress_step + 1) * self.progress_step
+            elapsed = time.perf_counter() - started
+            self.stderr.write(f"{done} rows, {done / elapsed:.0f} rows/s")
@@ -0,0 +1,50 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from library import notifications, services
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Queue due-soon and overdue notices for open borrows, expire unclaimed holds and email "
+            "everything queued (including holds ready for pickup), once or in a loop (--loop) as a worker.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, one pass every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=60)
+        parser.add_argument('--batch-size', type=int, default=5000, help="Borrows read per scan query.")
+        parser.add_argument('--send-batch', type=int, default=200, help="Notifications per mail connection.")
+        parser.add_argument('--no-send', action='store_true', help="Only fill the outbox.")
+        parser.add_argument('--rescan', action='store_true',
+                            help="Forget the scan watermarks and re-read all open borrows (no duplicates are queued).")
+
+    def handle(self, *args, **options):
+        if options['rescan']:
+            notifications.reset_cursors()
+        while True:
+            try:
+                self.run_once(options)
+            except Exception:
+                if not options['loop']:
+                    raise
+                logger.exception("notify_due_borrows pass failed")
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def run_once(self, options):
+        started = time.perf_counter()
+        overdue = notifications.scan(notifications.OVERDUE, batch_size=options['batch_size'])
+        due_soon = notifications.scan(notifications.DUE_SOON, batch_size=options['batch_size'])
+        expired = services.expire_holds()
+        promoted = services.promote_waiting_holds()
+        line = f"scanned {overdue} overdue, {due_soon} due soon; {expired} holds expired, {promoted} promoted"
+        if not options['no_send']:
+            sent, failed, closed = notifications.send_pending(batch_size=options['send_batch'])
+            line += f"; sent {sent}, failed {failed}, closed {closed}"
+        self.stdout.write(f"{line} in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from library.models import Author, Book, Category
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or with --check, only verify) book_count / available_book_count on categories and authors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Report drift without writing.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for model, column, label in ((Category, 'category_id', 'categories'), (Author, 'author_id', 'authors')):
+            scanned, drifted = self.reconcile(model, column, options['batch_size'], options['check'])
+            if options['check']:
+                style = self.style.SUCCESS if not drifted else self.style.WARNING
+                self.stdout.write(style(f"Checked {scanned} {label}, {drifted} out of sync."))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Checked {scanned} {label}, fixed {drifted}."))
+
+    def reconcile(self, model, column, batch_size, check_only):
+        scanned = drifted = 0
+        last_id = 0
+        now = timezone.now()
+        while True:
+            rows = list(
+                model.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'book_count', 'available_book_count')[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            totals = {
+                row[column]: (row['n'], row['available'])
+                for row in Book.objects.filter(**{f'{column}__gte': rows[0].id, f'{column}__lte': last_id})
+                .values(column)
+                .annotate(n=Count('id'), available=Count('id', filter=Q(available_copies__gt=0)))
+                .order_by()
+            }
+
+            stale = []
+            for obj in rows:
+                counts = totals.get(obj.id, (0, 0))
+                if (obj.book_count, obj.available_book_count) != counts:
+                    obj.book_count, obj.available_book_count = counts
+                    obj.updated_at = now
+                    stale.append(obj)
+
+            scanned += len(rows)
+            drifted += len(stale)
+            if stale and not check_only:
+                with transaction.atomic():
+                    model.objects.bulk_update(stale, ['book_count', 'available_book_count', 'updated_at'])
+        return scanned, drifted
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from core.cache import HOME_LATEST, HOME_TOP_RATED, invalidate, touch
+from library.models import Book, Review
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or with --check, only verify) Book.rating_sum / rating_count / avg_rating from reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Report drift without writing.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        batch_size = options['batch_size']
+
+        scanned = drifted = 0
+        last_id = 0
+        now = timezone.now()
+        while True:
+            books = list(
+                Book.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'rating_sum', 'rating_count', 'avg_rating')[:batch_size]
+            )
+            if not books:
+                break
+            last_id = books[-1].id
+
+            totals = {
+                row['book_id']: (row['s'], row['c'])
+                for row in Review.objects.filter(book_id__gte=books[0].id, book_id__lte=last_id)
+                .values('book_id')
+                .annotate(s=Sum('stars'), c=Count('id'))
+                .order_by()
+            }
+
+            stale = []
+            for book in books:
+                rating_sum, rating_count = totals.get(book.id, (0, 0))
+                avg = rating_sum / rating_count if rating_count else 0
+                if (book.rating_sum, book.rating_count) != (rating_sum, rating_count) or abs(book.avg_rating - avg) > 1e-9:
+                    book.rating_sum, book.rating_count, book.avg_rating = rating_sum, rating_count, avg
+                    book.updated_at = now
+                    stale.append(book)
+
+            scanned += len(books)
+            drifted += len(stale)
+            if stale and not check_only:
+                with transaction.atomic():
+                    Book.objects.bulk_update(stale, ['rating_sum', 'rating_count', 'avg_rating', 'updated_at'])
+
+        if check_only:
+            style = self.style.SUCCESS if not drifted else self.style.WARNING
+            self.stdout.write(style(f"Checked {scanned} books, {drifted} out of sync."))
+        else:
+            if drifted:
+                # the home page caches ratings and the API ETags hang off the book table version
+                invalidate(HOME_LATEST, HOME_TOP_RATED)
+                touch('library.book')
+            self.stdout.write(self.style.SUCCESS(f"Checked {scanned} books, fixed {drifted}."))
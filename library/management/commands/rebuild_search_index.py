@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for books from scratch."
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        started = time.perf_counter()
+        count = backend.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} books with {type(backend).__name__} in {elapsed:.2f}s."
+        ))
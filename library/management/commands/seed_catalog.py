@@ -0,0 +1,165 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Profile
+from library.models import Author, Book, Borrow, Category, Review
+
+WORDS = (
+    "data science machine learning deep python design pattern clean code system network "
+    "history habit lean startup thermodynamics dynamics engineering management leadership "
+    "algorithm theory practice modern approach guide handbook introduction advanced applied "
+    "statistics analysis probability economics biology chemistry physics art war peace river "
+    "mountain city empire ocean night garden silent journey secret light shadow future"
+).split()
+LANGUAGES = ("English", "Arabic", "French", "German", "Spanish")
+
+BENCH_PASSWORD = 'benchpass'
+USER_PREFIX = 'bench_user_'
+
+
+class Command(BaseCommand):
+    help = "Bulk-create a synthetic catalog (authors, categories, books, users, borrows, reviews) for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--authors', type=int, default=None, help="Default: books / 10.")
+        parser.add_argument('--categories', type=int, default=40)
+        parser.add_argument('--users', type=int, default=None, help="Default: books / 20.")
+        parser.add_argument('--borrows-per-user', type=int, default=20)
+        parser.add_argument('--review-rate', type=float, default=0.4, help="Share of returned borrows that get a review.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        n_books = options['books']
+        n_authors = options['authors'] or max(1, n_books // 10)
+        n_users = options['users'] or max(1, n_books // 20)
+        started = time.perf_counter()
+
+        categories = self.seed_categories(options['categories'])
+        author_ids = self.seed_authors(rng, n_authors)
+        book_ids, copies = self.seed_books(rng, n_books, author_ids, categories)
+        user_ids = self.seed_users(n_users)
+        self.seed_borrows(rng, user_ids, book_ids, copies, options['borrows_per_user'], options['review_rate'])
+
+        self.stdout.write("Rebuilding rating aggregates, book counts and search index...")
+        call_command('rebuild_ratings', stdout=self.stdout)
+        call_command('rebuild_book_counts', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s."))
+
+    def bulk(self, model, objs):
+        created = []
+        for i in range(0, len(objs), self.batch_size):
+            with transaction.atomic():
+                created += model.objects.bulk_create(objs[i:i + self.batch_size])
+        return created
+
+    def phrase(self, rng, n):
+        return ' '.join(rng.choice(WORDS) for _ in range(n)).title()
+
+    def seed_categories(self, n):
+        existing = set(Category.objects.values_list('name', flat=True))
+        names = [f"Category {i}" for i in range(n) if f"Category {i}" not in existing]
+        self.bulk(Category, [Category(name=name) for name in names])
+        return list(Category.objects.values_list('id', flat=True))
+
+    def seed_authors(self, rng, n):
+        start = Author.objects.count()
+        objs = [Author(name=f"{self.phrase(rng, 2)} {start + i}") for i in range(n)]
+        ids = [a.id for a in self.bulk(Author, objs)]
+        self.stdout.write(f"{len(ids)} authors")
+        return ids or list(Author.objects.values_list('id', flat=True))
+
+    def seed_books(self, rng, n, author_ids, category_ids):
+        ids, copies = [], []
+        for i in range(0, n, self.batch_size):
+            objs = []
+            for _ in range(min(self.batch_size, n - i)):
+                total = rng.randint(1, 5)
+                objs.append(Book(
+                    title=self.phrase(rng, rng.randint(2, 5)),
+                    author_id=rng.choice(author_ids),
+                    category_id=rng.choice(category_ids),
+                    publication_year=rng.randint(1950, 2025),
+                    pages=rng.randint(80, 900),
+                    language=rng.choice(LANGUAGES),
+                    description=self.phrase(rng, 40),
+                    total_copies=total,
+                    available_copies=total,
+                ))
+            created = self.bulk(Book, objs)
+            ids += [b.id for b in created]
+            copies += [b.total_copies for b in created]
+        self.stdout.write(f"{len(ids)} books")
+        return ids, copies
+
+    def seed_users(self, n):
+        password = make_password(BENCH_PASSWORD)  # hash once, share across users
+        start = User.objects.filter(username__startswith=USER_PREFIX).count()
+        users = self.bulk(User, [
+            User(username=f"{USER_PREFIX}{start + i}", email=f"{USER_PREFIX}{start + i}@example.com", password=password)
+            for i in range(n)
+        ])
+        self.bulk(Profile, [Profile(user_id=u.id, full_name=u.username) for u in users])
+        self.stdout.write(f"{len(users)} users (password '{BENCH_PASSWORD}')")
+        return [u.id for u in users]
+
+    def seed_borrows(self, rng, user_ids, book_ids, copies, per_user, review_rate):
+        now = timezone.now()
+        available = dict(zip(book_ids, copies))
+        borrows, reviews, taken = [], [], {}
+        n_borrows = n_reviews = 0
+
+        def flush():
+            nonlocal borrows, reviews
+            # borrowed_at / created_at are auto_now_add, so bulk_create stamps them "now";
+            # bulk_update (which leaves auto_now_add alone) writes the generated history back
+            for model, objs, field in ((Borrow, borrows, 'borrowed_at'), (Review, reviews, 'created_at')):
+                history = [getattr(obj, field) for obj in objs]
+                created = self.bulk(model, objs)
+                for obj, value in zip(created, history):
+                    setattr(obj, field, value)
+                with transaction.atomic():
+                    model.objects.bulk_update(created, [field], batch_size=self.batch_size)
+            borrows, reviews = [], []
+
+        for user_id in user_ids:
+            active = 0
+            for book_id in rng.sample(book_ids, min(per_user, len(book_ids))):
+                borrowed_at = now - timedelta(days=rng.randint(0, 700))
+                returned = active >= 5 or available[book_id] == 0 or rng.random() < 0.8
+                returned_at = min(borrowed_at + timedelta(days=rng.randint(1, 20)), now) if returned else None
+                borrows.append(Borrow(
+                    user_id=user_id, book_id=book_id, borrowed_at=borrowed_at,
+                    expected_return_at=borrowed_at + timedelta(days=14), returned_at=returned_at,
+                ))
+                if not returned:
+                    active += 1
+                    available[book_id] -= 1
+                    taken[book_id] = taken.get(book_id, 0) + 1
+                elif rng.random() < review_rate:
+                    reviews.append(Review(user_id=user_id, book_id=book_id, created_at=returned_at, stars=rng.choices(
+                        (1, 2, 3, 4, 5), weights=(1, 2, 4, 6, 5))[0], comment=self.phrase(rng, 8)))
+            n_borrows += per_user
+            if len(borrows) >= self.batch_size:
+                n_reviews += len(reviews)
+                flush()
+        n_reviews += len(reviews)
+        flush()
+
+        # active copies are taken off the books in one pass
+        with transaction.atomic():
+            for book_id, n in taken.items():
+                Book.objects.filter(pk=book_id).update(available_copies=available[book_id])
+        self.stdout.write(f"{n_borrows} borrows, {n_reviews} reviews")
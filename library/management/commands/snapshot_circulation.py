@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import reports
+
+
+class Command(BaseCommand):
+    help = ("Write daily circulation snapshots (per book, author, category and library) for every complete day "
+            "since the last snapshot. Run once a day, after midnight; the first run backfills from the first borrow.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', help="Last day to snapshot (YYYY-MM-DD); default yesterday.")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Drop all snapshots and rebuild from the first borrow (e.g. after deleting borrows).")
+        parser.add_argument('--verbose-days', action='store_true', help="Print a line per day written.")
+
+    def handle(self, *args, **options):
+        until = None
+        if options['until']:
+            try:
+                until = date.fromisoformat(options['until'])
+            except ValueError:
+                raise CommandError("--until must be YYYY-MM-DD")
+        progress = (lambda message: self.stdout.write(message)) if options['verbose_days'] else None
+        days = reports.build(until=until, rebuild=options['rebuild'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {days} day(s) of snapshots; latest is {reports.last_snapshot_date() or 'none'}."
+        ))
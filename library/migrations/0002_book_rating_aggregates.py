@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-18 18:35
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    Review = apps.get_model('library', 'Review')
+    rows = Review.objects.values('book_id').annotate(s=Sum('stars'), c=Count('id')).order_by()
+    for row in rows.iterator():
+        Book.objects.filter(pk=row['book_id']).update(
+            rating_sum=row['s'], rating_count=row['c'], avg_rating=row['s'] / row['c'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='avg_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-avg_rating', '-created_at'], name='book_avg_rating_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
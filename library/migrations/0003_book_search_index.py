@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-18 18:52
+
+from django.db import migrations
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE library_book_search USING fts5("
+    "title, author, category, description, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO library_book_search (rowid, title, author, category, description) "
+    "SELECT b.id, b.title, a.name, c.name, b.description FROM library_book b "
+    "JOIN library_author a ON a.id = b.author_id JOIN library_category c ON c.id = b.category_id",
+]
+
+POSTGRES_CREATE = [
+    "CREATE TABLE library_book_search ("
+    "book_id bigint PRIMARY KEY REFERENCES library_book (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX library_book_search_document_gin ON library_book_search USING gin (document)",
+    "INSERT INTO library_book_search (book_id, document) "
+    "SELECT b.id, "
+    "setweight(to_tsvector('simple', coalesce(b.title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(a.name, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(c.name, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(b.description, '')), 'D') "
+    "FROM library_book b "
+    "JOIN library_author a ON a.id = b.author_id JOIN library_category c ON c.id = b.category_id",
+]
+
+STATEMENTS = {
+    'sqlite': SQLITE_CREATE,
+    'postgresql': POSTGRES_CREATE,
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in STATEMENTS.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in STATEMENTS:
+        schema_editor.execute("DROP TABLE IF EXISTS library_book_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
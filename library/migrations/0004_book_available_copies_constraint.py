@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.CheckConstraint(condition=models.Q(('available_copies__gte', 0), ('available_copies__lte', models.F('total_copies'))), name='book_available_copies_in_range'),
+        ),
+    ]
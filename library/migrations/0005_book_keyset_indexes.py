@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_available_copies_constraint'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_avg_rating_idx',
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-avg_rating', '-id'], name='book_rating_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-created_at', '-id'], name='book_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='book_category_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='book_author_keyset_idx'),
+        ),
+    ]
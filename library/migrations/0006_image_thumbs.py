@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='photo_thumbs',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_thumbs',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-18 18:56
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counts(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    for model_name, column in (('Category', 'category_id'), ('Author', 'author_id')):
+        model = apps.get_model('library', model_name)
+        rows = (
+            Book.objects.values(column)
+            .annotate(n=Count('id'), available=Count('id', filter=Q(available_copies__gt=0)))
+            .order_by()
+        )
+        for row in rows.iterator():
+            model.objects.filter(pk=row[column]).update(book_count=row['n'], available_book_count=row['available'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_image_thumbs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='available_book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='available_book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['name', 'id'], name='author_name_keyset_idx'),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-18 18:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_category_author_book_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('due_soon', 'Due soon'), ('overdue', 'Overdue')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DueScanCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, unique=True)),
+                ('scanned_until', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['returned_at', 'expected_return_at'], name='borrow_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='borrownotification',
+            name='borrow',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='library.borrow'),
+        ),
+        migrations.AddField(
+            model_name='borrownotification',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='borrow_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='borrownotification',
+            index=models.Index(fields=['sent_at', 'user'], name='borrow_notification_outbox_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='borrownotification',
+            constraint=models.UniqueConstraint(fields=('borrow', 'kind'), name='borrow_notification_once'),
+        ),
+    ]
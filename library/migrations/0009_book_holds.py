@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-18 19:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_borrow_notifications'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='borrownotification',
+            name='borrow',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='library.borrow'),
+        ),
+        migrations.AlterField(
+            model_name='borrownotification',
+            name='kind',
+            field=models.CharField(choices=[('due_soon', 'Due soon'), ('overdue', 'Overdue'), ('hold_ready', 'Hold ready')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('ready', 'Ready for pickup'), ('fulfilled', 'Picked up'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='waiting', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='library.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='borrownotification',
+            name='hold',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='library.hold'),
+        ),
+        migrations.AddConstraint(
+            model_name='borrownotification',
+            constraint=models.UniqueConstraint(fields=('hold', 'kind'), name='hold_notification_once'),
+        ),
+        migrations.AddIndex(
+            model_name='hold',
+            index=models.Index(fields=['book', 'status', 'id'], name='hold_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hold',
+            index=models.Index(fields=['status', 'expires_at'], name='hold_expiry_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hold',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['waiting', 'ready'])), fields=('user', 'book'), name='hold_one_active_per_user_book'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_book_recommendations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCirculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('scope', models.CharField(choices=[('library', 'Library'), ('category', 'Category'), ('author', 'Author'), ('book', 'Book')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField(default=0)),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('active_loans', models.PositiveIntegerField(default=0)),
+                ('overdue', models.PositiveIntegerField(default=0)),
+                ('total_copies', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['borrowed_at'], name='borrow_borrowed_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['expected_return_at'], name='borrow_expected_return_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at'], name='review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycirculation',
+            index=models.Index(fields=['scope', 'date'], name='daily_circulation_scope_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycirculation',
+            constraint=models.UniqueConstraint(fields=('date', 'scope', 'object_id'), name='daily_circulation_once'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 19:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_daily_circulation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['stars', 'id'], name='review_stars_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-18 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchFTS',
+            fields=[
+                ('book', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='fts', serialize=False, to='library.book')),
+                ('document', models.TextField(db_column='library_book_search')),
+            ],
+            options={
+                'db_table': 'library_book_search',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='BookSearchVector',
+            fields=[
+                ('book', models.OneToOneField(db_column='book_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='tsv', serialize=False, to='library.book')),
+                ('document', models.TextField()),
+            ],
+            options={
+                'db_table': 'library_book_search',
+                'managed': False,
+            },
+        ),
+    ]
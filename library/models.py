@@ -5,20 +5,38 @@ class Category(models.Model):
     name = models.CharField(max_length=120, unique=True)
     icon = models.CharField(max_length=80, blank=True, null=True)  # مثال: "bi bi-book"
 
+    # maintained by library.signals / library.services; rebuild_book_counts repairs drift
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    available_book_count = models.PositiveIntegerField(default=0, editable=False)
+    # set on save and by every queryset update in services / signals; the pages' ETag source (core.conditional)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return self.name
 
 class Author(models.Model):
     name = models.CharField(max_length=150)
     photo = models.ImageField(upload_to='authors/', blank=True, null=True)
+    photo_thumbs = models.JSONField(default=dict, blank=True, editable=False)  # see library.images
     bio = models.TextField(blank=True, null=True)
 
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    available_book_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='author_name_keyset_idx'),
+            models.Index(fields=['updated_at'], name='author_updated_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 class Book(models.Model):
     title = models.CharField(max_length=220)
     cover = models.ImageField(upload_to='covers/', blank=True, null=True)
+    cover_thumbs = models.JSONField(default=dict, blank=True, editable=False)  # see library.images
     author = models.ForeignKey(Author, on_delete=models.PROTECT, related_name='books')
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='books')
 
@@ -31,6 +49,31 @@ class Book(models.Model):
     available_copies = models.PositiveIntegerField(default=1)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # denormalized from Review (kept in sync by library.signals, rebuilt by `rebuild_ratings`)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    avg_rating = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # keyset pagination orderings (see library.pagination / views.KEYSET_ORDERINGS)
+            models.Index(fields=['-avg_rating', '-id'], name='book_rating_keyset_idx'),
+            models.Index(fields=['-created_at', '-id'], name='book_created_keyset_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='book_category_keyset_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='book_author_keyset_idx'),
+            # newest change first: the conditional-response validators (core.conditional)
+            models.Index(fields=['updated_at'], name='book_updated_idx'),
+            models.Index(fields=['category', 'updated_at'], name='book_category_updated_idx'),
+            models.Index(fields=['author', 'updated_at'], name='book_author_updated_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(available_copies__gte=0) & models.Q(available_copies__lte=models.F('total_copies')),
+                name='book_available_copies_in_range',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -39,12 +82,6 @@ class Book(models.Model):
     def is_available(self):
         return self.available_copies > 0
 
-    def avg_rating(self):
-        qs = self.reviews.all()
-        if not qs.exists():
-            return 0
-        return round(sum(r.stars for r in qs) / qs.count(), 1)
-
 class Borrow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='borrows')
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='borrows')
@@ -55,6 +92,11 @@ class Borrow(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['user', 'book', 'returned_at']),
+            # open borrows by due date, for library.notifications
+            models.Index(fields=['returned_at', 'expected_return_at'], name='borrow_due_idx'),
+            # one day's new borrows / newly due borrows, for library.reports
+            models.Index(fields=['borrowed_at'], name='borrow_borrowed_at_idx'),
+            models.Index(fields=['expected_return_at'], name='borrow_expected_return_idx'),
         ]
 
     def __str__(self):
@@ -73,9 +115,174 @@ class Review(models.Model):
 
     class Meta:
         unique_together = ('user', 'book')
+        indexes = [
+            models.Index(fields=['created_at'], name='review_created_idx'),
+            # the admin's stars filter, in its default -id order
+            models.Index(fields=['stars', 'id'], name='review_stars_idx'),
+        ]
 
     def __str__(self):
         return f"{self.book.title} - {self.stars}"
+
+class Hold(models.Model):
+    # FIFO reservation on a book with no copies left; see services.place_hold / _release_copy
+    WAITING = 'waiting'
+    READY = 'ready'          # a returned copy is set aside for this user until expires_at
+    FULFILLED = 'fulfilled'
+    CANCELLED = 'cancelled'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (WAITING, 'Waiting'), (READY, 'Ready for pickup'), (FULFILLED, 'Picked up'),
+        (CANCELLED, 'Cancelled'), (EXPIRED, 'Expired'),
+    ]
+    ACTIVE = (WAITING, READY)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='holds')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=WAITING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'book'], condition=models.Q(status__in=['waiting', 'ready']),
+                name='hold_one_active_per_user_book',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['book', 'status', 'id'], name='hold_queue_idx'),  # FIFO = id order
+            models.Index(fields=['status', 'expires_at'], name='hold_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} holds {self.book.title} ({self.status})"
+
+class BorrowNotification(models.Model):
+    # outbox row: one per borrow (or hold) and kind, sent by `notify_due_borrows`
+    DUE_SOON = 'due_soon'
+    OVERDUE = 'overdue'
+    HOLD_READY = 'hold_ready'
+    KIND_CHOICES = [(DUE_SOON, 'Due soon'), (OVERDUE, 'Overdue'), (HOLD_READY, 'Hold ready')]
+
+    borrow = models.ForeignKey(Borrow, on_delete=models.CASCADE, related_name='notifications', blank=True, null=True)
+    hold = models.ForeignKey(Hold, on_delete=models.CASCADE, related_name='notifications', blank=True, null=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='borrow_notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['borrow', 'kind'], name='borrow_notification_once'),
+            models.UniqueConstraint(fields=['hold', 'kind'], name='hold_notification_once'),
+        ]
+        indexes = [
+            models.Index(fields=['sent_at', 'user'], name='borrow_notification_outbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} -> {self.user_id} (borrow {self.borrow_id}, hold {self.hold_id})"
+
+class DueScanCursor(models.Model):
+    # how far the scanner has read Borrow.expected_return_at for each notification kind
+    kind = models.CharField(max_length=20, unique=True)
+    scanned_until = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} @ {self.scanned_until}"
+
+class BookRecommendation(models.Model):
+    # "readers who borrowed this also borrowed": top-K co-borrowed books per book, written by
+    # `build_recommendations` (library.recommendations); book_detail reads one book's rows by (book, rank)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommendations')
+    neighbour = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()  # cosine similarity of the two books' borrower sets
+    co_borrowers = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='book_recommendation_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbour_id} (#{self.rank})"
+
+class RecommendationRun(models.Model):
+    # one row per build; the latest last_borrow_id is where the next incremental run starts
+    full = models.BooleanField()
+    last_borrow_id = models.PositiveBigIntegerField()
+    pairs = models.PositiveBigIntegerField()   # distinct (user, book) pairs read
+    books = models.PositiveIntegerField()      # books whose neighbours were recomputed
+    seconds = models.FloatField()
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{'full' if self.full else 'incremental'} up to borrow {self.last_borrow_id}"
+
+class DailyCirculation(models.Model):
+    # end-of-day circulation per library / category / author / book, written by `snapshot_circulation`
+    # (library.reports) from the previous day's rows plus that day's borrows, returns and reviews
+    LIBRARY = 'library'
+    CATEGORY = 'category'
+    AUTHOR = 'author'
+    BOOK = 'book'
+    SCOPE_CHOICES = [(LIBRARY, 'Library'), (CATEGORY, 'Category'), (AUTHOR, 'Author'), (BOOK, 'Book')]
+
+    date = models.DateField()
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    object_id = models.PositiveBigIntegerField(default=0)  # 0 for the library row
+    borrows = models.PositiveIntegerField(default=0)       # started that day
+    returns = models.PositiveIntegerField(default=0)
+    reviews = models.PositiveIntegerField(default=0)
+    active_loans = models.PositiveIntegerField(default=0)  # open at the end of the day
+    overdue = models.PositiveIntegerField(default=0)       # open and past due at the end of the day
+    total_copies = models.PositiveIntegerField(default=0)  # catalog size when the day was snapshotted
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'scope', 'object_id'], name='daily_circulation_once'),
+        ]
+        indexes = [
+            models.Index(fields=['scope', 'date'], name='daily_circulation_scope_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.scope} {self.object_id}"
+
+    @property
+    def utilisation(self):
+        return self.active_loans / self.total_copies if self.total_copies else 0
+
+# The full-text index table from migration 0003, one row per book, written with SQL by
+# library.search. Mapped read-only so searches can join it (and rank by it) through the ORM;
+# the shape differs per database, hence one model each.
+
+class BookSearchFTS(models.Model):
+    # SQLite FTS5: rowid is the book id; the hidden column named after the table takes MATCH / bm25()
+    book = models.OneToOneField(Book, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                db_constraint=False, related_name='fts')
+    document = models.TextField(db_column='library_book_search')
+
+    class Meta:
+        managed = False
+        db_table = 'library_book_search'
+
+class BookSearchVector(models.Model):
+    # Postgres: weighted tsvector per book, GIN-indexed
+    book = models.OneToOneField(Book, on_delete=models.DO_NOTHING, primary_key=True, db_column='book_id',
+                                db_constraint=False, related_name='tsv')
+    document = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'library_book_search'
+
 from django.db import models
 
 # Create your models here.
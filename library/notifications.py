@@ -0,0 +1,158 @@
+"""Due-soon / overdue notices for open borrows.
+
+scan() walks open borrows by expected_return_at from a per-kind watermark (DueScanCursor),
+so each run only reads borrows that became due since the last one, and queues one
+BorrowNotification per borrow and kind (the unique constraint makes re-scans harmless).
+The watermark never passes the scan time: the due-soon window ahead of it is re-read each
+run, so a borrow created or extended into it is still caught. services.extend_borrows()
+drops the notices an extension makes stale.
+services._release_copy() adds HOLD_READY rows when a returned copy is set aside for a hold.
+send_pending() drains the outbox: one email per user, many emails per mail connection.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Borrow, BorrowNotification, DueScanCursor, Hold
+
+DUE_SOON = BorrowNotification.DUE_SOON
+OVERDUE = BorrowNotification.OVERDUE
+HOLD_READY = BorrowNotification.HOLD_READY
+MAX_ATTEMPTS = 5
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def due_soon_window():
+    return timedelta(days=getattr(settings, 'BORROW_DUE_SOON_DAYS', 2))
+
+
+def scan(kind, now=None, batch_size=5000):
+    """Queue notifications for open borrows that entered `kind`'s window since the last scan.
+
+    Returns how many borrows were queued.
+    """
+    now = now or timezone.now()
+    if kind == OVERDUE:
+        horizon, floor = now, EPOCH
+    else:
+        # already-overdue borrows get the overdue notice instead
+        horizon, floor = now + due_soon_window(), now
+    cursor, _ = DueScanCursor.objects.get_or_create(kind=kind, defaults={'scanned_until': floor})
+    last_due, last_id = max(cursor.scanned_until, floor), 0
+
+    notified = BorrowNotification.objects.filter(borrow=OuterRef('pk'), kind=kind)
+    found = 0
+    while True:
+        rows = list(
+            Borrow.objects.filter(returned_at__isnull=True, expected_return_at__lte=horizon)
+            .filter(Q(expected_return_at__gt=last_due) | Q(expected_return_at=last_due, id__gt=last_id))
+            .filter(~Exists(notified))
+            .order_by('expected_return_at', 'id')
+            .values_list('id', 'user_id', 'expected_return_at')[:batch_size]
+        )
+        if not rows:
+            break
+        last_id, _, last_due = rows[-1]
+        with transaction.atomic():
+            BorrowNotification.objects.bulk_create(
+                [BorrowNotification(borrow_id=b, user_id=u, kind=kind) for b, u, _ in rows],
+                ignore_conflicts=True,
+            )
+            DueScanCursor.objects.filter(pk=cursor.pk).update(scanned_until=min(last_due, now))
+        found += len(rows)
+
+    # not `horizon`: a borrow due before it may still appear (a new loan, an extension)
+    DueScanCursor.objects.filter(pk=cursor.pk).update(scanned_until=now)
+    return found
+
+
+def reset_cursors():
+    # next scan starts from the beginning again; already queued notices are not duplicated
+    DueScanCursor.objects.all().delete()
+
+
+def still_applies(notification):
+    if notification.hold_id:
+        return notification.hold.status == Hold.READY
+    return notification.borrow.returned_at is None
+
+
+def build_message(user, notifications):
+    overdue = [n.borrow for n in notifications if n.kind == OVERDUE]
+    due_soon = [n.borrow for n in notifications if n.kind == DUE_SOON]
+    ready = [n.hold for n in notifications if n.kind == HOLD_READY]
+    if overdue:
+        subject = "Overdue library books"
+    elif ready:
+        subject = "Your reserved book is ready for pickup"
+    else:
+        subject = "Library books due soon"
+    body = render_to_string('library/email/due_notice.txt', {
+        'user': user, 'overdue': overdue, 'due_soon': due_soon, 'ready': ready,
+    })
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [user.email])
+
+
+def send_pending(batch_size=200, now=None):
+    """Email every user with unsent notifications. Returns (sent, failed, closed) notification counts;
+    closed ones were not sent because they no longer apply or the user has no address."""
+    now = now or timezone.now()
+    pending = BorrowNotification.objects.filter(sent_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+    sent = failed = closed_count = 0
+    last_user_id = 0
+
+    while True:
+        rows = list(
+            pending.filter(user_id__gt=last_user_id)
+            .select_related('user__profile', 'borrow__book', 'hold__book')
+            .order_by('user_id', 'id')[:batch_size]
+        )
+        if not rows:
+            break
+        groups = [(user_id, list(items)) for user_id, items in groupby(rows, key=lambda n: n.user_id)]
+        if len(rows) == batch_size and len(groups) > 1:
+            groups.pop()  # the last user may have more rows past this batch; take them next round
+        last_user_id = groups[-1][0]
+
+        delivered, errors, closed = [], {}, {}
+        with get_connection() as connection:  # one connection for the whole batch of users
+            for _, items in groups:
+                user = items[0].user
+                live = [n for n in items if still_applies(n)]
+                closed.update((n.pk, "no longer applies") for n in items if not still_applies(n))
+                if live and not user.email:
+                    closed.update((n.pk, "user has no email address") for n in live)
+                    continue
+                if not live:
+                    continue
+                try:
+                    connection.send_messages([build_message(user, live)])
+                except Exception as exc:  # any backend error leaves the rows queued for a retry
+                    errors.update((n.pk, str(exc)[:255]) for n in live)
+                else:
+                    delivered += [n.pk for n in live]
+
+        with transaction.atomic():
+            BorrowNotification.objects.filter(pk__in=delivered).update(sent_at=now, attempts=F('attempts') + 1)
+            # closed rows get sent_at too so they leave the outbox; last_error says why nothing went out
+            for reason, pks in _group_by_message(closed).items():
+                BorrowNotification.objects.filter(pk__in=pks).update(sent_at=now, last_error=reason)
+            for error, pks in _group_by_message(errors).items():
+                BorrowNotification.objects.filter(pk__in=pks).update(attempts=F('attempts') + 1, last_error=error)
+        sent += len(delivered)
+        closed_count += len(closed)
+        failed += len(errors)
+    return sent, failed, closed_count
+
+
+def _group_by_message(messages):
+    grouped = {}
+    for pk, message in messages.items():
+        grouped.setdefault(message, []).append(pk)
+    return grouped
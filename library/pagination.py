@@ -0,0 +1,164 @@
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+COUNT_CAP = 1000
+EXACT_COUNT_BELOW = 10_000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor,
+                 estimated_count=None, count_is_lower_bound=False):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.estimated_count = estimated_count
+        self.count_is_lower_bound = count_is_lower_bound
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Cursor pagination over a unique ordering such as ('-created_at', '-id').
+
+    Each page is a `WHERE (keys) < (last row's keys) ORDER BY keys LIMIT n+1`, so with a
+    matching index every page costs the same as the first one. Cursors are opaque tokens
+    holding the boundary row's key values and the direction to read in.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [o.lstrip('-') for o in self.ordering]
+        self.descending = [o.startswith('-') for o in self.ordering]
+
+    def encode(self, obj, direction):
+        # rows may be model instances or values() dicts
+        values = [obj[f] if isinstance(obj, dict) else getattr(obj, f) for f in self.fields]
+        values = [v.isoformat() if hasattr(v, 'isoformat') else v for v in values]
+        raw = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode(self, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            direction, values = json.loads(raw)
+            if direction not in ('n', 'p') or len(values) != len(self.fields):
+                raise ValueError
+            model_fields = [self.queryset.model._meta.get_field(f) for f in self.fields]
+            return direction, [field.to_python(v) for field, v in zip(model_fields, values)]
+        except (ValueError, TypeError, ValidationError) as exc:
+            raise InvalidCursor(token) from exc
+
+    def _after(self, values, forward):
+        # lexicographic (a, b, c) > (x, y, z), per-column direction aware
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            op = 'lt' if self.descending[i] == forward else 'gt'
+            term = Q(**{f'{field}__{op}': values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{prev_field: prev_value})
+            condition |= term
+        return condition
+
+    def _query(self, cursor):
+        direction, values = 'n', None
+        if cursor:
+            try:
+                direction, values = self.decode(cursor)
+            except InvalidCursor:
+                pass
+
+        forward = direction == 'n'
+        qs = self.queryset
+        if values is not None:
+            qs = qs.filter(self._after(values, forward))
+        ordering = self.ordering if forward else [
+            o[1:] if o.startswith('-') else '-' + o for o in self.ordering
+        ]
+        return qs.order_by(*ordering)[:self.per_page + 1], forward, values is not None
+
+    def _page(self, rows, forward, has_cursor, count=None, lower_bound=False):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        has_next = more if forward else has_cursor
+        has_previous = has_cursor if forward else more
+        return KeysetPage(
+            rows,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=self.encode(rows[-1], 'n') if has_next and rows else None,
+            previous_cursor=self.encode(rows[0], 'p') if has_previous and rows else None,
+            estimated_count=count,
+            count_is_lower_bound=lower_bound,
+        )
+
+    def get_page(self, cursor=None, with_count=False):
+        qs, forward, has_cursor = self._query(cursor)
+        rows = list(qs)
+        count, lower_bound = estimate_count(self.queryset) if with_count else (None, False)
+        return self._page(rows, forward, has_cursor, count, lower_bound)
+
+    async def aget_page(self, cursor=None, with_count=False):
+        qs, forward, has_cursor = self._query(cursor)
+        rows = await _alist(qs)
+        count, lower_bound = await sync_to_async(estimate_count)(self.queryset) if with_count else (None, False)
+        return self._page(rows, forward, has_cursor, count, lower_bound)
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def estimate_count(queryset, cap=COUNT_CAP):
+    """Planner row estimate on Postgres; elsewhere an exact count that stops at `cap`.
+
+    Returns (count, is_lower_bound).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+    count = queryset.order_by()[:cap + 1].count()
+    return min(count, cap), count > cap
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for admin changelists over big tables (use with show_full_result_count = False).
+
+    On Postgres the page count comes from the planner estimate instead of a COUNT(*) over
+    millions of rows; results estimated under EXACT_COUNT_BELOW rows are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.count()
+        estimate, _ = estimate_count(queryset)
+        return estimate if estimate >= EXACT_COUNT_BELOW else queryset.count()
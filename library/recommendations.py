@@ -0,0 +1,249 @@
+"""Offline "readers who borrowed this also borrowed" builder (run by `build_recommendations`).
+
+Two passes, both in bounded memory:
+
+1. The distinct (user, book) pairs from Borrow are streamed in user order and written to two
+   flat files: the books of every user back to back, and each user's count. Only the
+   `max_history` most recent books of a user are kept, so a single heavy reader can't
+   dominate (or blow up) the pair counts. Per-book borrower counts are collected on the way.
+2. Target books are split into blocks whose expected number of co-borrow pairs fits in
+   `max_pairs`. For each block, the user files are read again in chunks (memory mapped),
+   and every (target, other book) pair from each user is expanded with NumPy. The pairs
+   are then counted with np.unique. Each count becomes a cosine score, co / sqrt(n_a * n_b),
+   and the top K per target replace that book's BookRecommendation rows.
+
+An incremental run still needs pass 1 for exact borrower counts. It recomputes only the
+books of users who borrowed since the last run. Other books keep their lists until the next
+full build, even when one of their neighbours gained a borrower.
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+
+from .models import BookRecommendation, Borrow, RecommendationRun
+
+TOP_K = 8
+MAX_HISTORY = 200
+MIN_SUPPORT = 2          # co-borrowers needed before a pair is recommended at all
+MAX_PAIRS = 5_000_000    # pairs expanded per block: ~40 MB of int64 keys, plus np.unique's copy
+CHUNK_ROWS = 1_000_000   # rows read per step in both passes
+FULL_REBUILD_SHARE = 0.5  # an incremental run touching more books than this does a full build
+
+
+class Incidence:
+    """User -> books lists on disk: `indices` (book ids, int32) grouped by user, `lengths` per user."""
+
+    def __init__(self, directory):
+        self.indices_path = os.path.join(directory, 'indices.i4')
+        self.lengths_path = os.path.join(directory, 'lengths.i4')
+        self.rows = 0
+        self.users = 0
+
+    def load(self):
+        indices = np.memmap(self.indices_path, dtype=np.int32, mode='r') if self.rows else np.empty(0, np.int32)
+        lengths = np.fromfile(self.lengths_path, dtype=np.int32)
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        return indices, lengths, indptr
+
+    def user_chunks(self, chunk_rows=CHUNK_ROWS):
+        """Yield (books, lengths, offsets) for runs of whole users holding about chunk_rows rows."""
+        indices, lengths, indptr = self.load()
+        u0 = 0
+        while u0 < len(lengths):
+            u1 = max(int(np.searchsorted(indptr, indptr[u0] + chunk_rows, side='right')) - 1, u0 + 1)
+            books = np.asarray(indices[indptr[u0]:indptr[u1]])
+            yield books, lengths[u0:u1], indptr[u0:u1] - indptr[u0]
+            u0 = u1
+
+
+def read_pairs(incidence, last_borrow_id, max_history=MAX_HISTORY, chunk_rows=CHUNK_ROWS):
+    """Pass 1: write the capped user -> books lists and return per-book borrower counts."""
+    rows = (
+        Borrow.objects.filter(id__lte=last_borrow_id)
+        .values_list('user_id', 'book_id')
+        .annotate(last=Max('borrowed_at'))
+        .order_by('user_id', '-last', '-book_id')
+        .iterator(chunk_size=20_000)
+    )
+    popularity = np.zeros(0, dtype=np.int64)
+    carry_user, carry_seen = None, 0
+
+    with open(incidence.indices_path, 'wb') as indices_file, open(incidence.lengths_path, 'wb') as lengths_file:
+        def finish(seen):
+            np.array([min(seen, max_history)], dtype=np.int32).tofile(lengths_file)
+            incidence.users += 1
+
+        while True:
+            chunk = np.fromiter(
+                (value for row in _take(rows, chunk_rows) for value in row[:2]), dtype=np.int64,
+            ).reshape(-1, 2)
+            if not len(chunk):
+                break
+            users, books = chunk[:, 0], chunk[:, 1]
+
+            starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+            run_lengths = np.diff(np.r_[starts, len(users)])
+            rank = np.arange(len(users)) - np.repeat(starts, run_lengths)
+            if users[0] == carry_user:
+                rank[:run_lengths[0]] += carry_seen  # this user's rows started in the previous chunk
+                run_lengths[0] += carry_seen
+            elif carry_user is not None:
+                finish(carry_seen)
+            for seen in run_lengths[:-1]:
+                finish(int(seen))
+            carry_user, carry_seen = int(users[starts[-1]]), int(run_lengths[-1])
+
+            kept = books[rank < max_history]
+            kept.astype(np.int32).tofile(indices_file)
+            incidence.rows += len(kept)
+            counts = np.bincount(kept)
+            if len(counts) > len(popularity):
+                popularity = np.pad(popularity, (0, len(counts) - len(popularity)))
+            popularity[:len(counts)] += counts
+
+        if carry_user is not None:
+            finish(carry_seen)
+    return popularity
+
+
+def _take(iterator, n):
+    for _, row in zip(range(n), iterator):
+        yield row
+
+
+def expansion_weights(incidence, size):
+    # pairs a target book will expand to: the sum of its borrowers' list lengths
+    weights = np.zeros(size, dtype=np.int64)
+    for books, lengths, _ in incidence.user_chunks():
+        weights += np.bincount(books, weights=np.repeat(lengths, lengths), minlength=size).astype(np.int64)
+    return weights
+
+
+def plan_blocks(targets, weights, max_pairs=MAX_PAIRS):
+    """Split sorted target ids into consecutive blocks of at most max_pairs expanded pairs.
+    A book heavier than max_pairs gets a block of its own, counted densely."""
+    blocks, start, total = [], 0, 0
+    for i, w in enumerate(weights[targets]):
+        if total and total + w > max_pairs:
+            blocks.append(targets[start:i])
+            start, total = i, 0
+        total += w
+    if start < len(targets):
+        blocks.append(targets[start:])
+    return blocks
+
+
+def co_counts(incidence, block, size):
+    """Pass 2 for one block: (target, other, count) for every pair sharing a reader."""
+    in_block = np.zeros(size, dtype=bool)
+    in_block[block] = True
+    dense = len(block) == 1
+    counts = np.zeros(size, dtype=np.int64) if dense else None
+    keys = []
+
+    for books, lengths, offsets in incidence.user_chunks():
+        rows = np.flatnonzero(in_block[books])
+        if not len(rows):
+            continue
+        owner = np.repeat(np.arange(len(lengths)), lengths)[rows]
+        reps = lengths[owner].astype(np.int64)
+        # every target row, paired with each book on the same user's list
+        position = np.arange(reps.sum()) - np.repeat(np.cumsum(reps) - reps, reps)
+        others = books[np.repeat(offsets[owner], reps) + position]
+        targets = np.repeat(books[rows], reps)
+        keep = others != targets
+        if dense:
+            counts += np.bincount(others[keep], minlength=size)
+        else:
+            keys.append(targets[keep].astype(np.int64) * size + others[keep])
+
+    if dense:
+        others = np.flatnonzero(counts)
+        return np.full(len(others), block[0], dtype=np.int64), others, counts[others]
+    if not keys:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    unique, n = np.unique(np.concatenate(keys), return_counts=True)
+    return unique // size, unique % size, n
+
+
+def top_neighbours(targets, others, counts, popularity, top_k=TOP_K, min_support=MIN_SUPPORT):
+    keep = counts >= min_support
+    targets, others, counts = targets[keep], others[keep], counts[keep]
+    scores = counts / np.sqrt(popularity[targets].astype(np.float64) * popularity[others])
+    order = np.lexsort((others, -scores, targets))  # best first within each target, ties by id
+    targets, others, counts, scores = targets[order], others[order], counts[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, targets[1:] != targets[:-1]])
+    rank = np.arange(len(targets)) - np.repeat(starts, np.diff(np.r_[starts, len(targets)]))
+    keep = rank < top_k
+    return targets[keep], others[keep], rank[keep], scores[keep], counts[keep]
+
+
+def store(block, targets, others, ranks, scores, counts):
+    rows = [
+        BookRecommendation(book_id=int(t), neighbour_id=int(o), rank=int(r), score=float(s), co_borrowers=int(c))
+        for t, o, r, s, c in zip(targets, others, ranks, scores, counts)
+    ]
+    with transaction.atomic():
+        BookRecommendation.objects.filter(book_id__in=[int(b) for b in block]).delete()
+        BookRecommendation.objects.bulk_create(rows, batch_size=2000)
+
+
+def changed_books(since_borrow_id, last_borrow_id):
+    # every book on the list of a user who borrowed since the last run
+    users = (Borrow.objects.filter(id__gt=since_borrow_id, id__lte=last_borrow_id)
+             .values('user_id').distinct())
+    return np.fromiter(
+        Borrow.objects.filter(user_id__in=users, id__lte=last_borrow_id)
+        .values_list('book_id', flat=True).distinct().order_by('book_id').iterator(chunk_size=20_000),
+        dtype=np.int64,
+    )
+
+
+def build(full=False, top_k=TOP_K, max_history=MAX_HISTORY, min_support=MIN_SUPPORT,
+          max_pairs=MAX_PAIRS, progress=None):
+    """Refresh BookRecommendation; returns the RecommendationRun (None if nothing changed)."""
+    started = time.perf_counter()
+    last_borrow_id = Borrow.objects.aggregate(last=Max('id'))['last'] or 0
+    previous = RecommendationRun.objects.order_by('-id').first()
+    full = full or previous is None
+    if not full and previous.last_borrow_id >= last_borrow_id:
+        return None
+
+    with tempfile.TemporaryDirectory(prefix='recommendations-') as directory:
+        incidence = Incidence(directory)
+        popularity = read_pairs(incidence, last_borrow_id, max_history)
+        size = len(popularity)
+        borrowed = np.flatnonzero(popularity)
+        if not full:
+            targets = changed_books(previous.last_borrow_id, last_borrow_id)
+            if len(targets) > FULL_REBUILD_SHARE * len(borrowed):
+                full = True
+        if full:
+            targets = borrowed
+        if progress:
+            progress(f"{incidence.rows} pairs from {incidence.users} users; recomputing {len(targets)} books")
+
+        blocks = plan_blocks(targets, expansion_weights(incidence, size), max_pairs)
+        for i, block in enumerate(blocks, 1):
+            pairs = co_counts(incidence, block, size)
+            store(block, *top_neighbours(*pairs, popularity, top_k, min_support))
+            if progress and (i % 50 == 0 or i == len(blocks)):
+                progress(f"block {i}/{len(blocks)}, {time.perf_counter() - started:.0f}s")
+
+    if full:
+        # drop lists of books that were not recomputed (no borrows left, or only past max_history)
+        listed = np.fromiter(BookRecommendation.objects.values_list('book_id', flat=True).distinct(), dtype=np.int64)
+        stale = np.setdiff1d(listed, targets)
+        for i in range(0, len(stale), 2000):
+            BookRecommendation.objects.filter(book_id__in=stale[i:i + 2000].tolist()).delete()
+    return RecommendationRun.objects.create(
+        full=full, last_borrow_id=last_borrow_id, pairs=incidence.rows, books=len(targets),
+        seconds=round(time.perf_counter() - started, 2),
+    )
+
@@ -0,0 +1,200 @@
+"""Daily circulation snapshots (DailyCirculation) for the staff report.
+
+Each day is built from the previous day's book rows plus that day's delta: borrows started,
+returns, reviews written and loans that became overdue, each one indexed range query on the
+day. History is never rescanned. Book rows are written for every book that had activity or
+still has loans open at the end of the day, which is the state the next day starts from.
+Category, author and library rows are sums of the book rows (by the book's current category
+and author) plus the catalog's copy counts for utilisation.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from .models import Author, Book, Borrow, Category, DailyCirculation, Review
+
+LIBRARY = DailyCirculation.LIBRARY
+CATEGORY = DailyCirculation.CATEGORY
+AUTHOR = DailyCirculation.AUTHOR
+BOOK = DailyCirculation.BOOK
+COUNTERS = ('borrows', 'returns', 'reviews', 'active_loans', 'overdue')
+CHUNK = 2000
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _per_book(queryset):
+    return Counter(dict(queryset.values_list('book_id').annotate(n=Count('id')).order_by()))
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for i in range(0, len(ids), CHUNK):
+        yield ids[i:i + CHUNK]
+
+
+def day_delta(day):
+    start, end = day_bounds(day)
+    open_at_end = Q(returned_at__isnull=True) | Q(returned_at__gte=end)
+    return {
+        'borrows': _per_book(Borrow.objects.filter(borrowed_at__gte=start, borrowed_at__lt=end)),
+        'returns': _per_book(Borrow.objects.filter(returned_at__gte=start, returned_at__lt=end)),
+        'reviews': _per_book(Review.objects.filter(created_at__gte=start, created_at__lt=end)),
+        # overdue at the end of the previous day, returned today
+        'overdue_returned': _per_book(Borrow.objects.filter(
+            returned_at__gte=start, returned_at__lt=end, expected_return_at__lt=start, borrowed_at__lt=start,
+        )),
+        # due today and still out at the end of it, plus anything lent today already past due
+        'became_overdue': _per_book(Borrow.objects.filter(
+            open_at_end, expected_return_at__gte=start, expected_return_at__lt=end, borrowed_at__lt=end,
+        )) + _per_book(Borrow.objects.filter(
+            open_at_end, borrowed_at__gte=start, borrowed_at__lt=end, expected_return_at__lt=start,
+        )),
+    }
+
+
+def category_copies():
+    return dict(Book.objects.values_list('category_id').annotate(n=Sum('total_copies')).order_by())
+
+
+def snapshot_day(day, copies=None):
+    """Write all DailyCirculation rows for `day`; the rows of the day before must exist (or none at all).
+    `copies` is category_copies(), computed once when a run writes many days."""
+    previous = {
+        row['object_id']: row for row in
+        DailyCirculation.objects.filter(date=day - timedelta(days=1), scope=BOOK)
+        .values('object_id', 'active_loans', 'overdue')
+    }
+    delta = day_delta(day)
+
+    books = {}
+    for book_id in set(previous).union(*delta.values()):
+        before = previous.get(book_id, {})
+        row = {
+            'borrows': delta['borrows'][book_id],
+            'returns': delta['returns'][book_id],
+            'reviews': delta['reviews'][book_id],
+            # clamped so a borrow returned before it started (bad data) can't push a count below zero
+            'active_loans': max(0, before.get('active_loans', 0) + delta['borrows'][book_id] - delta['returns'][book_id]),
+            'overdue': max(0, before.get('overdue', 0) - delta['overdue_returned'][book_id]
+                           + delta['became_overdue'][book_id]),
+        }
+        if any(row.values()):
+            books[book_id] = row
+
+    rows = []
+    categories, authors = {}, {}
+    for ids in _chunks(books):
+        for book_id, category_id, author_id, book_copies in (
+            Book.objects.filter(id__in=ids).values_list('id', 'category_id', 'author_id', 'total_copies')
+        ):
+            row = books[book_id]
+            rows.append(DailyCirculation(date=day, scope=BOOK, object_id=book_id, total_copies=book_copies, **row))
+            for totals, key in ((categories, category_id), (authors, author_id)):
+                target = totals.setdefault(key, Counter())
+                target.update(row)
+
+    copies = category_copies() if copies is None else copies
+    author_copies = {}
+    for ids in _chunks(authors):
+        author_copies.update(
+            Book.objects.filter(author_id__in=ids).values_list('author_id').annotate(n=Sum('total_copies')).order_by()
+        )
+    rows += [DailyCirculation(date=day, scope=CATEGORY, object_id=key, total_copies=copies.get(key, 0),
+                              **{f: totals[f] for f in COUNTERS}) for key, totals in categories.items()]
+    rows += [DailyCirculation(date=day, scope=AUTHOR, object_id=key, total_copies=author_copies.get(key, 0),
+                              **{f: totals[f] for f in COUNTERS}) for key, totals in authors.items()]
+    library = Counter()
+    for row in books.values():
+        library.update(row)
+    rows.append(DailyCirculation(date=day, scope=LIBRARY, object_id=0, total_copies=sum(copies.values()),
+                                 **{f: library[f] for f in COUNTERS}))
+
+    with transaction.atomic():
+        DailyCirculation.objects.filter(date=day).delete()
+        DailyCirculation.objects.bulk_create(rows, batch_size=CHUNK)
+    return len(rows)
+
+
+def last_snapshot_date():
+    return DailyCirculation.objects.filter(scope=LIBRARY).aggregate(last=Max('date'))['last']
+
+
+def build(until=None, rebuild=False, progress=None):
+    """Snapshot every complete day after the last snapshot, up to `until` (default yesterday).
+    Returns the number of days written."""
+    until = until or timezone.localdate() - timedelta(days=1)
+    if rebuild:
+        DailyCirculation.objects.all().delete()
+    last = last_snapshot_date()
+    if last is None:
+        first = Borrow.objects.aggregate(first=Min('borrowed_at'))['first']
+        if first is None:
+            return 0
+        day = timezone.localdate(first)
+    else:
+        day = last + timedelta(days=1)
+
+    written, copies = 0, category_copies()
+    while day <= until:
+        rows = snapshot_day(day, copies)
+        written += 1
+        if progress:
+            progress(f"{day}: {rows} rows")
+        day += timedelta(days=1)
+    return written
+
+
+# reading side: the staff report (views.circulation_report) only ever queries DailyCirculation
+
+NAMED_SCOPES = {CATEGORY: (Category, 'name'), AUTHOR: (Author, 'name'), BOOK: (Book, 'title')}
+
+
+def report_range(days):
+    last = last_snapshot_date()
+    if last is None:
+        return None, None
+    return last - timedelta(days=days - 1), last
+
+
+def top(scope, first, last, limit=10):
+    rows = list(
+        DailyCirculation.objects.filter(scope=scope, date__gte=first, date__lte=last)
+        .values('object_id').annotate(borrows=Sum('borrows'), reviews=Sum('reviews'))
+        .filter(borrows__gt=0).order_by('-borrows', 'object_id')[:limit]
+    )
+    names = name_lookup(scope, [row['object_id'] for row in rows])
+    for row in rows:
+        row['name'] = names.get(row['object_id'], f"#{row['object_id']}")
+    return rows
+
+
+def name_lookup(scope, ids):
+    model, field = NAMED_SCOPES[scope]
+    return dict(model.objects.filter(id__in=ids).values_list('id', field))
+
+
+def export_rows(scope, first, last):
+    """CSV rows (header first) for one scope over a date range, streamed in date order."""
+    yield ['date', 'scope', 'object_id', 'name', *COUNTERS, 'total_copies', 'utilisation']
+    rows = (DailyCirculation.objects.filter(scope=scope, date__gte=first, date__lte=last)
+            .order_by('date', 'object_id').iterator(chunk_size=CHUNK))
+    while True:
+        batch = list(_take(rows, CHUNK))
+        if not batch:
+            break
+        names = name_lookup(scope, {row.object_id for row in batch}) if scope in NAMED_SCOPES else {}
+        for row in batch:
+            yield [row.date, row.scope, row.object_id, names.get(row.object_id, ''),
+                   *(getattr(row, f) for f in COUNTERS), row.total_copies, f"{row.utilisation:.4f}"]
+
+
+def _take(iterator, n):
+    for _, row in zip(range(n), iterator):
+        yield row
@@ -0,0 +1,215 @@
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Func, Lookup, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import BookSearchFTS, BookSearchVector
+
+SEARCH_TABLE = 'library_book_search'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return _TOKEN_RE.findall(query.lower())[:16]
+
+
+def is_ranked(qs):
+    """True when a backend's filter() added a search_rank column to order by."""
+    return 'search_rank' in qs.query.annotations
+
+
+class Match(Lookup):
+    # fts__document__match='...': FTS5 MATCH on the hidden table-named column
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+class TSMatch(Lookup):
+    # tsv__document__tsquery='a & b:*': tsvector @@ to_tsquery(config, ...)
+    lookup_name = 'tsquery'
+    config = 'simple'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} @@ to_tsquery('{self.config}', {rhs})", [*lhs_params, *rhs_params]
+
+
+BookSearchFTS._meta.get_field('document').register_lookup(Match)
+BookSearchVector._meta.get_field('document').register_lookup(TSMatch)
+
+
+class SearchBackend:
+    """Fallback for databases without a full-text engine: unranked LIKE search."""
+
+    def filter(self, qs, query):
+        return qs.filter(
+            Q(title__icontains=query) | Q(author__name__icontains=query)
+            | Q(category__name__icontains=query)
+        )
+
+    def index_books(self, book_ids):
+        pass
+
+    def index_author(self, author_id):
+        pass
+
+    def index_category(self, category_id):
+        pass
+
+    def remove_books(self, book_ids):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def _run(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def _book_where(self, column, values):
+        placeholders = ', '.join(['%s'] * len(values))
+        return f"b.{column} IN ({placeholders})", list(values)
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    # bm25 column weights: title, author, category, description
+    WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+    SELECT_DOCS = (
+        "SELECT b.id, b.title, a.name, c.name, b.description "
+        "FROM library_book b "
+        "JOIN library_author a ON a.id = b.author_id "
+        "JOIN library_category c ON c.id = b.category_id"
+    )
+
+    def _match(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        terms = [f'"{t}"' for t in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def filter(self, qs, query):
+        match = self._match(query)
+        if match is None:
+            return super().filter(qs, query)
+        # join the FTS table: a correlated bm25() subquery would re-run MATCH for every matching row.
+        # bm25() is lower for better matches, so it is negated to sort like the other backends
+        bm25 = Func(F('fts__document'), *map(Value, self.WEIGHTS), function='bm25', output_field=FloatField())
+        return qs.filter(fts__document__match=match).annotate(search_rank=-bm25)
+
+    def _reindex(self, column, values):
+        where, params = self._book_where(column, values)
+        self._run(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT b.id FROM library_book b WHERE {where})",
+            params,
+        )
+        self._run(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, author, category, description) "
+            f"{self.SELECT_DOCS} WHERE {where}",
+            params,
+        )
+
+    def index_books(self, book_ids):
+        if book_ids:
+            self._reindex('id', book_ids)
+
+    def index_author(self, author_id):
+        self._reindex('author_id', [author_id])
+
+    def index_category(self, category_id):
+        self._reindex('category_id', [category_id])
+
+    def remove_books(self, book_ids):
+        if book_ids:
+            placeholders = ', '.join(['%s'] * len(book_ids))
+            self._run(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", list(book_ids))
+
+    def rebuild(self):
+        self._run(f"DELETE FROM {SEARCH_TABLE}")
+        count = self._run(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, author, category, description) {self.SELECT_DOCS}"
+        )
+        self._run(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        return count
+
+
+class PostgresBackend(SearchBackend):
+    CONFIG = 'simple'
+
+    DOCUMENT = (
+        "setweight(to_tsvector('{cfg}', coalesce(b.title, '')), 'A') || "
+        "setweight(to_tsvector('{cfg}', coalesce(a.name, '')), 'B') || "
+        "setweight(to_tsvector('{cfg}', coalesce(c.name, '')), 'C') || "
+        "setweight(to_tsvector('{cfg}', coalesce(b.description, '')), 'D')"
+    ).format(cfg=CONFIG)
+
+    SELECT_DOCS = (
+        f"SELECT b.id, {DOCUMENT} "
+        "FROM library_book b "
+        "JOIN library_author a ON a.id = b.author_id "
+        "JOIN library_category c ON c.id = b.category_id"
+    )
+
+    def _tsquery(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        tokens[-1] += ':*'
+        return ' & '.join(tokens)
+
+    def filter(self, qs, query):
+        tsquery = self._tsquery(query)
+        if tsquery is None:
+            return super().filter(qs, query)
+        rank = Func(F('tsv__document'), RawSQL(f"to_tsquery('{self.CONFIG}', %s)", [tsquery]),
+                    function='ts_rank', output_field=FloatField())
+        return qs.filter(tsv__document__tsquery=tsquery).annotate(search_rank=rank)
+
+    def _reindex(self, column, values):
+        where, params = self._book_where(column, values)
+        self._run(
+            f"INSERT INTO {SEARCH_TABLE} (book_id, document) {self.SELECT_DOCS} WHERE {where} "
+            "ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document",
+            params,
+        )
+
+    def index_books(self, book_ids):
+        if book_ids:
+            self._reindex('id', book_ids)
+
+    def index_author(self, author_id):
+        self._reindex('author_id', [author_id])
+
+    def index_category(self, category_id):
+        self._reindex('category_id', [category_id])
+
+    def remove_books(self, book_ids):
+        if book_ids:
+            placeholders = ', '.join(['%s'] * len(book_ids))
+            self._run(f"DELETE FROM {SEARCH_TABLE} WHERE book_id IN ({placeholders})", list(book_ids))
+
+    def rebuild(self):
+        self._run(f"TRUNCATE {SEARCH_TABLE}")
+        count = self._run(f"INSERT INTO {SEARCH_TABLE} (book_id, document) {self.SELECT_DOCS}")
+        self._run(f"ANALYZE {SEARCH_TABLE}")
+        return count
+
+
+_BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgresBackend,
+}
+
+
+def get_backend():
+    return _BACKENDS.get(connection.vendor, SearchBackend)()
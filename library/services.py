@@ -0,0 +1,350 @@
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest, Least, Now
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from core.cache import touch_on_commit
+
+from .models import Author, Book, BookRecommendation, Borrow, BorrowNotification, Category, Hold
+
+MAX_BORROW_LIMIT = 5
+BORROW_DAYS = 14
+MAX_HOLDS = 5
+HOLD_PICKUP_DAYS = 3
+RECOMMENDATIONS_SHOWN = 6
+BORROW_STATE_TTL = 60 * 60
+
+
+class BorrowError(Exception):
+    pass
+
+
+class BookUnavailable(BorrowError):
+    pass
+
+
+class AlreadyBorrowed(BorrowError):
+    pass
+
+
+class BorrowLimitReached(BorrowError):
+    pass
+
+
+class BookAvailable(BorrowError):
+    pass
+
+
+class HoldExists(BorrowError):
+    pass
+
+
+class HoldLimitReached(BorrowError):
+    pass
+
+
+@dataclass(frozen=True)
+class BorrowState:
+    active_ids: frozenset
+    returned_ids: frozenset
+
+    @property
+    def active_count(self):
+        return len(self.active_ids)
+
+
+def apply_book_count_delta(author_id, category_id, books=0, available=0):
+    """Adjust the materialized book_count / available_book_count of one author and one category."""
+    if not (books or available):
+        return
+    changes = {'updated_at': Now()}
+    if books:
+        changes['book_count'] = Greatest(F('book_count') + books, 0)
+    if available:
+        changes['available_book_count'] = Greatest(F('available_book_count') + available, 0)
+    Author.objects.filter(pk=author_id).update(**changes)
+    Category.objects.filter(pk=category_id).update(**changes)
+
+
+def _book_placement(book_id):
+    # author, category and copies left, read right after the copy UPDATE in the same transaction
+    return Book.objects.filter(pk=book_id).values_list('author_id', 'category_id', 'available_copies').first()
+
+
+def _borrow_state_key(user_id):
+    return f'borrow_state:{user_id}'
+
+
+def load_borrow_state(user_id):
+    rows = (
+        Borrow.objects.filter(user_id=user_id)
+        .values('book_id')
+        .annotate(
+            active=Count('id', filter=Q(returned_at__isnull=True)),
+            returned=Count('id', filter=Q(returned_at__isnull=False)),
+        )
+        .order_by()
+    )
+    active, returned = set(), set()
+    for row in rows:
+        if row['active']:
+            active.add(row['book_id'])
+        if row['returned']:
+            returned.add(row['book_id'])
+    return BorrowState(frozenset(active), frozenset(returned))
+
+
+def get_borrow_state(request):
+    """Active/returned book ids of the logged-in user: memoised on the request, cached across requests."""
+    state = getattr(request, '_borrow_state', None)
+    if state is None:
+        key = _borrow_state_key(request.user.pk)
+        state = cache.get(key)
+        if state is None:
+            state = load_borrow_state(request.user.pk)
+            cache.set(key, state, BORROW_STATE_TTL)
+        request._borrow_state = state
+    return state
+
+
+def invalidate_borrow_state(user_id):
+    transaction.on_commit(lambda: cache.delete(_borrow_state_key(user_id)))
+
+
+@transaction.atomic
+def borrow_book(user, book_id):
+    # row lock on the user serialises one student's concurrent borrows, so the limit
+    # check below can't be raced (no-op on SQLite, which serialises writers anyway)
+    User.objects.select_for_update().filter(pk=user.pk).values_list('pk').first()
+
+    counts = Borrow.objects.filter(user=user, returned_at__isnull=True).aggregate(
+        active=Count('id'),
+        this_book=Count('id', filter=Q(book_id=book_id)),
+    )
+    if counts['this_book']:
+        raise AlreadyBorrowed
+    if counts['active'] >= MAX_BORROW_LIMIT:
+        raise BorrowLimitReached
+
+    # a copy set aside for this user's hold is already off the shelf
+    picked_up = Hold.objects.filter(
+        user=user, book_id=book_id, status=Hold.READY, expires_at__gt=timezone.now()
+    ).update(status=Hold.FULFILLED)
+    if not picked_up:
+        _take_from_shelf(book_id)
+        Hold.objects.filter(user=user, book_id=book_id, status=Hold.WAITING).update(status=Hold.FULFILLED)
+
+    return Borrow.objects.create(
+        user=user, book_id=book_id, expected_return_at=timezone.now() + timedelta(days=BORROW_DAYS)
+    )
+
+
+def _take_from_shelf(book_id):
+    # the copy is taken by a single conditional UPDATE; concurrent borrowers can't overbook
+    taken = Book.objects.filter(pk=book_id, available_copies__gt=0).update(
+        available_copies=F('available_copies') - 1, updated_at=Now(),
+    )
+    if not taken:
+        if not Book.objects.filter(pk=book_id).exists():
+            raise Http404("No Book matches the given query.")
+        raise BookUnavailable
+    author_id, category_id, left = _book_placement(book_id)
+    if left == 0:
+        apply_book_count_delta(author_id, category_id, available=-1)
+    touch_on_commit('library.book')
+
+
+def _release_copy(book_id):
+    """A copy came back: set it aside for the oldest waiting hold, or put it back on the shelf."""
+    # the book row lock orders simultaneous returns of this title, and place_hold(), one after another
+    Book.objects.select_for_update().filter(pk=book_id).values_list('pk').first()
+
+    hold = Hold.objects.filter(book_id=book_id, status=Hold.WAITING).order_by('id').only('id', 'user_id').first()
+    if hold is not None:
+        now = timezone.now()
+        Hold.objects.filter(pk=hold.pk, status=Hold.WAITING).update(
+            status=Hold.READY, ready_at=now, expires_at=now + timedelta(days=HOLD_PICKUP_DAYS),
+        )
+        # picked up by the notify_due_borrows worker, which emails the holder
+        BorrowNotification.objects.create(hold_id=hold.pk, user_id=hold.user_id, kind=BorrowNotification.HOLD_READY)
+        return hold
+
+    released = Book.objects.filter(pk=book_id, available_copies__lt=F('total_copies')).update(
+        available_copies=F('available_copies') + 1, updated_at=Now(),
+    )
+    if released:
+        author_id, category_id, left = _book_placement(book_id)
+        if left == 1:
+            apply_book_count_delta(author_id, category_id, available=1)
+        touch_on_commit('library.book')
+    return None
+
+
+@transaction.atomic
+def return_borrow(user, borrow_id):
+    borrow = get_object_or_404(
+        Borrow.objects.select_for_update().only('id', 'book_id'),
+        pk=borrow_id, user=user, returned_at__isnull=True,
+    )
+    # conditional on returned_at so a double submit can only release the copy once
+    if not Borrow.objects.filter(pk=borrow.pk, returned_at__isnull=True).update(returned_at=timezone.now()):
+        raise Http404("No Borrow matches the given query.")
+
+    _release_copy(borrow.book_id)
+    invalidate_borrow_state(user.pk)
+    return borrow
+
+
+@transaction.atomic
+def return_borrows(borrows, now=None):
+    """Bulk return (admin action) of the open borrows in `borrows`. Returns how many were closed.
+
+    One UPDATE closes them all and one UPDATE per distinct copy count puts the copies back.
+    Titles with a waiting hold go through _release_copy() per copy, so the queue is served in order.
+    """
+    now = now or timezone.now()
+    # re-selected by pk: the admin's queryset may be DISTINCT (search), which can't take FOR UPDATE
+    borrows = Borrow.objects.filter(pk__in=borrows.values('pk'), returned_at__isnull=True)
+    rows = list(borrows.select_for_update().order_by('pk').values_list('id', 'book_id', 'user_id'))
+    if not rows:
+        return 0
+    borrows.update(returned_at=now)
+
+    per_book = Counter(book_id for _, book_id, _ in rows)
+    # same lock order as _release_copy(): books first, so place_hold() can't queue in between
+    emptied = {
+        pk: (author_id, category_id) for pk, author_id, category_id, left in
+        Book.objects.select_for_update().filter(pk__in=per_book).order_by('pk')
+        .values_list('pk', 'author_id', 'category_id', 'available_copies') if left == 0
+    }
+    queued = Hold.objects.filter(book_id__in=per_book, status=Hold.WAITING).values_list('book_id', flat=True)
+    for book_id in set(queued):
+        emptied.pop(book_id, None)
+        for _ in range(per_book.pop(book_id)):
+            _release_copy(book_id)
+
+    by_copies = defaultdict(list)
+    for book_id, n in per_book.items():
+        by_copies[n].append(book_id)
+    for n, book_ids in by_copies.items():
+        Book.objects.filter(pk__in=book_ids).update(
+            available_copies=Least(F('available_copies') + n, F('total_copies')), updated_at=Now(),
+        )
+    restocked = Book.objects.filter(pk__in=[pk for pk in emptied if pk in per_book], available_copies__gt=0)
+    for pk in restocked.values_list('pk', flat=True):
+        apply_book_count_delta(*emptied[pk], available=1)
+    touch_on_commit('library.book')
+    for user_id in {user_id for _, _, user_id in rows}:
+        invalidate_borrow_state(user_id)
+    return len(rows)
+
+
+@transaction.atomic
+def extend_borrows(borrows, days=BORROW_DAYS):
+    """Push the due date of the open borrows in `borrows` back by `days`, in one UPDATE.
+
+    Their due-soon notices, and overdue ones that no longer hold, are dropped so that
+    notifications.scan() queues fresh ones for the new due date.
+    """
+    ids = list(borrows.filter(returned_at__isnull=True).values_list('id', flat=True))
+    extended = Borrow.objects.filter(pk__in=ids).update(
+        expected_return_at=F('expected_return_at') + timedelta(days=days)
+    )
+    BorrowNotification.objects.filter(borrow_id__in=ids).filter(
+        Q(kind=BorrowNotification.DUE_SOON)
+        | Q(kind=BorrowNotification.OVERDUE, borrow__expected_return_at__gt=timezone.now())
+    ).delete()
+    return extended
+
+
+@transaction.atomic
+def place_hold(user, book_id):
+    User.objects.select_for_update().filter(pk=user.pk).values_list('pk').first()
+    # same lock as _release_copy(): a copy can't go back on the shelf while we decide to queue
+    book = get_object_or_404(Book.objects.select_for_update().only('id', 'available_copies'), pk=book_id)
+    if book.available_copies > 0:
+        raise BookAvailable
+    if Borrow.objects.filter(user=user, book_id=book_id, returned_at__isnull=True).exists():
+        raise AlreadyBorrowed
+
+    active = list(Hold.objects.filter(user=user, status__in=Hold.ACTIVE).values_list('book_id', flat=True))
+    if book_id in active:
+        raise HoldExists
+    if len(active) >= MAX_HOLDS:
+        raise HoldLimitReached
+    return Hold.objects.create(user=user, book_id=book_id)
+
+
+@transaction.atomic
+def cancel_hold(user, hold_id):
+    hold = get_object_or_404(
+        Hold.objects.select_for_update().only('id', 'book_id', 'status'),
+        pk=hold_id, user=user, status__in=Hold.ACTIVE,
+    )
+    Hold.objects.filter(pk=hold.pk).update(status=Hold.CANCELLED)
+    if hold.status == Hold.READY:
+        _release_copy(hold.book_id)  # the copy set aside for us goes to the next in line
+    return hold
+
+
+def recommended_books(book_id):
+    # precomputed by `build_recommendations`; one range scan on the (book, rank) unique index
+    return (BookRecommendation.objects.filter(book_id=book_id)
+            .select_related('neighbour__author').order_by('rank')[:RECOMMENDATIONS_SHOWN])
+
+
+def active_holds(user):
+    """The user's waiting/ready holds, each annotated with `ahead`: waiting holds queued before it."""
+    ahead = (
+        Hold.objects.filter(book=OuterRef('book'), status=Hold.WAITING, id__lt=OuterRef('id'))
+        .order_by().values('book').annotate(n=Count('id')).values('n')
+    )
+    return Hold.objects.filter(user=user, status__in=Hold.ACTIVE).annotate(ahead=Coalesce(Subquery(ahead), 0))
+
+
+def expire_holds(now=None, batch_size=500):
+    """Close ready holds whose pickup window has passed and pass each copy on. Returns how many expired."""
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        rows = list(
+            Hold.objects.filter(status=Hold.READY, expires_at__lte=now)
+            .order_by('expires_at', 'id').values_list('id', 'book_id')[:batch_size]
+        )
+        if not rows:
+            break
+        for hold_id, book_id in rows:
+            with transaction.atomic():
+                if Hold.objects.filter(pk=hold_id, status=Hold.READY).update(status=Hold.EXPIRED):
+                    _release_copy(book_id)
+                    expired += 1
+    return expired
+
+
+def promote_waiting_holds():
+    """Hand shelf copies to waiting holds, e.g. after an admin raised total_copies. Returns holds made ready."""
+    promoted = 0
+    book_ids = (
+        Hold.objects.filter(status=Hold.WAITING, book__available_copies__gt=0)
+        .values_list('book_id', flat=True).distinct()
+    )
+    for book_id in list(book_ids):
+        while True:
+            with transaction.atomic():
+                if not Hold.objects.filter(book_id=book_id, status=Hold.WAITING).exists():
+                    break
+                try:
+                    _take_from_shelf(book_id)
+                except BookUnavailable:
+                    break
+                _release_copy(book_id)
+                promoted += 1
+    return promoted
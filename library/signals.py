@@ -0,0 +1,162 @@
+from django.contrib.auth.models import User
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import touch_on_commit
+
+from .models import Author, Book, Borrow, Category, Review
+from . import images
+from .search import get_backend
+from .services import apply_book_count_delta, invalidate_borrow_state
+
+BOOK_SEARCH_FIELDS = {'title', 'description', 'author', 'author_id', 'category', 'category_id'}
+BOOK_COUNT_FIELDS = {'author', 'author_id', 'category', 'category_id', 'available_copies'}
+
+
+def apply_rating_delta(book_id, stars, count):
+    # single UPDATE; every SET expression reads the pre-update row, so avg matches the new sum/count
+    new_sum = F('rating_sum') + stars
+    new_count = F('rating_count') + count
+    Book.objects.filter(pk=book_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        avg_rating=Coalesce(
+            Cast(new_sum, FloatField()) / NullIf(new_count, 0),
+            0.0,
+            output_field=FloatField(),
+        ),
+        updated_at=Now(),
+    )
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('book_id', 'stars').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        apply_rating_delta(instance.book_id, instance.stars, 1)
+        return
+
+    old_book_id, old_stars = previous
+    if old_book_id != instance.book_id:
+        apply_rating_delta(old_book_id, -old_stars, -1)
+        apply_rating_delta(instance.book_id, instance.stars, 1)
+    else:
+        # even a comment-only edit changes the book page, so its updated_at moves too
+        apply_rating_delta(instance.book_id, instance.stars - old_stars, 0)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    apply_rating_delta(instance.book_id, -instance.stars, -1)
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, BOOK_SEARCH_FIELDS):
+        get_backend().index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    get_backend().remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def reindex_author_books(sender, instance, created, update_fields=None, **kwargs):
+    if not created and _touches(update_fields, {'name'}):
+        get_backend().index_author(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_books(sender, instance, created, update_fields=None, **kwargs):
+    if not created and _touches(update_fields, {'name'}):
+        get_backend().index_category(instance.pk)
+
+
+@receiver(pre_save, sender=Book)
+def remember_book_placement(sender, instance, update_fields=None, **kwargs):
+    instance._previous_placement = None
+    if instance.pk and _touches(update_fields, BOOK_COUNT_FIELDS):
+        instance._previous_placement = (
+            Book.objects.filter(pk=instance.pk).values_list('author_id', 'category_id', 'available_copies').first()
+        )
+
+
+@receiver(post_save, sender=Book)
+def update_book_counts_on_save(sender, instance, created, **kwargs):
+    available = int(instance.available_copies > 0)
+    if created:
+        apply_book_count_delta(instance.author_id, instance.category_id, 1, available)
+        return
+    previous = getattr(instance, '_previous_placement', None)
+    if previous is None:
+        return
+
+    old_author_id, old_category_id, old_copies = previous
+    was_available = int(old_copies > 0)
+    if (old_author_id, old_category_id) != (instance.author_id, instance.category_id):
+        apply_book_count_delta(old_author_id, old_category_id, -1, -was_available)
+        apply_book_count_delta(instance.author_id, instance.category_id, 1, available)
+    elif was_available != available:
+        apply_book_count_delta(instance.author_id, instance.category_id, available=available - was_available)
+
+
+@receiver(post_delete, sender=Book)
+def update_book_counts_on_delete(sender, instance, **kwargs):
+    apply_book_count_delta(instance.author_id, instance.category_id, -1, -int(instance.available_copies > 0))
+
+
+@receiver(post_save, sender=Borrow)
+@receiver(post_delete, sender=Borrow)
+def reset_borrow_state(sender, instance, **kwargs):
+    # return_borrow() updates via queryset and invalidates on its own
+    invalidate_borrow_state(instance.user_id)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def touch_catalog_version(sender, **kwargs):
+    names = {sender._meta.label_lower}
+    if sender is Review:
+        names.add('library.book')  # the book's rating aggregates changed too
+    if sender in (Author, Category):
+        names.add('library.book')  # books embed author/category names
+    touch_on_commit(*names)
+
+
+@receiver(post_save, sender=User)
+def touch_reviewer_version(sender, instance, created, update_fields=None, **kwargs):
+    # book pages and the reviews API show usernames; a login only writes last_login
+    if not created and update_fields != frozenset({'last_login'}):
+        touch_on_commit('auth.user')
+
+
+@receiver(post_save, sender=Book)
+def build_cover_thumbnails(sender, instance, **kwargs):
+    images.schedule(instance, 'cover')
+
+
+@receiver(post_save, sender=Author)
+def build_author_thumbnails(sender, instance, **kwargs):
+    images.schedule(instance, 'photo')
@@ -1,4 +1,8 @@
 from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+
+from library import cards, images
 
 register = template.Library()
 
@@ -6,3 +10,30 @@ register = template.Library()
 def book_status(book):
     # returns tuple-like string key, template will style it
     return "available" if book.is_available else "borrowed"
+
+
+@register.simple_tag
+def book_cards(books, variant):
+    # cached per book, see library.cards; variants: catalog, category, author, home
+    return cards.render_cards(books, variant)
+
+
+@register.inclusion_tag('library/_responsive_img.html')
+def responsive_img(obj, field_name, fallback, css_class='', sizes='100vw', alt=''):
+    # generated thumbnails (WebP + JPEG srcset) when available, otherwise the static fallback;
+    # a fallback ending in '/' is a directory of per-id images ('images/books/' -> images/books/<id>.jpg)
+    field_file = getattr(obj, field_name)
+    thumbs = getattr(obj, f'{field_name}_thumbs', None) or {}
+    fallback_url = static(fallback) + f'{obj.pk}.jpg' if fallback.endswith('/') else static(fallback)
+    ctx = {'css_class': css_class, 'sizes': sizes, 'alt': alt, 'fallback': fallback_url}
+    if field_file and thumbs.get('source') == field_file.name and thumbs.get('widths'):
+        ctx.update({
+            'webp_srcset': images.srcset(field_file, thumbs, 'webp'),
+            'jpeg_srcset': images.srcset(field_file, thumbs, 'jpg') + (
+                f", {field_file.url} {thumbs['width']}w" if thumbs['width'] > thumbs['widths'][-1] else ''
+            ),
+            'src': default_storage.url(
+                images.derivative_name(field_file.name, thumbs['hash'], thumbs['widths'][-1], 'jpg')
+            ),
+        })
+    return ctx
@@ -1,3 +1,951 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import Http404
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import profiling
+from core.profiling import QueryBudgetExceeded
+
+from . import cards, notifications, recommendations, reports, search, services
+from .models import (
+    Author, Book, BookRecommendation, Borrow, BorrowNotification, Category, DailyCirculation, Hold, Review,
+)
+
+LOCMEM = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'library-tests-{alias}'}
+    for alias in ('default', 'fragments')
+}
+
+
+def create_catalog(books=12, copies=2):
+    author = Author.objects.create(name='Ursula K. Le Guin', bio='')
+    other = Author.objects.create(name='Italo Calvino', bio='')
+    fiction = Category.objects.create(name='Fiction')
+    essays = Category.objects.create(name='Essays')
+    return [
+        Book.objects.create(
+            title=f'Book {i:02d}', author=(author, other)[i % 2], category=(fiction, essays)[i % 2],
+            publication_year=1950 + i, pages=100 + i, language='English', description=f'Story number {i}',
+            total_copies=copies, available_copies=copies,
+        )
+        for i in range(books)
+    ]
+
+
+@override_settings(CACHES=LOCMEM)
+class ImportCatalogTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def run_import(self, name, content, **options):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_malformed_lines_are_counted_not_fatal(self):
+        out, err = self.run_import('books.jsonl', (
+            '{"title": "Dune", "author": "Frank Herbert", "category": "Fiction"}\n'
+            '{not json\n'
+            '{"title": "Emma", "author": "Jane Austen", "category": "Fiction", "total_copies": 2}\n'
+        ))
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ['Dune', 'Emma'])
+        self.assertIn('line 2: malformed', err)
+        self.assertIn('1 malformed lines', out)
+        self.assertEqual(Category.objects.get(name='Fiction').book_count, 2)
+
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            call_command('import_catalog', os.path.join(self.dir, 'missing.csv'), stdout=io.StringIO())
+
+    def test_upsert_keeps_copies_on_loan(self):
+        book = Book.objects.create(
+            title='Dune', author=Author.objects.create(name='Frank Herbert'),
+            category=Category.objects.create(name='Fiction'), publication_year=1965, pages=412,
+            language='English', description='', total_copies=3, available_copies=1,
+        )
+        header = 'id,title,author,category,total_copies,available_copies\n'
+        self.run_import('up.csv', header + f'{book.id},Dune,Frank Herbert,Fiction,5,5\n')
+        book.refresh_from_db()
+        self.assertEqual((book.total_copies, book.available_copies), (5, 3))
+
+        out, err = self.run_import('down.csv', header + f'{book.id},Dune,Frank Herbert,Fiction,1,1\n')
+        book.refresh_from_db()
+        self.assertEqual((book.total_copies, book.available_copies), (5, 3))
+        self.assertIn('below the 2 copies on loan', err)
+        self.assertIn('1 skipped', out)
+
+    def test_progress_still_reported_after_skipped_rows(self):
+        book = Book.objects.create(
+            title='Dune', author=Author.objects.create(name='A'), category=Category.objects.create(name='C'),
+            publication_year=1965, pages=412, language='English', description='',
+            total_copies=1, available_copies=0,
+        )
+        # the first batch loses its upsert (a copy is out), so done never lands on a multiple of the step
+        rows = [f'{{"id": {book.id}, "title": "Dune", "author": "A", "category": "C", "total_copies": 0}}\n']
+        rows += [f'{{"title": "Book {i}", "author": "A", "category": "C"}}\n' for i in range(90)]
+        out, err = self.run_import('many.jsonl', ''.join(rows), batch_size=2)
+        progress = [line.split()[0] for line in err.splitlines() if line.endswith('rows/s')]
+        self.assertEqual(progress, ['41', '81'])
+
+
+@override_settings(CACHES=LOCMEM, PROFILING_ENABLED=True, QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+    # the profiling middleware raises QueryBudgetExceeded once a view goes over QUERY_BUDGETS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = create_catalog()
+        cls.user = User.objects.create_user('reader', password='secret-pass-123')
+        readers = [User.objects.create_user(f'critic{i}') for i in range(3)]
+        for book in cls.books[:4]:
+            for stars, reader in enumerate(readers, start=3):
+                Review.objects.create(user=reader, book=book, stars=stars, comment='Good')
+
+    def setUp(self):
+        cache.clear()
+
+    def assertWithinBudget(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_books_within_budget(self):
+        for sort in ('newest', 'oldest', 'rated'):
+            self.assertWithinBudget(f"{reverse('books')}?sort={sort}")
+        self.assertWithinBudget(f"{reverse('books')}?q=story")
+        self.assertWithinBudget(f"{reverse('books')}?category={self.books[0].category_id}")
+
+    def test_book_detail_within_budget(self):
+        self.assertWithinBudget(reverse('book_detail', args=[self.books[0].id]))
+        self.client.force_login(self.user)
+        self.assertWithinBudget(reverse('book_detail', args=[self.books[0].id]))
+        self.assertWithinBudget(reverse('books'))
+
+    def test_profile_records_queries_and_page_render(self):
+        response = self.assertWithinBudget(reverse('books'))
+        record = profiling.buffer.snapshot()[-1]
+        self.assertEqual(record['view'], 'books')
+        self.assertEqual(int(response['X-Query-Count']), record['queries'])
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['render_ms'], 0)
+
+    async def test_profiles_under_asgi(self):
+        response = await self.async_client.get(reverse('book_detail', args=[self.books[0].id]))
+        self.assertEqual(response.status_code, 200)
+        record = profiling.buffer.snapshot()[-1]
+        self.assertEqual(record['view'], 'book_detail')
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(int(response['X-Query-Count']), record['queries'])
+
+    def test_over_budget_fails(self):
+        with override_settings(QUERY_BUDGETS={'books': 1, 'book_detail': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('books'))
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('book_detail', args=[self.books[0].id]))
+
+
+@override_settings(CACHES=LOCMEM)
+class CatalogPageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = create_catalog()
+        cls.book = cls.books[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_home(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.books[-1].title)
+
+    def test_books_sorts(self):
+        expected = {
+            'newest': self.books[-1].title,
+            'oldest': self.books[0].title,
+            'rated': self.books[-1].title,  # no reviews: ties broken by newest id
+        }
+        for sort, first in expected.items():
+            response = self.client.get(reverse('books'), {'sort': sort})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['sort'], sort)
+            self.assertEqual(response.context['page_obj'].object_list[0].title, first)
+
+    def test_books_search_and_category(self):
+        response = self.client.get(reverse('books'), {'q': 'Book 03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.books[3], response.context['page_obj'].object_list)
+
+        response = self.client.get(reverse('books'), {'category': self.book.category_id})
+        self.assertEqual({b.category_id for b in response.context['page_obj'].object_list}, {self.book.category_id})
+
+    def test_books_pages_through_cursor(self):
+        first = self.client.get(reverse('books')).context['page_obj']
+        self.assertTrue(first.has_next)
+        second = self.client.get(reverse('books'), {'cursor': first.next_cursor}).context['page_obj']
+        seen = [b.id for b in first.object_list] + [b.id for b in second.object_list]
+        self.assertEqual(sorted(seen), sorted(b.id for b in self.books))
+
+    def test_book_detail(self):
+        response = self.client.get(reverse('book_detail', args=[self.book.id]))
+        self.assertContains(response, self.book.title)
+        self.assertEqual(self.client.get(reverse('book_detail', args=[0])).status_code, 404)
+
+    def test_book_detail_not_modified(self):
+        url = reverse('book_detail', args=[self.book.id])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+        Book.objects.filter(pk=self.book.pk).update(title='Renamed', updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 200)
+
+    def test_book_detail_follows_reviewer_names(self):
+        critic = User.objects.create_user('critic')
+        critic.profile.full_name = ''  # the page falls back to the username
+        critic.profile.save()
+        Review.objects.create(user=critic, book=self.book, stars=5)
+        url = reverse('book_detail', args=[self.book.id])
+        first = self.client.get(url)
+        self.assertContains(first, 'critic')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            critic.username = 'renamed_critic'
+            critic.save()
+        response = self.client.get(url, headers={'if-none-match': first['ETag']})
+        self.assertContains(response, 'renamed_critic')
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            critic.profile.full_name = 'Anne Critic'
+            critic.profile.save()
+        response = self.client.get(url, headers={'if-none-match': response['ETag']})
+        self.assertContains(response, 'Anne Critic')
+
+    def test_categories_and_authors(self):
+        response = self.client.get(reverse('categories'))
+        self.assertContains(response, 'Fiction')
+        response = self.client.get(reverse('authors'))
+        self.assertContains(response, 'Italo Calvino')
+        response = self.client.get(reverse('category_books', args=[self.book.category_id]))
+        self.assertContains(response, self.book.title)
+        response = self.client.get(reverse('author_detail', args=[self.book.author_id]))
+        self.assertContains(response, self.book.author.name)
+
+
+@override_settings(CACHES=LOCMEM)
+class CirculationViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, cls.last_copy = create_catalog(books=2, copies=1)
+        cls.user = User.objects.create_user('reader', password='secret-pass-123')
+        cls.other = User.objects.create_user('other', password='secret-pass-123')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_my_books_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('my_books'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+    def test_borrow_and_return(self):
+        response = self.client.post(reverse('borrow_book', args=[self.book.id]))
+        self.assertRedirects(response, reverse('my_books'))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+        response = self.client.get(reverse('my_books'))
+        self.assertContains(response, self.book.title)
+        borrow = response.context['active'].get()
+
+        response = self.client.post(reverse('return_book', args=[borrow.id]))
+        self.assertRedirects(response, reverse('my_books'))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+        self.assertEqual(list(self.client.get(reverse('my_books')).context['history']), [borrow])
+
+        # returning twice must not put a second copy back
+        self.assertEqual(self.client.post(reverse('return_book', args=[borrow.id])).status_code, 404)
+
+    def test_borrow_unavailable_book(self):
+        services.borrow_book(self.other, self.book.id)
+        response = self.client.post(reverse('borrow_book', args=[self.book.id]))
+        self.assertRedirects(response, reverse('book_detail', args=[self.book.id]))
+        self.assertFalse(Borrow.objects.filter(user=self.user).exists())
+
+    def test_hold_and_cancel(self):
+        self.client.post(reverse('borrow_book', args=[self.book.id]))  # available: no hold needed
+        response = self.client.post(reverse('place_hold', args=[self.last_copy.id]))
+        self.assertEqual(Hold.objects.filter(user=self.user).count(), 0)
+        self.assertRedirects(response, reverse('book_detail', args=[self.last_copy.id]))
+
+        services.borrow_book(self.other, self.last_copy.id)
+        self.client.post(reverse('place_hold', args=[self.last_copy.id]))
+        hold = Hold.objects.get(user=self.user)
+        self.assertEqual(hold.status, Hold.WAITING)
+        self.assertContains(self.client.get(reverse('my_books')), self.last_copy.title)
+
+        self.assertRedirects(self.client.post(reverse('cancel_hold', args=[hold.id])), reverse('my_books'))
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, Hold.CANCELLED)
+
+
+@override_settings(CACHES=LOCMEM)
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = create_catalog(books=5)
+        cls.book = cls.books[0]
+        cls.user = User.objects.create_user('critic')
+        Review.objects.create(user=cls.user, book=cls.book, stars=4, comment='Fine')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_book_list(self):
+        data = self.client.get(reverse('api_books'), {'limit': 2}).json()
+        self.assertEqual([b['id'] for b in data['results']], [b.id for b in self.books[:-3:-1]])
+        rest = self.client.get(reverse('api_books'), {'limit': 10, 'cursor': data['next']}).json()
+        self.assertEqual(len(rest['results']), 3)
+
+        data = self.client.get(reverse('api_books'), {'sort': 'rated', 'fields': 'id,avg_rating'}).json()
+        self.assertEqual(data['results'][0], {'id': self.book.id, 'avg_rating': 4.0})
+
+    def test_book_list_bad_request(self):
+        self.assertEqual(self.client.get(reverse('api_books'), {'fields': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_books'), {'limit': 'x'}).status_code, 400)
+
+    def test_book_item(self):
+        data = self.client.get(reverse('api_book', args=[self.book.id])).json()
+        self.assertEqual((data['title'], data['author']), (self.book.title, self.book.author.name))
+        self.assertEqual(self.client.get(reverse('api_book', args=[0])).status_code, 404)
+
+    def test_book_reviews(self):
+        data = self.client.get(reverse('api_book_reviews', args=[self.book.id])).json()
+        self.assertEqual([(r['user'], r['stars']) for r in data['results']], [('critic', 4)])
+        self.assertEqual(self.client.get(reverse('api_book_reviews', args=[0])).status_code, 404)
+
+    def test_book_reviews_follow_username_changes(self):
+        url = reverse('api_book_reviews', args=[self.book.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).get().save()
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 200)
+
+    def test_authors_and_categories(self):
+        names = [a['name'] for a in self.client.get(reverse('api_authors')).json()['results']]
+        self.assertEqual(names, ['Italo Calvino', 'Ursula K. Le Guin'])
+        author = self.client.get(reverse('api_author', args=[self.book.author_id])).json()
+        self.assertEqual(author['name'], self.book.author.name)
+        self.assertEqual(self.client.get(reverse('api_author', args=[0])).status_code, 404)
+        names = [c['name'] for c in self.client.get(reverse('api_categories')).json()['results']]
+        self.assertEqual(names, ['Essays', 'Fiction'])
+
+    def test_not_modified_until_a_book_changes(self):
+        url = reverse('api_books')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM)
+class CirculationServiceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, = create_catalog(books=1, copies=2)
+        cls.readers = [User.objects.create_user(f'reader{i}') for i in range(4)]
+
+    def copies(self):
+        self.book.refresh_from_db()
+        return self.book.available_copies
+
+    def test_available_copies_stay_in_range(self):
+        first = services.borrow_book(self.readers[0], self.book.id)
+        services.borrow_book(self.readers[1], self.book.id)
+        self.assertEqual(self.copies(), 0)
+        self.assertEqual(Category.objects.get(pk=self.book.category_id).available_book_count, 0)
+        with self.assertRaises(services.BookUnavailable):
+            services.borrow_book(self.readers[2], self.book.id)
+        with self.assertRaises(services.AlreadyBorrowed):
+            services.borrow_book(self.readers[0], self.book.id)
+        self.assertEqual(self.copies(), 0)
+
+        services.return_borrow(self.readers[0], first.id)
+        self.assertEqual(self.copies(), 1)
+        with self.assertRaises(Http404):
+            services.return_borrow(self.readers[0], first.id)
+        self.assertEqual(self.copies(), 1)
+        self.assertEqual(Category.objects.get(pk=self.book.category_id).available_book_count, 1)
+
+    def test_bulk_return_caps_at_total(self):
+        for reader in self.readers[:2]:
+            services.borrow_book(reader, self.book.id)
+        Book.objects.filter(pk=self.book.pk).update(available_copies=1)  # drifted: one copy already counted
+        self.assertEqual(services.return_borrows(Borrow.objects.all()), 2)
+        self.assertEqual(self.copies(), self.book.total_copies)
+
+    def test_holds_are_served_in_order(self):
+        with self.assertRaises(services.BookAvailable):
+            services.place_hold(self.readers[2], self.book.id)
+        borrows = [services.borrow_book(reader, self.book.id) for reader in self.readers[:2]]
+        second, third = (services.place_hold(reader, self.book.id) for reader in self.readers[2:])
+
+        services.return_borrow(self.readers[0], borrows[0].id)
+        self.assertEqual(self.copies(), 0)  # set aside for the oldest hold, not shelved
+        statuses = dict(Hold.objects.values_list('id', 'status'))
+        self.assertEqual((statuses[second.id], statuses[third.id]), (Hold.READY, Hold.WAITING))
+
+        # the first in line lets it go: the copy moves to the next hold
+        services.cancel_hold(self.readers[2], second.id)
+        self.assertEqual(Hold.objects.get(pk=third.id).status, Hold.READY)
+        self.assertEqual(self.copies(), 0)
+
+        services.borrow_book(self.readers[3], self.book.id)
+        self.assertEqual(Hold.objects.get(pk=third.id).status, Hold.FULFILLED)
+        services.return_borrow(self.readers[1], borrows[1].id)
+        self.assertEqual(self.copies(), 1)
+
+
+@override_settings(CACHES=LOCMEM, BORROW_DUE_SOON_DAYS=2)
+class NotificationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, cls.other = create_catalog(books=2, copies=5)
+        cls.readers = [User.objects.create_user(f'reader{i}', email=f'reader{i}@example.com') for i in range(4)]
+
+    def borrow(self, reader, due_in, book=None):
+        borrow = services.borrow_book(reader, (book or self.book).id)
+        Borrow.objects.filter(pk=borrow.pk).update(expected_return_at=timezone.now() + due_in)
+        return borrow
+
+    def queued(self, kind):
+        return set(BorrowNotification.objects.filter(kind=kind).values_list('borrow_id', flat=True))
+
+    def test_due_soon_behind_the_cursor_is_queued(self):
+        first = self.borrow(self.readers[0], timedelta(days=1))
+        self.assertEqual(notifications.scan(notifications.DUE_SOON), 1)
+        # due before the last scan's window ended, but borrowed after it ran
+        second = self.borrow(self.readers[1], timedelta(days=1))
+        self.assertEqual(notifications.scan(notifications.DUE_SOON), 1)
+        self.assertEqual(notifications.scan(notifications.DUE_SOON), 0)
+        self.assertEqual(self.queued(notifications.DUE_SOON), {first.id, second.id})
+
+    def test_overdue_is_queued_once(self):
+        late = self.borrow(self.readers[0], -timedelta(days=1))
+        self.borrow(self.readers[1], timedelta(days=5))
+        self.assertEqual(notifications.scan(notifications.OVERDUE), 1)
+        self.assertEqual(notifications.scan(notifications.DUE_SOON), 0)  # overdue, not due soon
+        self.assertEqual(notifications.scan(notifications.OVERDUE), 0)
+        self.assertEqual(self.queued(notifications.OVERDUE), {late.id})
+
+    def test_extension_gets_fresh_notices(self):
+        late = self.borrow(self.readers[0], -timedelta(days=1))
+        still_late = self.borrow(self.readers[1], -timedelta(days=20))
+        notifications.scan(notifications.OVERDUE)
+        self.assertEqual(services.extend_borrows(Borrow.objects.filter(pk__in=[late.id, still_late.id])), 2)
+        # the extension moved `late` past now; `still_late` is overdue either way and keeps its notice
+        self.assertEqual(self.queued(notifications.OVERDUE), {still_late.id})
+
+        later = timezone.now() + timedelta(days=12)
+        self.assertEqual(notifications.scan(notifications.DUE_SOON, now=later), 1)
+        self.assertEqual(notifications.scan(notifications.OVERDUE, now=later + timedelta(days=2)), 1)
+        self.assertEqual(self.queued(notifications.OVERDUE), {late.id, still_late.id})
+
+    def test_send_pending_emails_each_user_once(self):
+        self.borrow(self.readers[0], -timedelta(days=1))
+        self.borrow(self.readers[1], timedelta(days=1))
+        self.borrow(self.readers[1], -timedelta(days=3), book=self.other)
+        returned = self.borrow(self.readers[2], timedelta(days=1))
+        User.objects.filter(pk=self.readers[3].pk).update(email='')
+        self.borrow(self.readers[3], timedelta(days=1))
+        notifications.scan(notifications.OVERDUE)
+        notifications.scan(notifications.DUE_SOON)
+        services.return_borrow(self.readers[2], returned.id)
+
+        # batch_size=2 splits reader1's two notices across batches; they still go out together
+        self.assertEqual(notifications.send_pending(batch_size=2), (3, 0, 2))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['reader0@example.com', 'reader1@example.com'])
+        self.assertTrue(all(m.subject == 'Overdue library books' for m in mail.outbox))
+        self.assertEqual(dict(BorrowNotification.objects.filter(user=self.readers[3]).values_list('kind', 'last_error')),
+                         {notifications.DUE_SOON: 'user has no email address'})
+        self.assertFalse(BorrowNotification.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(notifications.send_pending(), (0, 0, 0))
+
+    def test_failed_sends_stay_queued(self):
+        self.borrow(self.readers[0], -timedelta(days=1))
+        notifications.scan(notifications.OVERDUE)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            self.assertEqual(notifications.send_pending(), (0, 1, 0))
+        notice = BorrowNotification.objects.get()
+        self.assertEqual((notice.sent_at, notice.attempts, notice.last_error), (None, 1, 'down'))
+
+        self.assertEqual(notifications.send_pending(), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+
+@override_settings(CACHES=LOCMEM)
+class RatingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, cls.other = create_catalog(books=2)
+        cls.readers = [User.objects.create_user(f'critic{i}') for i in range(3)]
+
+    def ratings(self, book):
+        book.refresh_from_db()
+        return book.rating_sum, book.rating_count, book.avg_rating
+
+    def test_review_changes_move_the_aggregates(self):
+        first = Review.objects.create(user=self.readers[0], book=self.book, stars=4)
+        Review.objects.create(user=self.readers[1], book=self.book, stars=2)
+        self.assertEqual(self.ratings(self.book), (6, 2, 3.0))
+
+        first.stars = 5
+        first.save()
+        self.assertEqual(self.ratings(self.book), (7, 2, 3.5))
+
+        first.book = self.other
+        first.save()
+        self.assertEqual(self.ratings(self.book), (2, 1, 2.0))
+        self.assertEqual(self.ratings(self.other), (5, 1, 5.0))
+
+        first.delete()
+        self.assertEqual(self.ratings(self.other), (0, 0, 0.0))
+
+    def test_rebuild_ratings_fixes_drift(self):
+        for stars, reader in enumerate(self.readers, start=3):
+            Review.objects.create(user=reader, book=self.book, stars=stars)
+        Book.objects.filter(pk=self.book.pk).update(rating_sum=1, rating_count=1, avg_rating=1.0)
+
+        out = io.StringIO()
+        call_command('rebuild_ratings', check=True, stdout=out)
+        self.assertIn('Checked 2 books, 1 out of sync.', out.getvalue())
+        self.assertEqual(self.ratings(self.book), (1, 1, 1.0))
+
+        out = io.StringIO()
+        call_command('rebuild_ratings', batch_size=1, stdout=out)
+        self.assertIn('fixed 1', out.getvalue())
+        self.assertEqual(self.ratings(self.book), (12, 3, 4.0))
+        self.assertEqual(self.ratings(self.other), (0, 0, 0.0))
+
+
+@override_settings(CACHES=LOCMEM)
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = create_catalog(books=4)
+
+    def search(self, query):
+        return list(search.get_backend().filter(Book.objects.all(), query).values_list('title', flat=True))
+
+    def test_index_follows_book_changes(self):
+        book = self.books[0]
+        self.assertEqual(self.search('zanzibar'), [])
+        book.title = 'Zanzibar Nights'
+        book.save()
+        self.assertEqual(self.search('zanzib'), ['Zanzibar Nights'])
+
+        author = book.author
+        author.name = 'Octavia Butler'
+        author.save()
+        self.assertEqual(sorted(self.search('butler')), ['Book 02', 'Zanzibar Nights'])
+
+        book.delete()
+        self.assertEqual(self.search('zanzibar'), [])
+        self.assertEqual(self.search('butler'), ['Book 02'])
+
+    def test_title_outranks_description(self):
+        self.books[1].description = 'A lighthouse keeper'
+        self.books[1].save()
+        self.books[2].title = 'The Lighthouse'
+        self.books[2].save()
+        qs = search.get_backend().filter(Book.objects.all(), 'lighthouse')
+        self.assertTrue(search.is_ranked(qs))
+        self.assertEqual(list(qs.order_by('-search_rank').values_list('title', flat=True)),
+                         ['The Lighthouse', 'Book 01'])
+
+    def test_like_fallback(self):
+        qs = search.SearchBackend().filter(Book.objects.all(), 'le guin')
+        self.assertFalse(search.is_ranked(qs))
+        self.assertEqual(qs.count(), 2)
+        # a query with no searchable words falls back as well, instead of an FTS syntax error
+        self.assertEqual(self.search('"*'), [])
+
+
+@override_settings(CACHES=LOCMEM)
+class BorrowStateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = create_catalog(books=3)
+        cls.user = User.objects.create_user('reader')
+
+    def setUp(self):
+        cache.clear()
+
+    def state(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return services.get_borrow_state(request)
+
+    def test_cached_across_requests_and_memoised_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(1):
+            services.get_borrow_state(request)
+            services.get_borrow_state(request)
+        with self.assertNumQueries(0):
+            self.state()
+
+    def test_borrow_and_returns_invalidate(self):
+        self.assertEqual(self.state().active_ids, frozenset())
+        with self.captureOnCommitCallbacks(execute=True):
+            first = services.borrow_book(self.user, self.books[0].id)
+            services.borrow_book(self.user, self.books[1].id)
+        self.assertEqual(self.state().active_ids, {self.books[0].id, self.books[1].id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.return_borrow(self.user, first.id)
+        state = self.state()
+        self.assertEqual((state.active_ids, state.returned_ids), ({self.books[1].id}, {self.books[0].id}))
+
+        # the admin's bulk return goes through a queryset UPDATE, with no Borrow signals
+        with self.captureOnCommitCallbacks(execute=True):
+            services.return_borrows(Borrow.objects.filter(user=self.user))
+        state = self.state()
+        self.assertEqual((state.active_ids, state.returned_ids), (frozenset(), {self.books[0].id, self.books[1].id}))
+
+    def test_invalidated_only_after_commit(self):
+        self.state()
+        with self.captureOnCommitCallbacks() as callbacks:
+            services.borrow_book(self.user, self.books[2].id)
+        self.assertEqual(self.state().active_ids, frozenset())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.state().active_ids, {self.books[2].id})
+
+
+@override_settings(CACHES=LOCMEM)
+class BookCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = create_catalog(books=4, copies=1)  # two books per author and per category
+        cls.le_guin, cls.calvino = cls.books[0].author, cls.books[1].author
+        cls.fiction, cls.essays = cls.books[0].category, cls.books[1].category
+        cls.user = User.objects.create_user('reader')
+
+    def counts(self, *objs):
+        return [type(obj).objects.values_list('book_count', 'available_book_count').get(pk=obj.pk) for obj in objs]
+
+    def test_counts_follow_book_changes(self):
+        self.assertEqual(self.counts(self.le_guin, self.fiction), [(2, 2), (2, 2)])
+        borrow = services.borrow_book(self.user, self.books[0].id)
+        self.assertEqual(self.counts(self.le_guin, self.fiction), [(2, 1), (2, 1)])
+
+        moved = self.books[2]
+        moved.author, moved.category = self.calvino, self.essays
+        moved.save()
+        self.assertEqual(self.counts(self.le_guin, self.calvino), [(1, 0), (3, 3)])
+        self.assertEqual(self.counts(self.fiction, self.essays), [(1, 0), (3, 3)])
+
+        self.books[1].delete()
+        self.assertEqual(self.counts(self.calvino, self.essays), [(2, 2), (2, 2)])
+        services.return_borrow(self.user, borrow.id)
+        self.assertEqual(self.counts(self.le_guin, self.fiction), [(1, 1), (1, 1)])
+
+    def test_rebuild_book_counts_fixes_drift(self):
+        Category.objects.filter(pk=self.fiction.pk).update(book_count=9, available_book_count=0)
+        Author.objects.update(book_count=0)
+
+        out = io.StringIO()
+        call_command('rebuild_book_counts', check=True, stdout=out)
+        self.assertIn('Checked 2 categories, 1 out of sync.', out.getvalue())
+        self.assertIn('Checked 2 authors, 2 out of sync.', out.getvalue())
+
+        call_command('rebuild_book_counts', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(self.counts(self.fiction, self.essays, self.le_guin, self.calvino), [(2, 2)] * 4)
+
+
+@override_settings(CACHES=LOCMEM)
+class HoldTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = create_catalog(books=services.MAX_HOLDS + 1, copies=1)
+        cls.book = cls.books[0]
+        cls.lender = User.objects.create_user('lender')
+        cls.readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+
+    def setUp(self):
+        # every copy out with someone who isn't queueing
+        Book.objects.update(available_copies=0)
+
+    def statuses(self, *holds):
+        status = dict(Hold.objects.values_list('id', 'status'))
+        return [status[hold.id] for hold in holds]
+
+    def test_place_hold_guards(self):
+        services.place_hold(self.readers[0], self.book.id)
+        with self.assertRaises(services.HoldExists):
+            services.place_hold(self.readers[0], self.book.id)
+        for book in self.books[1:services.MAX_HOLDS]:
+            services.place_hold(self.readers[0], book.id)
+        with self.assertRaises(services.HoldLimitReached):
+            services.place_hold(self.readers[0], self.books[-1].id)
+
+        Book.objects.filter(pk=self.book.pk).update(available_copies=1)
+        services.borrow_book(self.readers[1], self.book.id)
+        with self.assertRaises(services.AlreadyBorrowed):
+            services.place_hold(self.readers[1], self.book.id)
+
+    def test_expired_pickup_passes_the_copy_on_in_order(self):
+        first, second, third = (services.place_hold(reader, self.book.id) for reader in self.readers)
+        services._release_copy(self.book.id)
+        self.assertEqual(self.statuses(first, second, third), [Hold.READY, Hold.WAITING, Hold.WAITING])
+        self.assertTrue(BorrowNotification.objects.filter(hold=first, kind=BorrowNotification.HOLD_READY).exists())
+
+        Hold.objects.filter(pk=first.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(services.expire_holds(), 1)
+        self.assertEqual(self.statuses(first, second, third), [Hold.EXPIRED, Hold.READY, Hold.WAITING])
+        self.assertEqual(services.expire_holds(), 0)  # second's pickup window has just started
+
+        services.cancel_hold(self.readers[2], third.id)
+        Hold.objects.filter(pk=second.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(services.expire_holds(), 1)
+        # nobody left in line: the copy goes back on the shelf
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+    def test_promote_waiting_holds(self):
+        first, second = (services.place_hold(reader, self.book.id) for reader in self.readers[:2])
+        Book.objects.filter(pk=self.book.pk).update(total_copies=2, available_copies=1)  # a copy was added
+        self.assertEqual(services.promote_waiting_holds(), 1)
+        self.assertEqual(self.statuses(first, second), [Hold.READY, Hold.WAITING])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+
+@override_settings(CACHES=LOCMEM)
+class BookCardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog(books=3)
+
+    def setUp(self):
+        caches['fragments'].clear()
+        self.books = list(Book.objects.select_related('author', 'category').order_by('id'))
+
+    def key(self, book, variant='catalog'):
+        return cards.card_key(cards.card_context(book, variant), variant)
+
+    def test_key_follows_what_the_card_shows(self):
+        book = self.books[0]
+        keys = {variant: self.key(book, variant) for variant in cards.VARIANTS}
+        book.description = 'Not shown on any card'
+        self.assertEqual({variant: self.key(book, variant) for variant in cards.VARIANTS}, keys)
+
+        book.available_copies = 0  # the badge flips where there is one
+        self.assertNotEqual(self.key(book), keys['catalog'])
+        self.assertEqual(self.key(book, 'home'), keys['home'])
+        book.available_copies = 2
+
+        book.author.name = 'U. K. Le Guin'  # the author page's cards don't name the author
+        self.assertEqual(self.key(book, 'author'), keys['author'])
+        self.assertNotEqual(self.key(book, 'category'), keys['category'])
+
+    def test_renders_only_the_misses(self):
+        with mock.patch.object(cards, 'render_to_string', wraps=cards.render_to_string) as render:
+            first = cards.render_cards(self.books, 'catalog')
+            self.assertEqual(render.call_count, 3)
+            self.assertEqual(cards.render_cards(self.books, 'catalog'), first)
+            self.assertEqual(render.call_count, 3)
+
+            self.books[1].title = 'Renamed'
+            self.assertIn('Renamed', cards.render_cards(self.books, 'catalog'))
+            self.assertEqual(render.call_count, 4)
+
+
+@override_settings(CACHES=LOCMEM)
+class RecommendationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a, cls.b, cls.c, cls.d, cls.e, cls.f = create_catalog(books=6)
+        cls.readers = [User.objects.create_user(f'reader{i}') for i in range(6)]
+        histories = [(cls.a, cls.b, cls.c), (cls.a, cls.b), (cls.a, cls.b, cls.d), (cls.c, cls.d),
+                     (cls.e, cls.f), (cls.e, cls.f)]
+        for reader, books in zip(cls.readers, histories):
+            for book in books:
+                cls.lend(reader, book)
+
+    @staticmethod
+    def lend(reader, book):
+        Borrow.objects.create(user=reader, book=book, expected_return_at=timezone.now())
+
+    def neighbours(self, book):
+        return [(n, round(s, 3)) for n, s in
+                BookRecommendation.objects.filter(book=book).order_by('rank').values_list('neighbour_id', 'score')]
+
+    def test_full_then_incremental(self):
+        run = recommendations.build()  # the first run is always full
+        self.assertEqual((run.full, run.books, run.pairs), (True, 6, 14))
+        # only pairs with two shared readers count
+        self.assertEqual(self.neighbours(self.a), [(self.b.id, 1.0)])
+        self.assertEqual(self.neighbours(self.e), [(self.f.id, 1.0)])
+        self.assertEqual(self.neighbours(self.c), [])
+        self.assertIsNone(recommendations.build())
+
+        # reader3 (c, d) borrows a: a, c and d are recomputed, b keeps its list until a full run
+        self.lend(self.readers[3], self.a)
+        run = recommendations.build()
+        self.assertEqual((run.full, run.books), (False, 3))
+        self.assertEqual(self.neighbours(self.a), [(self.b.id, 0.866), (self.c.id, 0.707), (self.d.id, 0.707)])
+        self.assertEqual(self.neighbours(self.b), [(self.a.id, 1.0)])
+
+        self.assertTrue(recommendations.build(full=True).full)
+        self.assertEqual(self.neighbours(self.b), [(self.a.id, 0.866)])
+
+    def test_blocks_do_not_change_the_result(self):
+        books = (self.a, self.b, self.c, self.d, self.e, self.f)
+        recommendations.build(full=True)
+        expected = [self.neighbours(book) for book in books]
+        recommendations.build(full=True, max_pairs=1)  # one book per block, counted densely
+        self.assertEqual([self.neighbours(book) for book in books], expected)
+
+
+@override_settings(CACHES=LOCMEM)
+class CirculationReportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a, cls.b = create_catalog(books=2)
+        first, second = User.objects.create_user('reader0'), User.objects.create_user('reader1')
+        cls.day = timezone.localdate() - timedelta(days=5)
+        cls.lend(first, cls.a, (0, 10), due=(1, 12), returned=(2, 9))  # overdue for a day
+        cls.lend(second, cls.a, (0, 11), due=(14, 12))
+        cls.lend(first, cls.b, (1, 10), due=(15, 10), returned=(1, 15))
+        review = Review.objects.create(user=second, book=cls.b, stars=4)
+        Review.objects.filter(pk=review.pk).update(created_at=cls.at((1, 16)))
+
+    @classmethod
+    def at(cls, day_hour):
+        day, hour = day_hour
+        return reports.day_bounds(cls.day + timedelta(days=day))[0] + timedelta(hours=hour)
+
+    @classmethod
+    def lend(cls, user, book, borrowed, due, returned=None):
+        borrow = Borrow.objects.create(user=user, book=book, expected_return_at=cls.at(due))
+        Borrow.objects.filter(pk=borrow.pk).update(
+            borrowed_at=cls.at(borrowed), returned_at=returned and cls.at(returned),
+        )
+
+    def totals(self, scope, object_id=0):
+        return list(DailyCirculation.objects.filter(scope=scope, object_id=object_id).order_by('date')
+                    .values_list(*reports.COUNTERS))
+
+    def test_daily_totals(self):
+        self.assertEqual(reports.build(until=self.day + timedelta(days=2)), 3)
+        # borrows, returns, reviews, active_loans, overdue
+        self.assertEqual(self.totals(reports.LIBRARY), [(2, 0, 0, 2, 0), (1, 1, 1, 2, 1), (0, 1, 0, 1, 0)])
+        self.assertEqual(self.totals(reports.BOOK, self.a.id), [(2, 0, 0, 2, 0), (0, 0, 0, 2, 1), (0, 1, 0, 1, 0)])
+        self.assertEqual(self.totals(reports.CATEGORY, self.b.category_id), [(1, 1, 1, 0, 0)])
+        self.assertEqual(self.totals(reports.AUTHOR, self.a.author_id), self.totals(reports.BOOK, self.a.id))
+        self.assertEqual(DailyCirculation.objects.get(scope=reports.LIBRARY, date=self.day).total_copies, 4)
+
+    def test_incremental_matches_rebuild(self):
+        reports.build(until=self.day)
+        self.assertEqual(reports.build(until=self.day), 0)
+        self.assertEqual(reports.build(until=self.day + timedelta(days=2)), 2)
+        incremental = self.totals(reports.LIBRARY)
+        self.assertEqual(reports.build(until=self.day + timedelta(days=2), rebuild=True), 3)
+        self.assertEqual(self.totals(reports.LIBRARY), incremental)
+
+
+@override_settings(CACHES=LOCMEM)
+class BorrowAdminActionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, cls.queued = create_catalog(books=2, copies=2)
+        cls.readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def act(self, action, borrows):
+        return self.client.post(reverse('admin:library_borrow_changelist'), {
+            'action': action, '_selected_action': [borrow.pk for borrow in borrows],
+        }, follow=True)
+
+    def test_mark_returned(self):
+        borrows = [services.borrow_book(reader, book.id) for reader in self.readers[:2]
+                   for book in (self.book, self.queued)]
+        hold = services.place_hold(self.readers[2], self.queued.id)
+        services.return_borrow(self.readers[0], borrows[0].id)
+
+        response = self.act('mark_returned', borrows)
+        self.assertContains(response, '3 borrow(s) marked as returned.')
+        self.assertFalse(Borrow.objects.filter(returned_at__isnull=True).exists())
+        self.book.refresh_from_db()
+        self.queued.refresh_from_db()
+        # one copy of the queued title is set aside for the hold, the other goes on the shelf
+        self.assertEqual((self.book.available_copies, self.queued.available_copies), (2, 1))
+        self.assertEqual(Hold.objects.get(pk=hold.pk).status, Hold.READY)
+        self.assertEqual(Category.objects.get(pk=self.book.category_id).available_book_count, 1)
+
+    def test_extend_due_date(self):
+        open_borrow = services.borrow_book(self.readers[0], self.book.id)
+        returned = services.borrow_book(self.readers[1], self.book.id)
+        services.return_borrow(self.readers[1], returned.id)
+
+        response = self.act('extend_due_date', [open_borrow, returned])
+        self.assertContains(response, '1 open borrow(s) extended.')
+        extended, unchanged = (Borrow.objects.get(pk=b.pk).expected_return_at for b in (open_borrow, returned))
+        self.assertEqual(extended - open_borrow.expected_return_at, timedelta(days=services.BORROW_DAYS))
+        self.assertEqual(unchanged, returned.expected_return_at)
+
+
+@override_settings(CACHES=LOCMEM)
+class ConcurrentBorrowTests(TransactionTestCase):
+    # threads with their own connections: the copy UPDATE and row locks are what keep this exact
+
+    def test_no_copy_oversold(self):
+        create_catalog(books=1)
+        out = io.StringIO()
+        call_command('bench_borrows', borrowers=60, copies=5, mixed_ops=200, threads=8, stdout=out)
+        self.assertIn('rush         60', out.getvalue())
+        self.assertIn('ok 5', out.getvalue())
+        self.assertIn('copy accounting OK', out.getvalue())
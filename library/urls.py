@@ -1,21 +1,41 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
+
+# under ASGI (config/asgi.py) the read-heavy pages use their async versions
+if settings.ASYNC_VIEWS:
+    books_list, book_detail = views.abooks_list, views.abook_detail
+    categories_page, authors_page = views.acategories_page, views.aauthors_page
+else:
+    books_list, book_detail = views.books_list, views.book_detail
+    categories_page, authors_page = views.categories_page, views.authors_page
 
 urlpatterns = [
-    path('books/', views.books_list, name='books'),
-    path('book/<int:id>/', views.book_detail, name='book_detail'),
+    path('books/', books_list, name='books'),
+    path('book/<int:id>/', book_detail, name='book_detail'),
 
     path('borrow/<int:book_id>/', views.borrow_book, name='borrow_book'),
     path('my-books/', views.my_books, name='my_books'),
     path('return/<int:borrow_id>/', views.return_book, name='return_book'),
+    path('hold/<int:book_id>/', views.place_hold, name='place_hold'),
+    path('hold/<int:hold_id>/cancel/', views.cancel_hold, name='cancel_hold'),
 
     path('book/<int:id>/review/', views.add_review, name='add_review'),
 
-    path('categories/', views.categories_page, name='categories'),
+    path('categories/', categories_page, name='categories'),
     path('category/<int:id>/', views.category_books, name='category_books'),
 
-    path('authors/', views.authors_page, name='authors'),
+    path('authors/', authors_page, name='authors'),
     path('author/<int:id>/', views.author_detail, name='author_detail'),
 
     path('contact/', views.contact_page, name='contact'),
+
+    path('dashboard/circulation/', views.circulation_report, name='circulation_report'),
+
+    path('api/books/', api.book_list, name='api_books'),
+    path('api/books/<int:id>/', api.book_item, name='api_book'),
+    path('api/books/<int:id>/reviews/', api.book_reviews, name='api_book_reviews'),
+    path('api/authors/', api.author_list, name='api_authors'),
+    path('api/authors/<int:id>/', api.author_item, name='api_author'),
+    path('api/categories/', api.category_list, name='api_categories'),
 ]
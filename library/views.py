@@ -1,40 +1,93 @@
-from datetime import timedelta
+import csv
+import string
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.db.models import Count, Q, Avg
-from django.shortcuts import get_object_or_404, redirect, render
+from django.db.models import Subquery
+from django.http import StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
 from django.utils import timezone
 
+from core.conditional import conditional_page, latest
+
 from .forms import ReviewForm, ContactForm
-from .models import Book, Category, Author, Borrow, Review
+from . import reports, services
+from .models import Book, Category, Author, Borrow, DailyCirculation, RecommendationRun, Review
+from .pagination import KeysetPaginator
+from .search import get_backend as get_search_backend, is_ranked
 
-MAX_BORROW_LIMIT = 5
+MAX_BORROW_LIMIT = services.MAX_BORROW_LIMIT
+PAGE_SIZE = 9
+AUTHORS_PAGE_SIZE = 24
 
+KEYSET_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'rated': ('-avg_rating', '-id'),
+}
 
-def books_list(request):
+
+# conditional_page validators: the updated_at of everything each page shows, in one query
+
+def _catalog_changed(request):
+    return latest(Category.objects.all(), Book.objects.all(), Author.objects.all())
+
+
+def _book_changed(request, id):
+    # reviews move the book's rating (and updated_at); recommendations change with each build.
+    # Reviewer names come from auth.user / accounts.profile, versioned by table (see the views)
+    return Book.objects.filter(pk=id).values_list(
+        'updated_at', 'author__updated_at', 'category__updated_at',
+        Subquery(RecommendationRun.objects.order_by('-id').values('finished_at')[:1]),
+    ).first()
+
+
+def _categories_changed(request):
+    return latest(Category.objects.all())
+
+
+def _authors_changed(request):
+    return latest(Author.objects.all())
+
+
+def _category_changed(request, id):
+    return latest(Category.objects.filter(pk=id), Book.objects.filter(category_id=id), Author.objects.all())
+
+
+def _author_changed(request, id):
+    return latest(Author.objects.filter(pk=id), Book.objects.filter(author_id=id), Category.objects.all())
+
+
+def _books_query(request):
     qs = Book.objects.select_related('author', 'category').all()
 
     q = request.GET.get('q', '').strip()
     if q:
-        qs = qs.filter(Q(title__icontains=q) | Q(author__name__icontains=q))
+        qs = get_search_backend().filter(qs, q)
 
     cat = request.GET.get('category', '').strip()
     if cat:
         qs = qs.filter(category_id=cat)
 
-    sort = request.GET.get('sort', 'newest')
-    if sort == 'oldest':
-        qs = qs.order_by('created_at')
-    elif sort == 'rated':
-        qs = qs.annotate(avg_stars=Avg('reviews__stars')).order_by('-avg_stars', '-created_at')
-    else:
-        qs = qs.order_by('-created_at')
+    sort = request.GET.get('sort') or ('relevance' if q else 'newest')
+    if sort == 'relevance' and is_ranked(qs):
+        # ranked results are bounded by the search itself; plain page numbers are fine here
+        return qs.order_by('-search_rank', '-created_at'), q, cat, sort, None
+    if sort not in KEYSET_ORDERINGS:
+        sort = 'newest'
+    return qs, q, cat, sort, KeysetPaginator(qs, KEYSET_ORDERINGS[sort], PAGE_SIZE)
 
-    paginator = Paginator(qs, 9)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+
+@conditional_page(_catalog_changed)
+def books_list(request):
+    qs, q, cat, sort, paginator = _books_query(request)
+    if paginator is None:
+        page_obj = Paginator(qs, PAGE_SIZE).get_page(request.GET.get('page'))
+    else:
+        page_obj = paginator.get_page(request.GET.get('cursor'), with_count=True)
 
     categories = Category.objects.all()
 
@@ -47,6 +100,39 @@ def books_list(request):
     })
 
 
+@conditional_page(_catalog_changed)
+async def abooks_list(request):
+    qs, q, cat, sort, paginator = _books_query(request)
+    if paginator is None:
+        page = _anumbered_page(qs, request.GET.get('page'))
+    else:
+        page = paginator.aget_page(request.GET.get('cursor'), with_count=True)
+    request.user = await request.auser()
+    page_obj = await page
+    categories = await _alist(Category.objects.all())
+
+    return render(request, 'library/books.html', {
+        'page_obj': page_obj,
+        'categories': categories,
+        'q': q,
+        'cat': cat,
+        'sort': sort,
+    })
+
+
+async def _anumbered_page(qs, number):
+    paginator = Paginator(qs, PAGE_SIZE)
+    paginator.count = await qs.acount()
+    page = paginator.get_page(number)
+    page.object_list = await _alist(page.object_list)
+    return page
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+@conditional_page(_book_changed, tables=('auth.user',))
 def book_detail(request, id):
     book = get_object_or_404(Book.objects.select_related('author', 'category'), id=id)
     reviews = book.reviews.select_related('user', 'user__profile').order_by('-created_at')
@@ -55,15 +141,47 @@ def book_detail(request, id):
     can_borrow = False
     currently_borrowed_by_user = False
     borrowed_before = False
+    hold = None
+
+    if user.is_authenticated and not user.is_staff:
+        state = services.get_borrow_state(request)
+        currently_borrowed_by_user = book.id in state.active_ids
+        borrowed_before = book.id in state.returned_ids
+        can_borrow = book.is_available and (not currently_borrowed_by_user)
+        if not book.is_available and not currently_borrowed_by_user:
+            hold = services.active_holds(user).filter(book=book).first()
+
+    return render(request, 'library/book_detail.html', {
+        'book': book,
+        'reviews': reviews,
+        'can_borrow': can_borrow,
+        'currently_borrowed_by_user': currently_borrowed_by_user,
+        'borrowed_before': borrowed_before,
+        'hold': hold,
+        'recommendations': services.recommended_books(book.id),
+    })
+
+
+@conditional_page(_book_changed, tables=('auth.user',))
+async def abook_detail(request, id):
+    # awaited one by one: Django runs async ORM queries on its single shared sync thread,
+    # so gathering them would not overlap them
+    request.user = user = await request.auser()
+    book = await aget_object_or_404(Book.objects.select_related('author', 'category'), id=id)
+    reviews = await _alist(Review.objects.filter(book_id=id).select_related('user', 'user__profile').order_by('-created_at'))
+    recommendations = await _alist(services.recommended_books(id))
+    can_borrow = False
+    currently_borrowed_by_user = False
+    borrowed_before = False
+    hold = None
 
     if user.is_authenticated and not user.is_staff:
-        currently_borrowed_by_user = Borrow.objects.filter(
-            user=user, book=book, returned_at__isnull=True
-        ).exists()
-        borrowed_before = Borrow.objects.filter(
-            user=user, book=book, returned_at__isnull=False
-        ).exists()
+        state = await sync_to_async(services.get_borrow_state)(request)
+        currently_borrowed_by_user = book.id in state.active_ids
+        borrowed_before = book.id in state.returned_ids
         can_borrow = book.is_available and (not currently_borrowed_by_user)
+        if not book.is_available and not currently_borrowed_by_user:
+            hold = await services.active_holds(user).filter(book=book).afirst()
 
     return render(request, 'library/book_detail.html', {
         'book': book,
@@ -71,6 +189,8 @@ def book_detail(request, id):
         'can_borrow': can_borrow,
         'currently_borrowed_by_user': currently_borrowed_by_user,
         'borrowed_before': borrowed_before,
+        'hold': hold,
+        'recommendations': recommendations,
     })
 
 
@@ -80,27 +200,27 @@ def borrow_book(request, book_id):
         messages.error(request, "The admin does not borrow from the student interface.")
         return redirect('book_detail', id=book_id)
 
-    book = get_object_or_404(Book, id=book_id)
+    # fast rejections from the cached state; borrow_book() re-checks inside its transaction
+    state = services.get_borrow_state(request)
+    if book_id in state.active_ids:
+        messages.warning(request, "You are already a borrower of this book currently.")
+        return redirect('book_detail', id=book_id)
+    if state.active_count >= MAX_BORROW_LIMIT:
+        messages.error(request, f"You have reached your borrowing limit ({MAX_BORROW_LIMIT}).")
+        return redirect('my_books')
 
-    if not book.is_available:
+    try:
+        services.borrow_book(request.user, book_id)
+    except services.BookUnavailable:
         messages.error(request, "The book is currently not available.")
-        return redirect('book_detail', id=book.id)
-
-    if Borrow.objects.filter(user=request.user, book=book, returned_at__isnull=True).exists():
+        return redirect('book_detail', id=book_id)
+    except services.AlreadyBorrowed:
         messages.warning(request, "You are already a borrower of this book currently.")
-        return redirect('book_detail', id=book.id)
-
-    active_count = Borrow.objects.filter(user=request.user, returned_at__isnull=True).count()
-    if active_count >= MAX_BORROW_LIMIT:
+        return redirect('book_detail', id=book_id)
+    except services.BorrowLimitReached:
         messages.error(request, f"You have reached your borrowing limit ({MAX_BORROW_LIMIT}).")
         return redirect('my_books')
 
-    expected = timezone.now() + timedelta(days=14)
-    Borrow.objects.create(user=request.user, book=book, expected_return_at=expected)
-
-    book.available_copies -= 1
-    book.save()
-
     messages.success(request, "Borrowing completed successfully.")
     return redirect('my_books')
 
@@ -113,28 +233,57 @@ def my_books(request):
     borrows = Borrow.objects.filter(user=request.user).select_related('book').order_by('-borrowed_at')
     active = borrows.filter(returned_at__isnull=True)
     now = timezone.now()
+    holds = services.active_holds(request.user).select_related('book').order_by('id')
 
     return render(request, 'library/my_books.html', {
         'active': active,
         'history': borrows.filter(returned_at__isnull=False),
+        'holds': holds,
         'now': now
     })
 
 
 @login_required
 def return_book(request, borrow_id):
-    borrow = get_object_or_404(Borrow, id=borrow_id, user=request.user, returned_at__isnull=True)
-    borrow.returned_at = timezone.now()
-    borrow.save()
-
-    book = borrow.book
-    book.available_copies += 1
-    book.save()
+    services.return_borrow(request.user, borrow_id)
 
     messages.success(request, "The book has been returned.")
     return redirect('my_books')
 
 
+@login_required
+def place_hold(request, book_id):
+    if request.user.is_staff:
+        messages.error(request, "The admin does not borrow from the student interface.")
+        return redirect('book_detail', id=book_id)
+
+    try:
+        services.place_hold(request.user, book_id)
+    except services.BookAvailable:
+        messages.info(request, "A copy is available, you can borrow it now.")
+        return redirect('book_detail', id=book_id)
+    except services.AlreadyBorrowed:
+        messages.warning(request, "You are already a borrower of this book currently.")
+        return redirect('book_detail', id=book_id)
+    except services.HoldExists:
+        messages.warning(request, "You are already in the queue for this book.")
+        return redirect('book_detail', id=book_id)
+    except services.HoldLimitReached:
+        messages.error(request, f"You can hold at most {services.MAX_HOLDS} books.")
+        return redirect('my_books')
+
+    messages.success(request, "You are in the queue. We will email you when a copy is set aside for you.")
+    return redirect('book_detail', id=book_id)
+
+
+@login_required
+def cancel_hold(request, hold_id):
+    services.cancel_hold(request.user, hold_id)
+
+    messages.success(request, "Your hold has been cancelled.")
+    return redirect('my_books')
+
+
 @login_required
 def add_review(request, id):
     if request.user.is_staff:
@@ -142,8 +291,7 @@ def add_review(request, id):
 
     book = get_object_or_404(Book, id=id)
 
-    borrowed_before = Borrow.objects.filter(user=request.user, book=book, returned_at__isnull=False).exists()
-    if not borrowed_before:
+    if book.id not in services.get_borrow_state(request).returned_ids:
         messages.error(request, "You cannot evaluate a book that you have not previously borrowed.")
         return redirect('book_detail', id=book.id)
 
@@ -168,26 +316,55 @@ def add_review(request, id):
     return render(request, 'library/review_form.html', {'book': book, 'form': form})
 
 
+@conditional_page(_categories_changed, tables=('library.category',))
 def categories_page(request):
-    cats = Category.objects.annotate(book_count=Count('books')).order_by('name')
+    cats = Category.objects.order_by('name')
+    return render(request, 'library/categories.html', {'categories': cats})
+
+
+@conditional_page(_categories_changed, tables=('library.category',))
+async def acategories_page(request):
+    request.user = await request.auser()
+    cats = await _alist(Category.objects.order_by('name'))
     return render(request, 'library/categories.html', {'categories': cats})
 
 
+@conditional_page(_category_changed)
 def category_books(request, id):
     category = get_object_or_404(Category, id=id)
-    books = Book.objects.filter(category=category).select_related('author', 'category').order_by('-created_at')
-    return render(request, 'library/category_books.html', {'category': category, 'books': books})
+    books = Book.objects.filter(category=category).select_related('author', 'category')
+    page_obj = KeysetPaginator(books, KEYSET_ORDERINGS['newest'], PAGE_SIZE).get_page(request.GET.get('cursor'))
+    return render(request, 'library/category_books.html', {'category': category, 'books': page_obj, 'page_obj': page_obj})
 
 
+def _author_letters(paginator):
+    # each letter is a cursor sitting just before the first name that starts with it
+    return [(letter, paginator.encode({'name': letter, 'id': 0}, 'n')) for letter in string.ascii_uppercase]
+
+
+@conditional_page(_authors_changed, tables=('library.author',))
 def authors_page(request):
-    authors = Author.objects.annotate(book_count=Count('books')).order_by('name')
-    return render(request, 'library/authors.html', {'authors': authors})
+    paginator = KeysetPaginator(Author.objects.all(), ('name', 'id'), AUTHORS_PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    letters = _author_letters(paginator)
+    return render(request, 'library/authors.html', {'authors': page_obj, 'page_obj': page_obj, 'letters': letters})
+
 
+@conditional_page(_authors_changed, tables=('library.author',))
+async def aauthors_page(request):
+    paginator = KeysetPaginator(Author.objects.all(), ('name', 'id'), AUTHORS_PAGE_SIZE)
+    request.user = await request.auser()
+    page_obj = await paginator.aget_page(request.GET.get('cursor'))
+    letters = _author_letters(paginator)
+    return render(request, 'library/authors.html', {'authors': page_obj, 'page_obj': page_obj, 'letters': letters})
 
+
+@conditional_page(_author_changed)
 def author_detail(request, id):
     author = get_object_or_404(Author, id=id)
-    books = Book.objects.filter(author=author).select_related('category').order_by('-created_at')
-    return render(request, 'library/author_detail.html', {'author': author, 'books': books})
+    books = Book.objects.filter(author=author).select_related('category')
+    page_obj = KeysetPaginator(books, KEYSET_ORDERINGS['newest'], PAGE_SIZE).get_page(request.GET.get('cursor'))
+    return render(request, 'library/author_detail.html', {'author': author, 'books': page_obj, 'page_obj': page_obj})
 
 
 def contact_page(request):
@@ -199,4 +376,42 @@ def contact_page(request):
     else:
         form = ContactForm()
 
-    return render(request, 'library/contact.html', {'form': form})
\ No newline at end of file
+    return render(request, 'library/contact.html', {'form': form})
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+@staff_member_required
+def circulation_report(request):
+    # reads only the DailyCirculation snapshots written by `manage.py snapshot_circulation`
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 365)
+    except ValueError:
+        days = 30
+    first, last = reports.report_range(days)
+
+    scope = request.GET.get('export')
+    if scope in reports.NAMED_SCOPES or scope == reports.LIBRARY:
+        writer = csv.writer(_Echo())
+        rows = reports.export_rows(scope, first, last) if last else iter([])
+        response = StreamingHttpResponse((writer.writerow(row) for row in rows), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="circulation-{scope}-{first}-{last}.csv"'
+        return response
+
+    daily = []
+    if last:
+        daily = list(DailyCirculation.objects.filter(scope=reports.LIBRARY, date__gte=first, date__lte=last)
+                     .order_by('-date'))
+    return render(request, 'library/circulation_report.html', {
+        'days': days,
+        'first': first,
+        'last': last,
+        'latest': daily[0] if daily else None,
+        'daily': daily,
+        'totals': {f: sum(getattr(d, f) for d in daily) for f in ('borrows', 'returns', 'reviews')},
+        'top_lists': [(title, reports.top(scope, first, last) if last else []) for title, scope in (
+            ('Top categories', reports.CATEGORY), ('Top authors', reports.AUTHOR), ('Top books', reports.BOOK),
+        )],
+    })